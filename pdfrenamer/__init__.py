@@ -1,30 +1,121 @@
 """A simple utility to preview and rename documents."""
 
+import time
+
+# When this package started loading, for --startup-profile
+_load_started = time.time()
+
 import os
 import sys
+import threading
+
+
+# Export the PDFRenamer widget and our main function
+__all__ = ["PDFRenamer", "main"]
 
-from glob import iglob
 
-try:
-    # Python 3
-    from tkinter import TclError, Tk, ttk
-except (ImportError):
-    # Python 2
-    from Tkinter import TclError, Tk
-    import ttk
+if sys.version_info >= (3, 7):
+    def __getattr__(name):
+        # The user interface takes a while to import, so only do it
+        # once it's needed; --apply, for one, doesn't need it at all
+        if name == "PDFRenamer":
+            from .ui import PDFRenamer
+            return PDFRenamer
 
-from .ui import PDFRenamer
+        raise AttributeError("module {0!r} has no attribute {1!r}"
+                             .format(__name__, name))
 
+else:
+    # Older versions don't support module-level __getattr__()
+    from .ui import PDFRenamer
 
-# Export the PDFRenamer widget and our main function
-__all__ = ["PDFRenamer", "main"]
+
+class _StartupProfile(object):
+    """Record how long each phase of starting the application takes."""
+
+    def __init__(self, started):
+        """Return a new _StartupProfile."""
+
+        self._started = started
+        self._last = started
+
+        # (phase, seconds) for each phase finished so far
+        self.phases = []
+
+    def mark(self, phase):
+        """Record that a phase has just finished."""
+
+        now = time.time()
+        self.phases.append((phase, now - self._last))
+        self._last = now
+
+    def report(self, out=None):
+        """Print the time taken by each phase."""
+
+        if out is None:
+            out = sys.stderr
+
+        for phase, seconds in self.phases:
+            out.write("{0:<24}{1:8.1f} ms\n".format(phase, 1000 * seconds))
+
+        out.write("{0:<24}{1:8.1f} ms\n"
+                  .format("total", 1000 * (self._last - self._started)))
+        out.flush()
 
 
 def main():
     """Start the PDF Renamer application."""
 
-    # Start the application
+    args = sys.argv[1:]
+
+    if "--apply" in args:
+        # Apply a manifest without starting the user interface
+        from .batch import main as batch_main
+        sys.exit(batch_main(args))
+
+    # Print how long each phase of startup took
+    show_profile = "--startup-profile" in args
+    if show_profile:
+        args = [arg for arg in args if arg != "--startup-profile"]
+
+    # Record the session for replaying with pdfrenamer.replay
+    session_path = None
+    if "--record-session" in args:
+        i = args.index("--record-session")
+        if i + 1 < len(args):
+            session_path = args[i + 1]
+        del args[i:i + 2]
+
+    profile = _StartupProfile(_load_started)
+    profile.mark("package imports")
+
+    try:
+        # Python 3
+        from tkinter import TclError, Tk, ttk
+    except (ImportError):
+        # Python 2
+        from Tkinter import TclError, Tk
+        import ttk
+
+    # Import the user interface while Tk starts up. Most of the time
+    # goes to tkdocviewer and PIL, and to tkdocviewer checking the
+    # Ghostscript version, which doesn't need to wait for Tk.
+    def import_ui():
+        from . import ui
+
+    importer = threading.Thread(target=import_ui)
+    importer.daemon = True
+    importer.start()
+
     root = Tk()
+    profile.mark("Tk startup")
+
+    importer.join()
+    from .ui import PDFRenamer
+    if session_path:
+        from .replay import recording
+        PDFRenamer = recording(PDFRenamer, session_path)
+    profile.mark("user interface imports")
 
     r = PDFRenamer(root)
     r.pack(side="top", expand=1, fill="both")
@@ -42,17 +133,21 @@ def main():
         # ...this isn't available on all platforms
         pass
 
+    profile.mark("main window")
+
     # Parse command line arguments
-    if len(sys.argv) > 1:
-        if os.path.isdir(sys.argv[-1]):
+    if args:
+        if os.path.isdir(args[-1]):
             # If the last command line argument is a folder, then
             # open all files found in that folder
-            r.open_dir(os.path.abspath(sys.argv[-1]))
+            r.open_dir(os.path.abspath(args[-1]))
 
         else:
+            from glob import iglob
+
             # Open each file specified on the command line
             paths = []
-            for arg in sys.argv[1:]:
+            for arg in args:
                 for item in iglob(arg):
                     paths.append(os.path.abspath(item))
 
@@ -62,4 +157,15 @@ def main():
         # Browse for a folder after the main loop has started
         r.after(50, r.browse)
 
+    profile.mark("opening files")
+
+    if show_profile:
+        def first_paint():
+            # Idle callbacks run in order, so this comes after the
+            # window has been drawn for the first time
+            profile.mark("first paint")
+            profile.report()
+
+        root.after_idle(first_paint)
+
     root.mainloop()
@@ -0,0 +1,413 @@
+"""Batch renaming driven by a manifest file.
+
+A manifest lists files to rename, one per row, as a source path and
+a destination. It can be a CSV file with two columns, optionally with
+a "source,destination" header row, or a JSON file containing either
+a list of [source, destination] pairs or an object mapping sources
+to destinations.
+
+Relative paths are interpreted relative to the manifest's directory.
+A destination with no directory part renames the file in place, and
+a destination ending in a path separator moves the file to that
+directory without renaming it. As in the user interface, the source
+file's extension is appended to the destination if it is missing.
+
+Run this from the command line with:
+  pdfrenamer --apply MANIFEST [--dry-run] [--skip-conflicts]
+"""
+
+import argparse
+import csv
+import json
+import os
+import sys
+import threading
+
+try:
+    # Python 3
+    import queue
+except (ImportError):
+    # Python 2
+    import Queue as queue
+
+from .rename import RenamerError, move_file
+
+
+__all__ = ["BatchRenamer", "Rename", "main", "read_manifest"]
+
+
+def read_manifest(path):
+    """Return the list of renames in the specified manifest file.
+
+    Raises RenamerError if the manifest is not in a recognized format.
+    """
+
+    base_dir = os.path.dirname(os.path.abspath(path))
+    base, ext = os.path.splitext(path)
+
+    try:
+        if ext.lower() == ".json":
+            with open(path, "r") as manifest:
+                data = json.load(manifest)
+
+            if isinstance(data, dict):
+                pairs = sorted(data.items())
+            else:
+                pairs = [(item["source"], item["destination"])
+                         if isinstance(item, dict) else tuple(item)
+                         for item in data]
+
+        else:
+            with open(path, "r") as manifest:
+                pairs = [tuple(item) for item in csv.reader(manifest)
+                         if item and not item[0].startswith("#")]
+
+            # Skip the header row, if there is one
+            if pairs and tuple(map(str.lower, pairs[0])) == ("source",
+                                                              "destination"):
+                pairs = pairs[1:]
+
+        renames = []
+        for row, (src, dst) in enumerate(pairs, 1):
+            renames.append(Rename(row, base_dir, src, dst))
+
+        return renames
+
+    except (RenamerError):
+        raise
+
+    except (Exception) as err:
+        raise RenamerError("Could not read the manifest:\n"
+                           "{0}\n"
+                           "\n"
+                           "{1}"
+                           .format(path, err))
+
+
+class Rename(object):
+    """A single row in a manifest."""
+
+    __slots__ = ["row", "src_path", "dst_path", "status", "message"]
+
+    def __init__(self, row, base_dir, src, dst):
+        """Return a new Rename."""
+
+        if not src or not dst:
+            raise RenamerError("Row {0} is missing a source or destination."
+                               .format(row))
+
+        # Row number in the manifest, starting at 1
+        self.row = row
+
+        src_path = os.path.normpath(os.path.join(base_dir, src))
+
+        if dst.endswith(("/", os.sep)):
+            # Move the file to this directory without renaming it
+            dst = os.path.join(dst, os.path.basename(src_path))
+
+        elif not os.path.dirname(dst):
+            # Rename the file in place
+            dst = os.path.join(os.path.dirname(src_path), dst)
+
+        # Keep the file's extension, like the user interface does
+        src_base, ext = os.path.splitext(src_path)
+        if not os.path.normcase(dst).endswith(os.path.normcase(ext)):
+            dst += ext
+
+        self.src_path = src_path
+        self.dst_path = os.path.normpath(os.path.join(base_dir, dst))
+
+        # One of "pending", "unchanged", "renamed", "conflict", or "failed"
+        self.status = "pending"
+        self.message = ""
+
+    def fail(self, status, message):
+        """Mark this rename as unsuccessful."""
+
+        self.status = status
+        self.message = message
+
+
+class BatchRenamer(object):
+    """Apply a list of renames.
+
+    Call check() to find conflicts before anything on disk is changed,
+    then apply() to perform the renames that passed.
+
+    Renames are performed by a pool of worker threads, which keeps
+    network shares busy while individual moves wait on the server.
+    If one file's destination is another file's source, the second
+    file is moved out of the way first, and the first file is only
+    moved once the second has been.
+    """
+
+    def __init__(self, renames, jobs=4):
+        """Return a new BatchRenamer."""
+
+        self.renames = renames
+        self.jobs = max(1, jobs)
+
+        # Names in each directory we've looked at, so we only have to
+        # list each directory once instead of checking every file
+        self._listings = {}
+
+        # The rename that has to move each rename's destination out of
+        # the way first, set by _waves()
+        self._blockers = {}
+
+    # ------------------------------------------------------------------------
+
+    def apply(self):
+        """Perform each pending rename."""
+
+        for wave in self._waves():
+            self._apply_wave(wave)
+
+    def check(self):
+        """Check each rename for conflicts.
+
+        Returns the list of renames that cannot be performed.
+        """
+
+        key = os.path.normcase
+
+        sources = {}
+        destinations = {}
+        for rename in self.renames:
+            sources.setdefault(key(rename.src_path), []).append(rename)
+            destinations.setdefault(key(rename.dst_path), []).append(rename)
+
+        for rename in self.renames:
+            src_key = key(rename.src_path)
+            dst_key = key(rename.dst_path)
+
+            if not self._exists(rename.src_path):
+                rename.fail("failed", "File does not exist.")
+
+            elif len(sources[src_key]) > 1:
+                rename.fail("conflict",
+                            "File is listed more than once, in rows {0}."
+                            .format(self._rows(sources[src_key])))
+
+            elif len(destinations[dst_key]) > 1:
+                rename.fail("conflict",
+                            "Destination is used more than once, in rows {0}."
+                            .format(self._rows(destinations[dst_key])))
+
+            elif src_key == dst_key:
+                rename.status = "unchanged"
+
+            elif self._exists(rename.dst_path) and dst_key not in sources:
+                rename.fail("conflict", "File already exists.")
+
+        # Renames that depend on a file that can't be moved out of the
+        # way can't be performed either
+        self._waves()
+
+        return [rename for rename in self.renames
+                if rename.status in ("conflict", "failed")]
+
+    # ------------------------------------------------------------------------
+
+    def _apply_wave(self, renames):
+        """Perform independent renames using a pool of worker threads."""
+
+        work = queue.Queue()
+        for rename in renames:
+            work.put(rename)
+
+        def worker():
+            while True:
+                try:
+                    rename = work.get_nowait()
+                except (queue.Empty):
+                    return
+
+                blocker = self._blockers.get(rename)
+                if blocker and blocker.status != "renamed":
+                    # The destination is still in use
+                    rename.fail("failed",
+                                "Destination is in use by row {0}, "
+                                "which could not be renamed."
+                                .format(blocker.row))
+                    continue
+
+                try:
+                    dst_dir = os.path.dirname(rename.dst_path)
+                    if not os.path.isdir(dst_dir):
+                        os.makedirs(dst_dir)
+
+                    move_file(rename.src_path, rename.dst_path)
+                    rename.status = "renamed"
+
+                except (RenamerError) as err:
+                    rename.fail("failed", str(err).replace("\n", " "))
+
+                except (Exception) as err:
+                    rename.fail("failed", str(err))
+
+        threads = [threading.Thread(target=worker)
+                   for i in range(min(self.jobs, len(renames)))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    def _exists(self, path):
+        """Return whether the specified path exists."""
+
+        dir_path, name = os.path.split(path)
+
+        listing = self._listings.get(dir_path)
+        if listing is None:
+            try:
+                listing = set(map(os.path.normcase, os.listdir(dir_path)))
+            except (OSError):
+                listing = set()
+            self._listings[dir_path] = listing
+
+        return os.path.normcase(name) in listing
+
+    @staticmethod
+    def _rows(renames):
+        """Return a list of row numbers for display."""
+
+        return ", ".join(str(rename.row) for rename in renames)
+
+    def _waves(self):
+        """Group pending renames into waves that can run in parallel.
+
+        A rename whose destination is another pending rename's source
+        must run in a later wave. Renames that form a cycle are marked
+        as conflicts, and so are renames that wait on a failed one.
+        """
+
+        key = os.path.normcase
+
+        # Renames waiting on each source to be moved out of the way
+        by_source = {}
+        for rename in self.renames:
+            by_source[key(rename.src_path)] = rename
+
+        levels = {}
+
+        def level(rename, seen):
+            if rename in levels:
+                return levels[rename]
+
+            blocker = by_source.get(key(rename.dst_path))
+            if blocker is None or blocker is rename:
+                result = 0
+            elif blocker in seen:
+                rename.fail("conflict", "Renames form a cycle.")
+                result = None
+            elif blocker.status != "pending":
+                rename.fail("conflict",
+                            "Destination is in use by row {0}, "
+                            "which cannot be renamed."
+                            .format(blocker.row))
+                result = None
+            else:
+                seen.add(rename)
+                blocker_level = level(blocker, seen)
+                seen.discard(rename)
+                self._blockers[rename] = blocker
+
+                if blocker_level is None:
+                    if rename.status == "pending":
+                        rename.fail("conflict",
+                                    "Destination is in use by row {0}, "
+                                    "which cannot be renamed."
+                                    .format(blocker.row))
+                    result = None
+                else:
+                    result = blocker_level + 1
+
+            levels[rename] = result
+            return result
+
+        waves = []
+        for rename in self.renames:
+            if rename.status != "pending":
+                continue
+
+            n = level(rename, set())
+            if n is None or rename.status != "pending":
+                continue
+
+            while len(waves) <= n:
+                waves.append([])
+            waves[n].append(rename)
+
+        return waves
+
+
+def main(argv=None):
+    """Apply a manifest from the command line.
+
+    Returns an exit status: 0 if every file was renamed, 1 if some
+    could not be renamed, and 2 if the manifest could not be read.
+    """
+
+    parser = argparse.ArgumentParser(
+        prog="pdfrenamer",
+        description="Rename files listed in a CSV or JSON manifest.")
+    parser.add_argument("--apply", metavar="MANIFEST", required=True,
+                        help="manifest listing files to rename")
+    parser.add_argument("--dry-run", action="store_true",
+                        help="check for conflicts without renaming anything")
+    parser.add_argument("--skip-conflicts", action="store_true",
+                        help="rename the files without conflicts even if "
+                             "others have them")
+    parser.add_argument("--jobs", type=int, default=4,
+                        help="number of files to move at once (default: 4)")
+    parser.add_argument("--report", metavar="FILE",
+                        help="write the result for each row to a CSV file")
+    args = parser.parse_args(argv)
+
+    try:
+        renames = read_manifest(args.apply)
+
+    except (RenamerError) as err:
+        sys.stderr.write("{0}\n".format(err))
+        return 2
+
+    renamer = BatchRenamer(renames, args.jobs)
+    problems = renamer.check()
+
+    if problems and not args.skip_conflicts:
+        # Don't change anything unless the whole manifest can be applied
+        for rename in renames:
+            if rename.status == "pending":
+                rename.fail("skipped", "Not renamed because of conflicts.")
+
+    elif not args.dry_run:
+        renamer.apply()
+
+    # Report on each row that didn't work out
+    for rename in renames:
+        if rename.status in ("conflict", "failed"):
+            sys.stderr.write("Row {0}: {1}: {2}\n"
+                             .format(rename.row, rename.src_path,
+                                     rename.message))
+
+    counts = {}
+    for rename in renames:
+        counts[rename.status] = counts.get(rename.status, 0) + 1
+    sys.stdout.write("{0}\n".format(", ".join(
+        "{0} {1}".format(count, status)
+        for status, count in sorted(counts.items()))))
+
+    if args.report:
+        with open(args.report, "w") as report_file:
+            writer = csv.writer(report_file)
+            writer.writerow(["row", "source", "destination",
+                             "status", "message"])
+            for rename in renames:
+                writer.writerow([rename.row, rename.src_path,
+                                 rename.dst_path, rename.status,
+                                 rename.message])
+
+    failed = [rename for rename in renames
+              if rename.status not in ("renamed", "unchanged", "pending")]
+    return 1 if failed else 0
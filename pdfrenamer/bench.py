@@ -0,0 +1,594 @@
+"""Benchmarks for comparing the performance of different releases.
+
+Run this as "python -m pdfrenamer.bench". It generates a synthetic
+corpus of documents for each size requested, measures how long the
+program's main operations take on it, and writes the results as JSON.
+
+The benchmarks follow the same code paths as the user interface,
+minus Tk where possible, so they can run without a display:
+
+ scan       Finding the files in a folder, as done by open_dir().
+ preview    Rendering a sample of documents, to the first page and to
+            the last. PDF and PostScript files are skipped if
+            Ghostscript is not installed.
+ rename     Checking and submitting renames, as done by
+            _process_rename(), and how many finish per second.
+ file_list  Updating the list of open files after each rename. This
+            needs a display, and is skipped if one isn't available.
+"""
+
+import argparse
+import io
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+
+import PIL.Image
+
+from tkdocviewer.backends import GhostscriptBackend
+
+from .catalog import FileCatalog
+from .config import VERSION
+from .journal import RenameJournal
+from .render import RenderJob, can_render
+from .rename import RenameWorker, new_path
+from .scan import DirectoryScanner
+
+
+__all__ = ["DEFAULT_MIX", "DEFAULT_SIZES", "generate_corpus",
+           "run_benchmarks", "main"]
+
+
+# Share of each kind of document in a generated corpus
+DEFAULT_MIX = (
+    ("pdf", 0.50),
+    ("ps", 0.20),
+    ("gif", 0.25),
+    ("jpg", 0.05),
+)
+
+# Numbers of files to benchmark with
+DEFAULT_SIZES = 10, 1000, 100000
+
+
+# ------------------------------------------------------------------------
+# Corpus generation
+
+
+def _pdf_data(pages, label):
+    """Return a PDF document with the specified number of pages."""
+
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        None,   # The page tree, filled in below
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+
+    kids = []
+    for page in range(1, pages + 1):
+        text = "{0} page {1} of {2}".format(label, page, pages)
+        stream = ("BT /F1 24 Tf 72 720 Td ({0}) Tj ET"
+                  .format(text).encode("ascii"))
+
+        objects.append(b"<< /Length " + str(len(stream)).encode("ascii")
+                       + b" >>\nstream\n" + stream + b"\nendstream")
+        content_ref = len(objects)
+
+        objects.append("<< /Type /Page /Parent 2 0 R "
+                       "/MediaBox [0 0 612 792] "
+                       "/Resources << /Font << /F1 3 0 R >> >> "
+                       "/Contents {0} 0 R >>"
+                       .format(content_ref).encode("ascii"))
+        kids.append("{0} 0 R".format(len(objects)))
+
+    objects[1] = ("<< /Type /Pages /Kids [{0}] /Count {1} >>"
+                  .format(" ".join(kids), pages).encode("ascii"))
+
+    out = io.BytesIO()
+    out.write(b"%PDF-1.4\n")
+
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(out.tell())
+        out.write("{0} 0 obj\n".format(number).encode("ascii"))
+        out.write(body)
+        out.write(b"\nendobj\n")
+
+    xref = out.tell()
+    out.write("xref\n0 {0}\n".format(len(objects) + 1).encode("ascii"))
+    out.write(b"0000000000 65535 f \n")
+    for offset in offsets:
+        out.write("{0:010d} 00000 n \n".format(offset).encode("ascii"))
+    out.write("trailer\n<< /Size {0} /Root 1 0 R >>\nstartxref\n{1}\n%%EOF\n"
+              .format(len(objects) + 1, xref).encode("ascii"))
+
+    return out.getvalue()
+
+
+def _ps_data(pages, label):
+    """Return a PostScript document with the specified number of pages."""
+
+    lines = ["%!PS-Adobe-3.0",
+             "%%Pages: {0}".format(pages),
+             "%%EndComments"]
+
+    for page in range(1, pages + 1):
+        lines += ["%%Page: {0} {0}".format(page),
+                  "/Helvetica findfont 24 scalefont setfont",
+                  "72 720 moveto",
+                  "({0} page {1} of {2}) show".format(label, page, pages),
+                  "showpage"]
+
+    lines.append("%%EOF")
+    return "\n".join(lines).encode("ascii") + b"\n"
+
+
+def _gif_data(frames, size):
+    """Return an animated GIF with the specified number of frames."""
+
+    width, height = size
+    images = []
+    for frame in range(frames):
+        image = PIL.Image.new("P", size, frame % 256)
+        image.paste((frame * 37) % 256,
+                    (0, 0, width * (frame + 1) // frames, height // 4))
+        images.append(image)
+
+    out = io.BytesIO()
+    images[0].save(out, "GIF", save_all=True, append_images=images[1:],
+                   duration=100, loop=0)
+    return out.getvalue()
+
+
+def _jpg_data(size):
+    """Return a large JPEG image."""
+
+    # A gradient compresses about as well as a scanned page
+    gradient = PIL.Image.linear_gradient("L").resize(size)
+    image = PIL.Image.merge("RGB", (gradient,
+                                    gradient.transpose(PIL.Image.ROTATE_90)
+                                    .resize(size),
+                                    gradient))
+
+    out = io.BytesIO()
+    image.save(out, "JPEG", quality=85)
+    return out.getvalue()
+
+
+def generate_corpus(path, count, mix=DEFAULT_MIX, pages=4,
+                    image_size=(2400, 3200), gif_size=(640, 480)):
+    """Generate a synthetic corpus of documents in a folder.
+
+    The mix argument is a sequence of (kind, share) pairs, where kind is
+    "pdf", "ps", "gif", or "jpg"; shares are normalized, so they don't
+    have to add up to one. PDF and PostScript documents have the
+    specified number of pages, and GIFs that many frames. JPEG images
+    are image_size pixels.
+
+    Every file has different contents, so the corpus doesn't look like
+    one big set of duplicates. Returns a list of the generated paths
+    for each kind, as a dict.
+    """
+
+    if not os.path.isdir(path):
+        os.makedirs(path)
+
+    total_share = float(sum(share for kind, share in mix))
+
+    # Images are the same apart from a unique trailer, which decoders
+    # ignore, since generating each one would take far too long
+    templates = {"gif": lambda: _gif_data(pages, gif_size),
+                 "jpg": lambda: _jpg_data(image_size)}
+
+    paths = {}
+    made = 0
+
+    for i, (kind, share) in enumerate(mix):
+        if i == len(mix) - 1:
+            kind_count = count - made
+        else:
+            kind_count = int(round(count * share / total_share))
+            kind_count = min(kind_count, count - made)
+        made += kind_count
+
+        template = templates[kind]() if kind in templates else None
+        kind_paths = paths[kind] = []
+
+        for n in range(kind_count):
+            label = "{0} {1:06d}".format(kind.upper(), n)
+
+            if kind == "pdf":
+                data = _pdf_data(pages, label)
+            elif kind == "ps":
+                data = _ps_data(pages, label)
+            elif template is not None:
+                data = template + label.encode("ascii")
+            else:
+                raise ValueError("Unknown document kind: {0}".format(kind))
+
+            file_path = os.path.join(path, "{0}-{1:06d}.{2}"
+                                     .format(kind, n, kind))
+            with open(file_path, "wb") as out_file:
+                out_file.write(data)
+            kind_paths.append(file_path)
+
+    return paths
+
+
+# ------------------------------------------------------------------------
+# Benchmarks
+
+
+def _summary(seconds):
+    """Return statistics for a list of durations, in milliseconds."""
+
+    if not seconds:
+        return None
+
+    values = sorted(1000 * s for s in seconds)
+    middle = len(values) // 2
+    if len(values) % 2:
+        median = values[middle]
+    else:
+        median = (values[middle - 1] + values[middle]) / 2
+
+    return {"count": len(values),
+            "mean": round(sum(values) / len(values), 3),
+            "median": round(median, 3),
+            "min": round(values[0], 3),
+            "max": round(values[-1], 3)}
+
+
+def bench_scan(path, files, repeat=3):
+    """Measure how long it takes to find the files in a folder.
+
+    This includes merging each batch into a FileCatalog, as the user
+    interface does. The fastest of several runs is reported, since the
+    first one may be slowed down by a cold disk cache.
+    """
+
+    from tkdocviewer import DocViewer
+    known_extensions = frozenset(DocViewer.known_extensions)
+
+    def accept(name):
+        base, ext = os.path.splitext(name)
+        return ext.lower() in known_extensions
+
+    first_batch = []
+    total = []
+
+    for i in range(repeat):
+        started = time.time()
+        catalog = FileCatalog()
+        scanner = DirectoryScanner(path, accept).start()
+
+        while True:
+            item = scanner.queue.get()
+            if item is None:
+                break
+            elif isinstance(item, Exception):
+                raise item
+
+            batch, scanned = item
+            if not catalog:
+                first_batch.append(time.time() - started)
+            catalog.merge(batch)
+
+        total.append(time.time() - started)
+
+    best = min(total)
+    return {"benchmark": "scan",
+            "files": files,
+            "found": len(catalog),
+            "first_batch_ms": round(1000 * min(first_batch), 3),
+            "total_ms": round(1000 * best, 3),
+            "files_per_second": round(files / best, 1) if best else None}
+
+
+def bench_preview(paths_by_kind, files, sample=5, workers=1, timeout=60):
+    """Measure how long it takes to render a sample of each kind.
+
+    Each document is rendered from scratch, without any caches, by a
+    RenderJob like the viewer uses. Large images aren't rendered by a
+    backend, so for those this measures decoding them with PIL, which
+    is what the viewer does. Multi-frame images are rendered lazily, so
+    for those only the first frame is rendered.
+    """
+
+    have_ghostscript = bool(GhostscriptBackend.executable())
+    results = []
+
+    for kind in sorted(paths_by_kind):
+        paths = paths_by_kind[kind][:sample]
+        if not paths:
+            continue
+
+        result = {"benchmark": "preview",
+                  "files": files,
+                  "format": kind,
+                  "sample": len(paths)}
+        results.append(result)
+
+        if kind in ("pdf", "ps") and not have_ghostscript:
+            result["skipped"] = "Ghostscript was not found"
+            continue
+
+        first_page = []
+        done = []
+        errors = 0
+
+        for path in paths:
+            started = time.time()
+
+            if not can_render(path):
+                # Displayed directly by the viewer widget
+                image = PIL.Image.open(path)
+                image.load()
+                elapsed = time.time() - started
+                first_page.append(elapsed)
+                done.append(elapsed)
+                continue
+
+            job = RenderJob(path, workers=workers).start()
+
+            while (1 not in job.pages
+                   and not job.finished.is_set()
+                   and time.time() - started < timeout):
+                time.sleep(0.001)
+            if 1 in job.pages:
+                first_page.append(time.time() - started)
+
+            # Lazy jobs, like those for multi-frame images, are done
+            # once the first page is rendered
+            finished = job.finished.wait(timeout)
+            succeeded = finished and not job.error and (job.complete
+                                                        or job.lazy)
+            if not finished:
+                job.cancel()
+            elif succeeded:
+                done.append(time.time() - started)
+
+            if not succeeded:
+                errors += 1
+
+        result["first_page_ms"] = _summary(first_page)
+        result["done_ms"] = _summary(done)
+        result["errors"] = errors
+
+    return results
+
+
+def bench_rename(paths, files, limit=1000):
+    """Measure how quickly files can be renamed.
+
+    Each rename is checked and submitted the same way as
+    _process_rename(), against a FileCatalog holding every file in the
+    corpus, and the catalog is updated as each one finishes, like
+    _finish_rename(). Renames are recorded in a journal, as usual.
+    """
+
+    catalog = FileCatalog(sorted(paths))
+    to_rename = list(catalog)[:limit]
+
+    journal_dir = tempfile.mkdtemp()
+    journal = RenameJournal(os.path.join(journal_dir, "renames.journal"))
+    worker = RenameWorker(journal)
+
+    def taken(path):
+        return catalog.conflicts(path) or os.path.exists(path)
+
+    try:
+        journal.recover()
+
+        requests = []
+        request_times = []
+        started = time.time()
+
+        for n, src_path in enumerate(to_rename):
+            request_started = time.time()
+            dst_path = new_path(src_path, "renamed-{0:06d}".format(n),
+                                None, taken)
+            requests.append(worker.submit(src_path, dst_path))
+            request_times.append(time.time() - request_started)
+
+        update_times = []
+        for i in range(len(requests)):
+            request = worker.results.get()
+
+            update_started = time.time()
+            if not request.error:
+                catalog[catalog.index(request.src_path)] = request.dst_path
+            update_times.append(time.time() - update_started)
+
+        elapsed = time.time() - started
+        errors = sum(1 for request in requests if request.error)
+
+    finally:
+        worker.stop()
+        journal.close()
+        shutil.rmtree(journal_dir, ignore_errors=True)
+
+    return {"benchmark": "rename",
+            "files": files,
+            "renames": len(to_rename),
+            "errors": errors,
+            "request_ms": _summary(request_times),
+            "catalog_update_ms": _summary(update_times),
+            "total_ms": round(1000 * elapsed, 3),
+            "renames_per_second": (round(len(to_rename) / elapsed, 1)
+                                   if elapsed else None)}
+
+
+def bench_file_list(paths, files, updates=200):
+    """Measure how long the list of open files takes to update.
+
+    This times displaying the whole list, then changing one entry,
+    refreshing it, and selecting it, as happens after each rename.
+    """
+
+    try:
+        # Python 3
+        from tkinter import Tk, TclError
+    except (ImportError):
+        # Python 2
+        from Tkinter import Tk, TclError
+
+    from .filelist import FileList
+
+    result = {"benchmark": "file_list", "files": files}
+
+    try:
+        root = Tk()
+    except (TclError) as err:
+        result["skipped"] = "No display available: {0}".format(err)
+        return result
+
+    try:
+        file_list = FileList(root)
+        file_list.pack(side="left", fill="y")
+        root.update()
+
+        catalog = FileCatalog(sorted(paths))
+
+        started = time.time()
+        file_list.set_items(catalog)
+        file_list.select(0)
+        root.update_idletasks()
+        result["set_items_ms"] = round(1000 * (time.time() - started), 3)
+
+        update_times = []
+        step = max(1, len(catalog) // max(1, updates))
+        for i in range(0, len(catalog), step)[:updates]:
+            dir_path, name = os.path.split(catalog[i])
+
+            started = time.time()
+            catalog[i] = os.path.join(dir_path, "renamed-" + name)
+            file_list.refresh(i)
+            file_list.select(i)
+            root.update_idletasks()
+            update_times.append(time.time() - started)
+
+        result["update_ms"] = _summary(update_times)
+
+    finally:
+        root.destroy()
+
+    return result
+
+
+def run_benchmarks(sizes=DEFAULT_SIZES, corpus_dir=None, preview_sample=5,
+                   rename_limit=1000, pages=4, log=None):
+    """Run every benchmark at each size and return the results.
+
+    Corpora are generated in corpus_dir, or in a temporary folder that
+    is deleted afterward if none is specified. Each one is generated
+    from scratch, since the rename benchmark changes it. Progress
+    messages are written to log, if specified.
+    """
+
+    def say(message):
+        if log:
+            log.write(message + "\n")
+            log.flush()
+
+    report = {"version": VERSION,
+              "python": platform.python_version(),
+              "platform": platform.platform(),
+              "ghostscript": GhostscriptBackend.version(),
+              "started": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+              "results": []}
+    results = report["results"]
+
+    temp_dir = None
+    if corpus_dir is None:
+        corpus_dir = temp_dir = tempfile.mkdtemp()
+
+    try:
+        for size in sizes:
+            path = os.path.join(corpus_dir, "corpus-{0}".format(size))
+
+            say("Generating {0} files...".format(size))
+            started = time.time()
+            if os.path.isdir(path):
+                shutil.rmtree(path)
+            paths_by_kind = generate_corpus(path, size, pages=pages)
+            say("Generated in {0:.1f} s".format(time.time() - started))
+
+            all_paths = [p for kind in paths_by_kind
+                         for p in paths_by_kind[kind]]
+
+            say("Scanning...")
+            results.append(bench_scan(path, size))
+
+            say("Rendering previews...")
+            results += bench_preview(paths_by_kind, size, preview_sample)
+
+            say("Updating the file list...")
+            results.append(bench_file_list(all_paths, size))
+
+            # This goes last since it renames files in the corpus
+            say("Renaming...")
+            results.append(bench_rename(all_paths, size, rename_limit))
+
+            if temp_dir:
+                shutil.rmtree(path, ignore_errors=True)
+
+    finally:
+        if temp_dir:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+
+    return report
+
+
+def main(argv=None):
+    """Run the benchmarks from the command line."""
+
+    parser = argparse.ArgumentParser(
+        prog="python -m pdfrenamer.bench",
+        description="Measure the performance of PDF Renamer's main "
+                    "operations on a synthetic corpus.")
+    parser.add_argument("--sizes", default=",".join(map(str, DEFAULT_SIZES)),
+                        help="comma-separated numbers of files to test with "
+                             "(default: %(default)s)")
+    parser.add_argument("--pages", type=int, default=4,
+                        help="pages in each document (default: 4)")
+    parser.add_argument("--preview-sample", type=int, default=5,
+                        help="documents of each kind to render (default: 5)")
+    parser.add_argument("--rename-limit", type=int, default=1000,
+                        help="maximum files to rename (default: 1000)")
+    parser.add_argument("--corpus-dir", metavar="DIR",
+                        help="where to generate the corpus (default: a "
+                             "temporary folder)")
+    parser.add_argument("--output", metavar="FILE",
+                        help="write the results to a JSON file instead "
+                             "of standard output")
+    args = parser.parse_args(argv)
+
+    try:
+        sizes = [int(size) for size in args.sizes.split(",")]
+    except (ValueError):
+        parser.error("sizes must be a comma-separated list of numbers")
+
+    report = run_benchmarks(sizes,
+                            corpus_dir=args.corpus_dir,
+                            preview_sample=args.preview_sample,
+                            rename_limit=args.rename_limit,
+                            pages=args.pages,
+                            log=sys.stderr)
+
+    if args.output:
+        with open(args.output, "w") as out_file:
+            json.dump(report, out_file, indent=2, sort_keys=True)
+    else:
+        json.dump(report, sys.stdout, indent=2, sort_keys=True)
+        sys.stdout.write("\n")
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,607 @@
+"""Caches for rendered pages."""
+
+import hashlib
+import io
+import json
+import os
+import threading
+import zlib
+
+from collections import OrderedDict
+
+try:
+    import PIL.Image
+except (ImportError):
+    PIL = None
+
+
+__all__ = ["CompressedPage", "DiskCache", "PageCache",
+           "file_identity", "image_size", "ppm_bytes", "ppm_thumbnail"]
+
+# Atomically replace a file; Python 2 only has os.rename()
+_replace = getattr(os, "replace", os.rename)
+
+
+def file_identity(path):
+    """Return a value identifying the contents of the specified file.
+
+    This is based on the file's device, inode, size, and modification
+    time, so it survives renaming the file or moving it within the
+    same filesystem, but changes if the file is modified.
+    """
+
+    st = os.stat(path)
+    return (st.st_dev, st.st_ino, st.st_size, st.st_mtime)
+
+
+def image_size(image_data):
+    """Return the approximate memory used by rendered image data."""
+
+    if PIL and isinstance(image_data, PIL.Image.Image):
+        w, h = image_data.size
+        return w * h * len(image_data.getbands())
+
+    elif isinstance(image_data, CompressedPage):
+        return len(image_data.data)
+
+    else:
+        # Raw image data, as returned by Ghostscript
+        return len(image_data)
+
+
+def ppm_bytes(image_data):
+    """Return rendered image data as raw PPM data."""
+
+    if PIL and isinstance(image_data, PIL.Image.Image):
+        buf = io.BytesIO()
+        image_data.convert("RGB").save(buf, "PPM")
+        return buf.getvalue()
+
+    else:
+        # Ghostscript already gives us raw PPM data
+        return bytes(image_data)
+
+
+def ppm_thumbnail(data, max_size=128):
+    """Return a thumbnail of raw PPM data, or None if not supported.
+
+    The thumbnail is scaled by sampling pixels, which is crude but fast,
+    and does not need PIL.
+    """
+
+    # Parse the header: magic number, width, height, and maximum value,
+    # separated by whitespace and possibly comments
+    fields = []
+    pos = 0
+    while len(fields) < 4:
+        while data[pos:pos + 1].isspace():
+            pos += 1
+
+        if data[pos:pos + 1] == b"#":
+            pos = data.index(b"\n", pos)
+            continue
+
+        end = pos
+        while data[end:end + 1] and not data[end:end + 1].isspace():
+            end += 1
+
+        if end == pos:
+            return None
+
+        fields.append(data[pos:end])
+        pos = end
+
+    # Exactly one whitespace character separates the header from the data
+    pos += 1
+
+    magic, width, height, maxval = fields
+    if magic != b"P6" or int(maxval) > 255:
+        return None
+
+    width = int(width)
+    height = int(height)
+    step = max(1, -(-max(width, height) // max_size))
+
+    # Dimensions of the thumbnail
+    tw = -(-width // step)
+    th = -(-height // step)
+
+    out = bytearray(tw * th * 3)
+    row_length = width * 3
+    for y in range(th):
+        start = pos + y * step * row_length
+        row = data[start:start + row_length]
+        out_start = y * tw * 3
+        for channel in range(3):
+            out[out_start + channel:out_start + tw * 3:3] = \
+                row[channel::3 * step]
+
+    header = "P6\n{0} {1}\n255\n".format(tw, th).encode("ascii")
+    return header + bytes(out)
+
+
+class CompressedPage(object):
+    """Rendered image data compressed to save memory.
+
+    Pages of a long document that are out of view are kept like this,
+    so they can be displayed again without rendering them again.
+    """
+
+    __slots__ = ["data"]
+
+    # Pages are compressed while the user waits, so favor speed over size
+    level = 1
+
+    def __init__(self, image_data):
+        """Return a new CompressedPage."""
+
+        self.data = zlib.compress(ppm_bytes(image_data), self.level)
+
+    def decompress(self):
+        """Return the image data as raw PPM data."""
+
+        return zlib.decompress(self.data)
+
+
+class DiskCache(object):
+    """Persistent cache of rendered first pages and thumbnails.
+
+    Entries are keyed by a hash of the file's contents, so identical
+    files in different folders share the same entry. Hashes are saved
+    in an index keyed by device and inode, and are recomputed when a
+    file's size or modification time changes.
+
+    A file that isn't in the index yet is only hashed in full if a
+    quick hash of its size and samples of its contents matches a file
+    that is, so looking up a new file doesn't wait for all of it to be
+    read. The full hash is computed when the page is stored instead,
+    once it has already been rendered.
+
+    Once the total size of the cache exceeds the size limit, which is
+    given in bytes, entries are deleted in least-recently-used order.
+    Setting the limit to zero disables the cache.
+
+    This is safe to use from multiple threads.
+    """
+
+    # Maximum number of file hashes to keep in the index
+    _INDEX_LIMIT = 100000
+
+    # Amount of data hashed from each part of a file
+    _SAMPLE_SIZE = 64 * 1024
+
+    def __init__(self, cache_dir, size_limit=512 * 1024 * 1024):
+        """Return a new DiskCache."""
+
+        self._cache_dir = cache_dir
+        self._index_path = os.path.join(cache_dir, "index.json")
+
+        # File hashes by device and inode, from least to most recently used
+        # Each entry is [size, mtime, content hash, sample hash]. Loaded
+        # on demand, since this can take a while.
+        self._index = None
+
+        # Content hashes in the index by sample hash
+        self._samples = {}
+
+        # Total size of the cache directory; calculated on demand
+        self._size = None
+
+        self._lock = threading.RLock()
+        self._size_limit = size_limit
+
+    # ------------------------------------------------------------------------
+
+    def get(self, path, identity, variant):
+        """Return a cached first page as (page_count, image_data).
+
+        The identity argument is the value returned by file_identity().
+        The variant argument is a string distinguishing renders of the
+        same file with different options.
+
+        Returns None if the page is not in the cache.
+        """
+
+        if not self._size_limit:
+            return None
+
+        try:
+            digest = self._lookup(path, identity)
+        except (Exception):
+            return None
+
+        if not digest:
+            return None
+
+        meta_path = self._entry_path(digest, "json")
+        page_path = self._entry_path(digest, variant + ".ppm")
+
+        try:
+            with open(meta_path, "r") as meta_file:
+                page_count = json.load(meta_file)["page_count"]
+
+            with open(page_path, "rb") as page_file:
+                image_data = page_file.read()
+
+            # Mark this as the most recently used entry
+            os.utime(meta_path, None)
+
+            return page_count, image_data
+
+        except (Exception):
+            return None
+
+    def get_thumbnail(self, path):
+        """Return a cached thumbnail as raw PPM data, or None."""
+
+        if not self._size_limit:
+            return None
+
+        try:
+            digest = self._lookup(path, file_identity(path))
+            if not digest:
+                return None
+
+            with open(self._entry_path(digest, "thumb.ppm"), "rb") as f:
+                return f.read()
+
+        except (Exception):
+            return None
+
+    def put(self, path, identity, variant, page_count, image_data):
+        """Store a rendered first page and its thumbnail."""
+
+        if not self._size_limit:
+            return
+
+        try:
+            digest = self._digest(path, identity)
+            data = ppm_bytes(image_data)
+            thumbnail = ppm_thumbnail(data)
+
+            entries = [(variant + ".ppm", data)]
+            if thumbnail:
+                entries.append(("thumb.ppm", thumbnail))
+
+            # Write the metadata last, since it marks the entry as used
+            meta = json.dumps({"page_count": page_count})
+            entries.append(("json", meta.encode("utf-8")))
+
+            with self._lock:
+                self._calculate_size()
+
+                for suffix, contents in entries:
+                    entry_path = self._entry_path(digest, suffix)
+                    if os.path.isfile(entry_path):
+                        self._size -= os.path.getsize(entry_path)
+
+                    temp_path = entry_path + ".tmp"
+                    with open(temp_path, "wb") as entry_file:
+                        entry_file.write(contents)
+                    _replace(temp_path, entry_path)
+
+                    self._size += len(contents)
+
+                if self._size > self._size_limit:
+                    self.prune()
+
+        except (Exception):
+            # The worst case here is the page isn't cached
+            pass
+
+    def prune(self):
+        """Delete entries until the cache is within its size limit."""
+
+        with self._lock:
+            self._calculate_size()
+            if self._size <= self._size_limit:
+                return
+
+            # Group the cached files by entry
+            entries = {}
+            for item in os.listdir(self._cache_dir):
+                digest, sep, suffix = item.partition(".")
+                if sep and item != "index.json":
+                    entries.setdefault(digest, []).append(item)
+
+            def last_used(digest):
+                try:
+                    return os.path.getmtime(self._entry_path(digest, "json"))
+                except (OSError):
+                    return 0
+
+            for digest in sorted(entries, key=last_used):
+                for item in entries[digest]:
+                    item_path = os.path.join(self._cache_dir, item)
+                    try:
+                        size = os.path.getsize(item_path)
+                        os.remove(item_path)
+                        self._size -= size
+                    except (OSError):
+                        pass
+
+                if self._size <= self._size_limit:
+                    break
+
+    def save(self):
+        """Save the index of file hashes."""
+
+        with self._lock:
+            if not self._index or not self._size_limit:
+                return
+
+            # Keep only the most recently used hashes
+            items = list(self._index.items())[-self._INDEX_LIMIT:]
+
+            try:
+                temp_path = self._index_path + ".tmp"
+                with open(temp_path, "w") as index_file:
+                    json.dump(items, index_file)
+                _replace(temp_path, self._index_path)
+
+            except (Exception):
+                # The worst case here is we have to hash files again
+                pass
+
+    # ------------------------------------------------------------------------
+
+    def _calculate_size(self):
+        """Calculate the size of the cache directory if needed."""
+
+        if self._size is not None:
+            return
+
+        if not os.path.isdir(self._cache_dir):
+            os.makedirs(self._cache_dir)
+
+        self._size = 0
+        for item in os.listdir(self._cache_dir):
+            try:
+                self._size += os.path.getsize(os.path.join(self._cache_dir,
+                                                           item))
+            except (OSError):
+                pass
+
+    def _digest(self, path, identity):
+        """Return the content hash for the specified file."""
+
+        dev, ino, size, mtime = identity
+
+        digest = self._indexed_digest(identity)
+        if digest:
+            return digest
+
+        # Hash the file outside the lock, since this can take a while
+        sample = self._sample_digest(path, size)
+        digest = self._content_digest(path)
+        self._remember(identity, digest, sample)
+
+        return digest
+
+    def _lookup(self, path, identity):
+        """Return the content hash for a file that might be cached.
+
+        Returns None without reading the whole file if no file with
+        the same sample hash is in the index.
+        """
+
+        dev, ino, size, mtime = identity
+
+        digest = self._indexed_digest(identity)
+        if digest:
+            return digest
+
+        sample = self._sample_digest(path, size)
+        with self._lock:
+            if sample not in self._samples:
+                return None
+
+        # Samples only suggest the files might be the same, so check
+        digest = self._content_digest(path)
+        self._remember(identity, digest, sample)
+
+        return digest
+
+    def _content_digest(self, path):
+        """Return a hash of the whole contents of a file."""
+
+        h = hashlib.sha1()
+        with open(path, "rb") as in_file:
+            for chunk in iter(lambda: in_file.read(2**20), b""):
+                h.update(chunk)
+
+        return h.hexdigest()
+
+    def _indexed_digest(self, identity):
+        """Return a file's content hash from the index, or None."""
+
+        dev, ino, size, mtime = identity
+        key = "{0}:{1}".format(dev, ino)
+
+        with self._lock:
+            if self._index is None:
+                self._load_index()
+
+            entry = self._index.pop(key, None)
+            if entry and entry[0] == size and entry[1] == mtime:
+                self._index[key] = entry
+                return entry[2]
+
+        return None
+
+    def _remember(self, identity, digest, sample):
+        """Add a file's hashes to the index."""
+
+        dev, ino, size, mtime = identity
+        key = "{0}:{1}".format(dev, ino)
+
+        with self._lock:
+            self._index[key] = [size, mtime, digest, sample]
+            self._samples.setdefault(sample, set()).add(digest)
+
+    def _sample_digest(self, path, size):
+        """Return a quick hash of a file's size and samples of its contents.
+
+        Files with different sample hashes are different, but files
+        with the same one might not be the same.
+        """
+
+        h = hashlib.sha1(str(size).encode("ascii"))
+        sample_size = self._SAMPLE_SIZE
+
+        with open(path, "rb") as in_file:
+            if size <= 3 * sample_size:
+                h.update(in_file.read())
+            else:
+                for offset in (0,
+                               (size - sample_size) // 2,
+                               size - sample_size):
+                    in_file.seek(offset)
+                    h.update(in_file.read(sample_size))
+
+        return h.hexdigest()
+
+    def _entry_path(self, digest, suffix):
+        """Return the path to one of the files for a cache entry."""
+
+        return os.path.join(self._cache_dir,
+                            "{0}.{1}".format(digest, suffix))
+
+    def _load_index(self):
+        """Load the index of file hashes."""
+
+        self._index = OrderedDict()
+        self._samples = {}
+
+        try:
+            with open(self._index_path, "r") as index_file:
+                for key, entry in json.load(index_file):
+                    # Entries without a sample hash are from an older
+                    # version, which may not have hashed whole files
+                    if len(entry) == 4:
+                        self._index[key] = entry
+                        self._samples.setdefault(entry[3],
+                                                 set()).add(entry[2])
+
+        except (Exception):
+            # Start with an empty index
+            pass
+
+    # ------------------------------------------------------------------------
+
+    @property
+    def size_limit(self):
+        """The maximum size of the cache directory, in bytes."""
+
+        return self._size_limit
+
+    @size_limit.setter
+    def size_limit(self, value):
+        self._size_limit = value
+
+
+class PageCache(object):
+    """In-memory cache of rendered pages.
+
+    Entries are evicted in least-recently-used order once the total
+    size of the cached data exceeds the memory limit, which is given
+    in bytes. Setting the limit to zero disables the cache.
+
+    This is safe to use from multiple threads.
+    """
+
+    # Approximate memory used by an entry other than image data
+    _ENTRY_OVERHEAD = 64
+
+    def __init__(self, memory_limit=256 * 1024 * 1024):
+        """Return a new PageCache."""
+
+        # Cached values and their sizes, from least to most recently used
+        self._entries = OrderedDict()
+
+        # Total size of the cached values
+        self._size = 0
+
+        self._lock = threading.Lock()
+        self._memory_limit = memory_limit
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def __len__(self):
+        return len(self._entries)
+
+    # ------------------------------------------------------------------------
+
+    def clear(self):
+        """Remove all entries from the cache."""
+
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def get(self, key, default=None):
+        """Return the value for the specified key, or default."""
+
+        with self._lock:
+            try:
+                value, size = self._entries.pop(key)
+
+            except (KeyError):
+                return default
+
+            # Mark this as the most recently used entry
+            self._entries[key] = value, size
+            return value
+
+    def put(self, key, value, size=None):
+        """Store a value in the cache.
+
+        If size is not specified, value is assumed to be image data.
+        """
+
+        if size is None:
+            size = image_size(value)
+        size += self._ENTRY_OVERHEAD
+
+        with self._lock:
+            if key in self._entries:
+                old_value, old_size = self._entries.pop(key)
+                self._size -= old_size
+
+            if size > self._memory_limit:
+                # This would evict everything else; don't bother
+                return
+
+            self._entries[key] = value, size
+            self._size += size
+            self._evict()
+
+    # ------------------------------------------------------------------------
+
+    def _evict(self):
+        """Remove entries until the cache is within its memory limit."""
+
+        while self._size > self._memory_limit:
+            key, (value, size) = self._entries.popitem(last=False)
+            self._size -= size
+
+    # ------------------------------------------------------------------------
+
+    @property
+    def memory_limit(self):
+        """The maximum size of the cached data, in bytes."""
+
+        return self._memory_limit
+
+    @memory_limit.setter
+    def memory_limit(self, value):
+        with self._lock:
+            self._memory_limit = value
+            self._evict()
+
+    @property
+    def size(self):
+        """The total size of the cached data, in bytes."""
+
+        return self._size
@@ -0,0 +1,428 @@
+"""Catalog of open files."""
+
+import os
+import time
+
+from bisect import bisect_left
+
+
+__all__ = ["FileCatalog", "existing_files"]
+
+
+# Whether file names differ by case, in which case os.path.normcase()
+# doesn't need to be called on them
+_CASE_SENSITIVE = os.path.normcase("A") == "A"
+
+
+def existing_files(paths):
+    """Return the absolute paths of those specified that are files.
+
+    Paths are returned in the order given. Where many paths are in the
+    same directory, it is listed once rather than checking each file
+    separately, which is much faster on network drives.
+    """
+
+    # Paths to check in each directory
+    by_dir = {}
+    for path in paths:
+        path = os.path.abspath(path)
+        dir_path, name = os.path.split(path)
+        by_dir.setdefault(dir_path, set()).add(name)
+
+    found = set()
+
+    for dir_path, names in by_dir.items():
+        if len(names) > FileCatalog.listing_threshold:
+            try:
+                found.update(os.path.join(dir_path, name)
+                             for name in _list_files(dir_path)
+                             if name in names)
+                continue
+            except (OSError):
+                # Fall back to checking each file
+                pass
+
+        found.update(os.path.join(dir_path, name)
+                     for name in names
+                     if os.path.isfile(os.path.join(dir_path, name)))
+
+    return [path for path in map(os.path.abspath, paths) if path in found]
+
+
+def _name_key(name):
+    """Return a file name as used in the index of names."""
+
+    return name if _CASE_SENSITIVE else name.lower()
+
+
+def _split(path):
+    """Split a path into its directory and name, like os.path.split().
+
+    This is faster for the common case of a normalized absolute path.
+    """
+
+    head, sep, tail = path.rpartition(os.sep)
+
+    if (head
+            and not head.endswith((os.sep, ":"))
+            and not (os.altsep and os.altsep in tail)):
+        return head, tail
+
+    return os.path.split(path)
+
+
+def _list_files(path):
+    """Yield the name of each file in a directory."""
+
+    if hasattr(os, "scandir"):
+        for entry in os.scandir(path):
+            try:
+                if entry.is_file():
+                    yield entry.name
+            except (OSError):
+                # The item was deleted while we were looking at it
+                pass
+
+    else:
+        # Python 2 has no scandir(), so we have to stat each item
+        for name in os.listdir(path):
+            if os.path.isfile(os.path.join(path, name)):
+                yield name
+
+
+class _Entry(object):
+    """A file in the catalog."""
+
+    __slots__ = ("dir", "name", "identity", "checked")
+
+    def __init__(self, dir_path, name):
+        """Return a new _Entry."""
+
+        # The directory path is shared by every entry in the directory
+        self.dir = dir_path
+        self.name = name
+
+        # Cached file_identity() and when it was last checked
+        self.identity = None
+        self.checked = 0.0
+
+    def __lt__(self, other):
+        # Entries sort by directory, then name
+        return (self.dir < other.dir
+                or (self.dir == other.dir and self.name < other.name))
+
+    @property
+    def path(self):
+        """The full path to this file."""
+
+        return os.path.join(self.dir, self.name)
+
+
+class FileCatalog(object):
+    """The list of open files.
+
+    This acts like a list of absolute paths, but stores each directory
+    only once, with a small record for each file. It also keeps an
+    index of the names in each directory, so checking whether a path is
+    in the catalog, or whether a new name would conflict with an open
+    file, takes the same time no matter how many files are open.
+
+    A path can only appear once; adding one that conflicts with a path
+    already in the catalog has no effect.
+    """
+
+    # Seconds a cached file_identity() is used before checking again
+    stat_ttl = 5.0
+
+    # Number of files in one directory above which existing_files()
+    # lists the directory rather than checking each file
+    listing_threshold = 16
+
+    def __init__(self, paths=()):
+        """Return a new FileCatalog."""
+
+        # Records for each file, in order
+        self._entries = []
+
+        # The stored copy of each directory path and its entries by
+        # name, so each path is stored only once
+        self._dirs = {}
+
+        # Entries by name for each directory, both normalized with
+        # os.path.normcase(), so conflicts are found on case-insensitive
+        # filesystems; directories that differ only by case share one
+        self._index = {}
+
+        # Whether the entries are in sorted order, which merge() can
+        # take advantage of; renaming a file can change this
+        self._sorted = True
+
+        self.extend(paths)
+
+    # ------------------------------------------------------------------------
+
+    def __contains__(self, path):
+        return self._lookup(path) is not None
+
+    def __delitem__(self, index):
+        if isinstance(index, slice):
+            for entry in self._entries[index]:
+                self._unindex(entry)
+        else:
+            self._unindex(self._entries[index])
+
+        del self._entries[index]
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [entry.path for entry in self._entries[index]]
+
+        return self._entries[index].path
+
+    def __iter__(self):
+        for entry in self._entries:
+            yield entry.path
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __setitem__(self, index, path):
+        """Replace the path at an index, such as after renaming a file."""
+
+        entries = self._entries
+        old_entry = entries[index]
+
+        # Check this before changing anything, so the catalog is left
+        # as it was; a file may be renamed to a name that only differs
+        # in case from its old one, though
+        dir_path, name = _split(path)
+        names = self._names(dir_path)
+        other = names.get(_name_key(name)) if names else None
+        if other is not None and other is not old_entry:
+            raise ValueError("{0} is already in the catalog".format(path))
+
+        self._unindex(old_entry)
+        entry = entries[index] = self._add(path)
+
+        if self._sorted:
+            i = index % len(entries)
+            self._sorted = ((i == 0 or not entry < entries[i - 1])
+                            and (i == len(entries) - 1
+                                 or not entries[i + 1] < entry))
+
+    # ------------------------------------------------------------------------
+
+    def append(self, path):
+        """Add a path to the end of the catalog."""
+
+        entry = self._add(path)
+        if entry is not None:
+            entries = self._entries
+            if entries and entry < entries[-1]:
+                self._sorted = False
+            entries.append(entry)
+
+    def clear(self):
+        """Remove every path from the catalog."""
+
+        del self._entries[:]
+        self._dirs.clear()
+        self._index.clear()
+        self._sorted = True
+
+    def conflicts(self, path):
+        """Return whether an open file would conflict with a new path.
+
+        Unlike the in operator, this ignores case on case-insensitive
+        filesystems.
+        """
+
+        dir_path, name = _split(path)
+        names = self._names(dir_path)
+        return bool(names) and _name_key(name) in names
+
+    def extend(self, paths):
+        """Add paths to the end of the catalog."""
+
+        for path in paths:
+            self.append(path)
+
+    def identity(self, index, max_age=None):
+        """Return the file_identity() of the file at an index.
+
+        The result is cached, and checked again once it's older than
+        max_age seconds, which defaults to stat_ttl. Raises OSError if
+        the file can't be found.
+        """
+
+        if max_age is None:
+            max_age = self.stat_ttl
+
+        entry = self._entries[index]
+
+        now = time.time()
+        if entry.identity is None or now - entry.checked > max_age:
+            st = os.stat(entry.path)
+            entry.identity = st.st_dev, st.st_ino, st.st_size, st.st_mtime
+            entry.checked = now
+
+        return entry.identity
+
+    def index(self, path):
+        """Return the index of a path. Raises ValueError if not found."""
+
+        entry = self._lookup(path)
+        if entry is None:
+            raise ValueError("{0} is not in the catalog".format(path))
+
+        # Most catalogs are sorted, so try the fast way first
+        entries = self._entries
+        i = bisect_left(entries, entry)
+        if i < len(entries) and entries[i] is entry:
+            return i
+
+        for i, other in enumerate(entries):
+            if other is entry:
+                return i
+
+    def invalidate(self, path):
+        """Forget the cached file_identity() for a path."""
+
+        entry = self._lookup(path)
+        if entry is not None:
+            entry.identity = None
+
+    def merge(self, paths):
+        """Add paths to a sorted catalog, keeping it sorted.
+
+        Paths already in the catalog are skipped. Returns the number of
+        paths that were added.
+
+        If the catalog is no longer sorted, as after renaming a file,
+        each new path is added before the first path that sorts after
+        it, which is slower but leaves the others where they are.
+        """
+
+        new_entries = [entry for entry in map(self._add, paths)
+                       if entry is not None]
+
+        if not new_entries:
+            return 0
+
+        new_entries.sort(key=_sort_key)
+
+        entries = self._entries
+        if not entries:
+            self._entries = new_entries
+            self._sorted = True
+            return len(new_entries)
+
+        merged = []
+
+        if self._sorted:
+            # Copy the existing entries a slice at a time, so this only
+            # compares entries to find where each new one goes
+            start = 0
+            for entry in new_entries:
+                i = bisect_left(entries, entry, start)
+                merged.extend(entries[start:i])
+                merged.append(entry)
+                start = i
+            merged.extend(entries[start:])
+
+        else:
+            # Binary search needs a sorted list, so compare each one
+            j = 0
+            count = len(new_entries)
+            for entry in entries:
+                while j < count and new_entries[j] < entry:
+                    merged.append(new_entries[j])
+                    j += 1
+                merged.append(entry)
+            merged.extend(new_entries[j:])
+
+        self._entries = merged
+        return len(new_entries)
+
+    def remove(self, paths):
+        """Remove a set of paths from the catalog.
+
+        Paths not in the catalog are ignored.
+        """
+
+        entries = [self._lookup(path) for path in paths]
+        entries = set(entry for entry in entries if entry is not None)
+
+        for entry in entries:
+            self._unindex(entry)
+
+        self._entries = [entry for entry in self._entries
+                         if entry not in entries]
+
+    # ------------------------------------------------------------------------
+
+    def _add(self, path):
+        """Return a new indexed entry for a path.
+
+        Returns None if the path conflicts with one in the catalog.
+        """
+
+        dir_path, name = _split(path)
+
+        stored = self._dirs.get(dir_path)
+        if stored is None:
+            names = self._index.setdefault(os.path.normcase(dir_path), {})
+            stored = self._dirs[dir_path] = dir_path, names
+
+        dir_path, names = stored
+
+        name_key = _name_key(name)
+        if name_key in names:
+            return None
+
+        entry = names[name_key] = _Entry(dir_path, name)
+        return entry
+
+    def _lookup(self, path):
+        """Return the entry for a path, or None if it isn't in the catalog."""
+
+        dir_path, name = _split(path)
+        names = self._names(dir_path)
+        if not names:
+            return None
+
+        entry = names.get(_name_key(name))
+        if entry is None or entry.name != name or entry.dir != dir_path:
+            return None
+
+        return entry
+
+    def _names(self, dir_path):
+        """Return the entries in a directory by name, or None."""
+
+        stored = self._dirs.get(dir_path)
+        if stored is not None:
+            return stored[1]
+
+        return self._index.get(os.path.normcase(dir_path))
+
+    def _unindex(self, entry):
+        """Remove an entry from the index of names."""
+
+        names = self._names(entry.dir)
+        if names is None:
+            return
+
+        name_key = _name_key(entry.name)
+        if names.get(name_key) is entry:
+            del names[name_key]
+
+        if not names:
+            self._index.pop(os.path.normcase(entry.dir), None)
+            self._dirs.pop(entry.dir, None)
+
+
+def _sort_key(entry):
+    """Return the key used to sort entries."""
+
+    return entry.dir, entry.name
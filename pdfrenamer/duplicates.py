@@ -0,0 +1,342 @@
+"""Support for finding duplicate files in the background."""
+
+import hashlib
+import json
+import mmap
+import os
+import threading
+
+from collections import OrderedDict
+
+try:
+    # Python 3
+    import queue
+except (ImportError):
+    # Python 2
+    import Queue as queue
+
+
+__all__ = ["DuplicateFinder", "HashCache"]
+
+
+# Used to save the hash cache atomically
+_replace = getattr(os, "replace", os.rename)
+
+
+class HashCache(object):
+    """Persistent cache of partial and full file hashes.
+
+    Hashes are keyed by device and inode, and are ignored once a file's
+    size or modification time changes, so renaming a file doesn't
+    require hashing it again.
+
+    This is safe to use from multiple threads.
+    """
+
+    # Maximum number of files to keep hashes for
+    _INDEX_LIMIT = 200000
+
+    def __init__(self, path):
+        """Return a new HashCache."""
+
+        self.path = path
+
+        # Entries by device and inode, from least to most recently used
+        # Each entry is [size, mtime, partial_hash, full_hash], where
+        # either hash may be None if it hasn't been computed yet.
+        # Loaded on demand, since this can take a while.
+        self._index = None
+
+        # Whether the index has changed since it was saved
+        self._dirty = False
+
+        self._lock = threading.Lock()
+
+    # ------------------------------------------------------------------------
+
+    def get(self, identity, kind):
+        """Return a cached hash, or None if there isn't one.
+
+        The identity argument is the value returned by file_identity().
+        The kind argument is "partial" or "full".
+        """
+
+        key, size, mtime = self._split(identity)
+
+        with self._lock:
+            self._load()
+
+            entry = self._index.pop(key, None)
+            if entry and entry[0] == size and entry[1] == mtime:
+                self._index[key] = entry
+                return entry[2 if kind == "partial" else 3]
+
+        return None
+
+    def put(self, identity, kind, digest):
+        """Store a hash for a file."""
+
+        key, size, mtime = self._split(identity)
+
+        with self._lock:
+            self._load()
+
+            entry = self._index.pop(key, None)
+            if not (entry and entry[0] == size and entry[1] == mtime):
+                entry = [size, mtime, None, None]
+
+            entry[2 if kind == "partial" else 3] = digest
+            self._index[key] = entry
+            self._dirty = True
+
+    def save(self):
+        """Save the cache to disk."""
+
+        with self._lock:
+            if not self._dirty:
+                return
+
+            # Keep only the most recently used hashes
+            items = list(self._index.items())[-self._INDEX_LIMIT:]
+            self._dirty = False
+
+        cache_dir = os.path.dirname(self.path)
+        if not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+
+        temp_path = self.path + ".tmp"
+        with open(temp_path, "w") as cache_file:
+            json.dump(items, cache_file)
+        _replace(temp_path, self.path)
+
+    # ------------------------------------------------------------------------
+
+    def _load(self):
+        """Load the cache if needed. The caller must hold the lock."""
+
+        if self._index is not None:
+            return
+
+        self._index = OrderedDict()
+
+        try:
+            with open(self.path, "r") as cache_file:
+                for key, entry in json.load(cache_file):
+                    self._index[key] = entry
+
+        except (Exception):
+            # Start with an empty cache
+            pass
+
+    @staticmethod
+    def _split(identity):
+        """Split a file identity into a key, size, and modification time."""
+
+        dev, ino, size, mtime = identity
+        return "{0}:{1}".format(dev, ino), size, mtime
+
+
+class DuplicateFinder(object):
+    """Find files with identical contents using a background thread.
+
+    Files are compared in stages, each of which only looks at files
+    that are still candidates after the one before:
+
+     1. Files are grouped by size, which only takes a stat() call.
+     2. Files of the same size are grouped by a hash of their first and
+        last blocks, which catches most differences in a few reads.
+     3. The rest are grouped by a hash of their full contents, which is
+        read through a memory map a chunk at a time.
+
+    Both kinds of hash are saved in the HashCache, if one is specified.
+
+    When the search is done, a list of groups of duplicates is put on
+    the queue. Each group is a list of paths in the order they were
+    given, so the first path in each group can be treated as the
+    original. An exception is put on the queue if the search fails, and
+    None is put on the queue when the search is done or canceled.
+    """
+
+    # Size of the blocks at each end of a file used for partial hashes
+    block_size = 64 * 1024
+
+    # Amount of a file to hash at once when computing full hashes
+    chunk_size = 8 * 1024 * 1024
+
+    def __init__(self, paths, cache=None):
+        """Return a new DuplicateFinder."""
+
+        # Copy the list, since the caller may change it while we work
+        self.paths = list(paths)
+        self.cache = cache
+
+        # Progress of the search as (stage, done, total), where stage
+        # is "size", "partial", or "full"
+        self.progress = None
+
+        # Used to pass results back to the user interface thread
+        self.queue = queue.Queue()
+
+        # Set to stop searching
+        self.canceler = threading.Event()
+
+    # ------------------------------------------------------------------------
+
+    def cancel(self):
+        """Stop searching."""
+
+        self.canceler.set()
+
+    def start(self):
+        """Start searching in a new background thread."""
+
+        thread = threading.Thread(target=self._run)
+        thread.daemon = True
+        thread.start()
+
+        return self
+
+    # ------------------------------------------------------------------------
+
+    def _full_hash(self, path, size):
+        """Return a hash of a file's full contents."""
+
+        h = hashlib.sha1()
+
+        if size:
+            with open(path, "rb") as in_file:
+                mm = mmap.mmap(in_file.fileno(), 0, access=mmap.ACCESS_READ)
+                try:
+                    if hasattr(mm, "madvise"):
+                        mm.madvise(mmap.MADV_SEQUENTIAL)
+
+                    # Hashing through a memoryview avoids copying the
+                    # file, and hashing a chunk at a time lets the OS
+                    # discard pages we're done with
+                    view = memoryview(mm)
+                    try:
+                        for offset in range(0, len(mm), self.chunk_size):
+                            if self.canceler.is_set():
+                                break
+                            h.update(view[offset:offset + self.chunk_size])
+                    finally:
+                        view.release()
+
+                finally:
+                    mm.close()
+
+        return h.hexdigest()
+
+    def _group(self, candidates, kind, hash_function):
+        """Split groups of candidates by one kind of hash.
+
+        The candidates argument is a list of groups of (index, path,
+        identity) tuples. Returns the groups that still have more than
+        one member.
+        """
+
+        total = sum(len(group) for group in candidates)
+        done = 0
+        cache = self.cache
+
+        results = []
+
+        for group in candidates:
+            by_hash = {}
+
+            for item in group:
+                if self.canceler.is_set():
+                    return []
+
+                index, path, identity = item
+                digest = cache.get(identity, kind) if cache else None
+
+                if digest is None:
+                    try:
+                        digest = hash_function(path, identity[2])
+                    except (EnvironmentError, ValueError):
+                        # Skip files we can't read
+                        continue
+
+                    if cache and not self.canceler.is_set():
+                        cache.put(identity, kind, digest)
+
+                by_hash.setdefault(digest, []).append(item)
+
+                done += 1
+                self.progress = kind, done, total
+
+            results += [g for g in by_hash.values() if len(g) > 1]
+
+        return results
+
+    def _partial_hash(self, path, size):
+        """Return a hash of a file's size and first and last blocks."""
+
+        h = hashlib.sha1(str(size).encode("ascii"))
+
+        with open(path, "rb") as in_file:
+            h.update(in_file.read(self.block_size))
+
+            if size > self.block_size:
+                in_file.seek(max(self.block_size, size - self.block_size))
+                h.update(in_file.read(self.block_size))
+
+        return h.hexdigest()
+
+    def _run(self):
+        """Search for duplicates."""
+
+        try:
+            # Stage 1: Group by size
+            by_size = {}
+            total = len(self.paths)
+
+            for index, path in enumerate(self.paths):
+                if self.canceler.is_set():
+                    return
+
+                try:
+                    st = os.stat(path)
+                except (OSError):
+                    # The file was moved or deleted
+                    continue
+
+                identity = st.st_dev, st.st_ino, st.st_size, st.st_mtime
+                by_size.setdefault(st.st_size, []).append((index,
+                                                           path,
+                                                           identity))
+                self.progress = "size", index + 1, total
+
+            candidates = [group for group in by_size.values()
+                          if len(group) > 1]
+
+            # Stage 2: Group by a hash of each file's ends
+            candidates = self._group(candidates, "partial",
+                                     self._partial_hash)
+
+            # Stage 3: Group by a hash of each file's full contents
+            # Small files were read completely in the last stage.
+            small = [group for group in candidates
+                     if group[0][2][2] <= 2 * self.block_size]
+            large = [group for group in candidates
+                     if group[0][2][2] > 2 * self.block_size]
+            candidates = small + self._group(large, "full", self._full_hash)
+
+            if self.canceler.is_set():
+                return
+
+            # Keep the files in the order they were given
+            for group in candidates:
+                group.sort()
+            candidates.sort()
+
+            self.queue.put([[path for index, path, identity in group]
+                            for group in candidates])
+
+        except (Exception) as err:
+            # Forward the error to the user interface thread
+            self.queue.put(err)
+
+        finally:
+            self.queue.put(None)
@@ -0,0 +1,300 @@
+"""File list panel."""
+
+import os
+import sys
+
+try:
+    # Python 3
+    from tkinter import Canvas, Listbox
+    from tkinter.ttk import Frame, Scrollbar, Separator
+    import tkinter.font as tkfont
+except (ImportError):
+    # Python 2
+    from Tkinter import Canvas, Listbox
+    from ttk import Frame, Scrollbar, Separator
+    import tkFont as tkfont
+
+
+__all__ = ["FileList"]
+
+
+class FileList(Frame):
+    """Scrolling list of open files.
+
+    The list displays the items of a sequence of paths, which it does
+    not copy; call refresh() after changing the sequence. Only the rows
+    that are currently visible are drawn, so refreshing takes the same
+    time no matter how many files are open.
+
+    The command argument is called with the index of a row when the
+    user clicks on it.
+
+    Rows can be marked, such as to flag duplicate files, by passing a
+    set of paths to set_marked(). Marked rows are drawn in italics with
+    the marked_foreground color.
+    """
+
+    # Horizontal and vertical padding around each row's text
+    _PAD_X = 4
+    _PAD_Y = 1
+
+    # Text color for marked rows
+    marked_foreground = "gray50"
+
+    def __init__(self, master=None, command=None, **kw):
+        """Return a new FileList widget."""
+
+        Frame.__init__(self, master, **kw)
+
+        # The sequence of paths to display
+        self._items = []
+
+        # Index of the selected item, or None
+        self._selection = None
+
+        # Paths of marked items
+        self._marked = frozenset()
+
+        # Index of the first visible row
+        self._top = 0
+
+        # Called when the user clicks on a row
+        self._command = command
+
+        # Borrow colors and the font from a standard listbox so we
+        # match the platform's look
+        lb = Listbox(self)
+        self._font = tkfont.Font(font=lb.cget("font"))
+        self._marked_font = tkfont.Font(font=lb.cget("font"))
+        self._marked_font.configure(slant="italic")
+        self._colors = {
+            "background": lb.cget("background"),
+            "foreground": lb.cget("foreground"),
+            "selectbackground": lb.cget("selectbackground"),
+            "selectforeground": lb.cget("selectforeground"),
+        }
+        lb.destroy()
+
+        self._row_height = self._font.metrics("linespace") + 2 * self._PAD_Y
+
+        # Canvas items for each visible row, reused as the list scrolls
+        self._rows = []
+
+        sep = Separator(self, orient="vertical")
+        sep.pack(side="right", fill="y")
+
+        sb = self._scrollbar = Scrollbar(self,
+                                         orient="vertical",
+                                         command=self.yview)
+        sb.pack(side="right", fill="y")
+
+        c = self._canvas = Canvas(self,
+                                  width=200,
+                                  background=self._colors["background"],
+                                  borderwidth=0,
+                                  highlightthickness=0,
+                                  takefocus=0)
+        c.pack(side="left", expand=1, fill="both")
+
+        c.bind("<Configure>", self._handle_configure)
+        c.bind("<Button-1>", self._handle_click)
+
+        # Mouse scrolling
+        c.bind("<MouseWheel>", self._handle_scroll_wheel)
+        c.bind("<Button-4>", self._handle_scroll_wheel)
+        c.bind("<Button-5>", self._handle_scroll_wheel)
+
+    # ------------------------------------------------------------------------
+
+    def refresh(self, index=None):
+        """Redraw the list after the displayed sequence has changed.
+
+        If an index is specified, only that row is redrawn. Use this
+        when a single item has changed, such as after renaming a file.
+        """
+
+        if index is None:
+            # Keep the visible rows within the list
+            self._top = max(0, min(self._top,
+                                   len(self._items) - self._visible_rows()))
+            self._draw()
+
+        elif self._top <= index < self._top + len(self._rows):
+            self._draw_row(index - self._top)
+
+    def see(self, index):
+        """Scroll the list so the specified row is visible."""
+
+        visible_rows = self._visible_rows()
+
+        if index < self._top:
+            self._top = index
+        elif index >= self._top + visible_rows:
+            self._top = index - visible_rows + 1
+        else:
+            return
+
+        self.refresh()
+
+    def select(self, index):
+        """Select the specified row and make sure it is visible."""
+
+        old_selection = self._selection
+        self._selection = index
+
+        if old_selection is not None:
+            self.refresh(old_selection)
+        self.refresh(index)
+
+        self.see(index)
+
+    def set_marked(self, paths):
+        """Mark the rows displaying the specified set of paths."""
+
+        self._marked = paths
+        self.refresh()
+
+    def set_items(self, items):
+        """Display the specified sequence of paths.
+
+        Call select() afterward to select an item in the new sequence.
+        """
+
+        self._items = items
+        self._selection = None
+        self.refresh()
+
+    def yview(self, *args):
+        """Query or change the vertical position of the list.
+
+        This accepts the same arguments as the yview() method of
+        standard Tk widgets, so it can be used with a scrollbar.
+        """
+
+        count = len(self._items)
+        visible_rows = self._visible_rows()
+
+        if not args:
+            return self._fractions()
+
+        elif args[0] == "moveto":
+            self._top = int(float(args[1]) * count)
+
+        elif args[0] == "scroll":
+            amount = int(args[1])
+            if args[2] == "pages":
+                amount *= max(1, visible_rows - 1)
+            self._top += amount
+
+        self.refresh()
+
+    # ------------------------------------------------------------------------
+
+    def _draw(self):
+        """Draw every visible row."""
+
+        c = self._canvas
+        width = c.winfo_width()
+        visible_rows = self._visible_rows()
+
+        # Create canvas items for any new rows
+        while len(self._rows) < visible_rows:
+            y = len(self._rows) * self._row_height
+            rect = c.create_rectangle(0, y, width, y + self._row_height,
+                                      width=0)
+            text = c.create_text(self._PAD_X, y + self._PAD_Y,
+                                 anchor="nw", font=self._font)
+            self._rows.append((rect, text))
+
+        # Delete canvas items for rows that are no longer visible
+        while len(self._rows) > visible_rows:
+            for item in self._rows.pop():
+                c.delete(item)
+
+        for row in range(len(self._rows)):
+            self._draw_row(row)
+
+        self._scrollbar.set(*self._fractions())
+
+    def _draw_row(self, row):
+        """Draw the specified visible row."""
+
+        c = self._canvas
+        rect, text = self._rows[row]
+        index = self._top + row
+
+        if index >= len(self._items):
+            # Blank rows past the end of the list
+            c.itemconfigure(rect, fill="")
+            c.itemconfigure(text, text="")
+            return
+
+        colors = self._colors
+        item = self._items[index]
+        marked = item in self._marked
+
+        if index == self._selection:
+            c.itemconfigure(rect, fill=colors["selectbackground"])
+            c.itemconfigure(text, fill=colors["selectforeground"])
+        elif marked:
+            c.itemconfigure(rect, fill="")
+            c.itemconfigure(text, fill=self.marked_foreground)
+        else:
+            c.itemconfigure(rect, fill="")
+            c.itemconfigure(text, fill=colors["foreground"])
+
+        c.itemconfigure(text,
+                        text=os.path.basename(item),
+                        font=self._marked_font if marked else self._font)
+
+    def _fractions(self):
+        """Return the visible part of the list as a pair of fractions."""
+
+        count = len(self._items)
+        if not count:
+            return 0.0, 1.0
+
+        last = min(count, self._top + self._visible_rows())
+        return float(self._top) / count, float(last) / count
+
+    def _handle_click(self, event):
+        """Handle a mouse click on the list."""
+
+        index = self._top + event.y // self._row_height
+        if index < len(self._items) and self._command:
+            self._command(index)
+
+    def _handle_configure(self, event):
+        """Handle the list being resized."""
+
+        c = self._canvas
+        for rect, text in self._rows:
+            x0, y0, x1, y1 = c.coords(rect)
+            c.coords(rect, 0, y0, event.width, y1)
+
+        self.refresh()
+
+    def _handle_scroll_wheel(self, event):
+        """Scroll the list using the mouse wheel."""
+
+        if sys.platform.startswith("darwin"):
+            # macOS
+            self.yview("scroll", -1 * event.delta, "units")
+
+        elif event.num == 4:
+            # Unix - scroll up
+            self.yview("scroll", -3, "units")
+
+        elif event.num == 5:
+            # Unix - scroll down
+            self.yview("scroll", 3, "units")
+
+        else:
+            # Windows
+            self.yview("scroll", -3 * (event.delta // 120), "units")
+
+    def _visible_rows(self):
+        """Return the number of rows that fit in the list."""
+
+        height = self._canvas.winfo_height()
+        return max(1, -(-height // self._row_height))
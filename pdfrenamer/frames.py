@@ -0,0 +1,124 @@
+"""Rendering multi-frame images one frame at a time."""
+
+import os
+import threading
+
+try:
+    import PIL.Image
+except (ImportError):
+    PIL = None
+
+from tkdocviewer.backends import BACKEND_IMAGE_EXTENSIONS, BackendError
+
+
+__all__ = ["FrameBackend", "is_frame_image"]
+
+
+def is_frame_image(path):
+    """Return whether the specified file is a multi-frame image format.
+
+    Files in these formats may still have only one frame.
+    """
+
+    base, ext = os.path.splitext(path)
+    return ext.lower() in BACKEND_IMAGE_EXTENSIONS
+
+
+class FrameBackend(object):
+    """Rendering backend for multi-frame images like GIF and TIFF.
+
+    This has the same interface as tkDocViewer's PILMultiframeBackend,
+    which decodes every frame of a GIF just to count them. Here the
+    count comes from PIL's n_frames, which only reads each frame's
+    header, and frames are decoded as they're rendered.
+
+    Rendering frames in order decodes each one once, since seeking
+    forward picks up where the last frame left off. Seeking backward
+    in a GIF has to start over from the first frame, since each frame
+    is drawn on top of the one before it; TIFF pages can be decoded in
+    any order.
+
+    The image is kept open between frames, and closed by close(). It's
+    reopened if more frames are rendered after that.
+    """
+
+    __slots__ = ["input_path", "enable_downscaling",
+                 "_frame_count", "_image", "_lock"]
+
+    def __init__(self, input_path, enable_downscaling=False):
+        """Return a new FrameBackend."""
+
+        if not PIL:
+            raise BackendError(
+                "Could not render {0} because PIL is not available "
+                "on your system."
+                .format(input_path)
+            )
+
+        self.input_path = input_path
+
+        # Accepted for compatibility with other backends, but unused
+        self.enable_downscaling = enable_downscaling
+
+        # Opened on demand
+        self._image = None
+        self._frame_count = None
+
+        self._lock = threading.Lock()
+
+    def close(self):
+        """Close the image file."""
+
+        with self._lock:
+            if self._image:
+                self._image.close()
+                self._image = None
+
+    def page_count(self):
+        """Return the number of frames in the input file."""
+
+        with self._lock:
+            if self._frame_count is None:
+                im = self._open()
+
+                try:
+                    self._frame_count = im.n_frames
+
+                except (AttributeError):
+                    # Older versions of PIL don't have n_frames, so
+                    # count them the slow way
+                    count = 1
+                    try:
+                        while True:
+                            im.seek(count)
+                            count += 1
+                    except (EOFError):
+                        self._frame_count = count
+
+                    im.seek(0)
+
+            return self._frame_count
+
+    def render_page(self, page_num):
+        """Render the specified frame of the input file."""
+
+        with self._lock:
+            im = self._open()
+
+            if im.tell() != page_num - 1:
+                im.seek(page_num - 1)
+
+            return im.copy()
+
+    # ------------------------------------------------------------------------
+
+    def _open(self):
+        """Return the open image, opening it if necessary.
+
+        The caller must hold the lock.
+        """
+
+        if not self._image:
+            self._image = PIL.Image.open(self.input_path)
+
+        return self._image
@@ -0,0 +1,543 @@
+"""Pool of long-lived Ghostscript processes.
+
+Starting Ghostscript and loading its fonts takes a large share of the
+time needed to render a small document. Instead of starting a new
+process for each page, the pool keeps a few interpreters running and
+sends them PostScript commands over a pipe, one job at a time.
+
+Each job is wrapped in save/restore and a stopped context, so an error
+in one document does not affect the next. A process that crashes, or
+stops answering, is killed and replaced.
+"""
+
+import io
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+try:
+    # Python 3
+    import queue
+except (ImportError):
+    # Python 2
+    import Queue as queue
+
+try:
+    import PIL.Image
+except (ImportError):
+    PIL = None
+
+from tkdocviewer.backends import GhostscriptBackend, gs_dpi
+
+
+__all__ = ["GhostscriptPool", "PoolError", "PooledGhostscriptBackend"]
+
+
+# Prefix for the status lines our commands print
+_MARKER = "PDFRENAMER-"
+
+
+def _ps_string(value):
+    """Return a PostScript string literal for the specified text."""
+
+    if not isinstance(value, bytes):
+        # Ghostscript expects UTF-8 file names on Windows
+        if sys.platform.startswith("win"):
+            value = value.encode("utf-8")
+        else:
+            value = value.encode(sys.getfilesystemencoding())
+
+    chars = []
+    for byte in bytearray(value):
+        if chr(byte) in "()\\" or not 32 <= byte < 127:
+            chars.append("\\{0:03o}".format(byte))
+        else:
+            chars.append(chr(byte))
+
+    return "({0})".format("".join(chars))
+
+
+class GhostscriptPool(object):
+    """Pool of Ghostscript interpreters for rendering PDF pages.
+
+    Processes are started on demand, up to the pool size, and kept
+    running between jobs. Call close() to stop them.
+
+    This is safe to use from multiple threads; each job has a process
+    to itself.
+    """
+
+    # Time to wait for a job before giving up on the process, in seconds
+    job_timeout = 60
+
+    # Processes idle longer than this are checked before they're used
+    idle_check_interval = 30
+
+    def __init__(self, size=2, executable=None):
+        """Return a new GhostscriptPool.
+
+        If executable is not specified, the same Ghostscript binary is
+        used as tkDocViewer's backend would use.
+        """
+
+        if executable is None:
+            executable = GhostscriptBackend.executable()
+
+        self.executable = executable
+
+        # Idle workers, and the number of workers in total
+        self._idle = []
+        self._count = 0
+        self._size = max(0, size)
+
+        # Used to wait for a worker to become available
+        self._condition = threading.Condition()
+
+        self._closed = False
+
+    # ------------------------------------------------------------------------
+
+    def close(self):
+        """Stop every process in the pool."""
+
+        with self._condition:
+            self._closed = True
+            idle = self._idle
+            self._idle = []
+            self._count -= len(idle)
+            self._condition.notify_all()
+
+        for worker in idle:
+            worker.stop()
+
+    def page_count(self, path):
+        """Return the number of pages in a PDF file.
+
+        Raises PoolError if the page count could not be determined.
+        """
+
+        commands = ("{0} (r) file runpdfbegin pdfpagecount "
+                    "({1}RESULT ) print = runpdfend"
+                    .format(_ps_string(path), _MARKER))
+
+        output = self._run(commands)
+        for line in output:
+            if line.startswith(_MARKER + "RESULT "):
+                return int(line.split()[1])
+
+        raise PoolError("Could not count the pages in {0}.".format(path))
+
+    def render_page(self, path, page, dpi=gs_dpi):
+        """Render a page of a PDF file, returning raw PPM image data.
+
+        Raises PoolError if the page could not be rendered.
+        """
+
+        worker = self._acquire()
+
+        try:
+            commands = ("<< /OutputFile {0} /HWResolution [{1} {1}] >> "
+                        "setpagedevice "
+                        "{2} (r) file runpdfbegin "
+                        "{3} pdfgetpage pdfshowpage "
+                        "runpdfend "
+                        "<< /OutputFile {4} >> setpagedevice"
+                        .format(_ps_string(worker.output_path),
+                                dpi,
+                                _ps_string(path),
+                                page,
+                                _ps_string(worker.idle_path)))
+
+            self._run(commands, worker)
+
+            with open(worker.output_path, "rb") as output_file:
+                return output_file.read()
+
+        finally:
+            self._release(worker)
+
+    def start(self):
+        """Start processes in the background until the pool is full.
+
+        Call this at startup so the first document doesn't have to
+        wait for Ghostscript.
+        """
+
+        def warm_up():
+            workers = []
+            with self._condition:
+                while self._count < self._size and not self._closed:
+                    self._count += 1
+                    workers.append(None)
+
+            for i in range(len(workers)):
+                try:
+                    workers[i] = _Worker(self.executable)
+                except (Exception):
+                    pass
+
+            with self._condition:
+                for worker in workers:
+                    if worker:
+                        self._idle.append(worker)
+                    else:
+                        self._count -= 1
+                self._condition.notify_all()
+
+        if self.executable and self._size:
+            thread = threading.Thread(target=warm_up)
+            thread.daemon = True
+            thread.start()
+
+        return self
+
+    # ------------------------------------------------------------------------
+
+    def _acquire(self):
+        """Return a healthy worker, starting one if needed."""
+
+        with self._condition:
+            while True:
+                if self._closed or not self._size:
+                    raise PoolError("The Ghostscript pool is not running.")
+
+                elif self._idle:
+                    worker = self._idle.pop()
+                    break
+
+                elif self._count < self._size:
+                    self._count += 1
+                    worker = None
+                    break
+
+                self._condition.wait()
+
+        try:
+            if worker and not worker.healthy(self.idle_check_interval):
+                worker.stop()
+                worker = None
+
+            if not worker:
+                worker = _Worker(self.executable)
+
+        except (Exception) as err:
+            with self._condition:
+                self._count -= 1
+                self._condition.notify()
+
+            raise PoolError("Could not start Ghostscript: {0}".format(err))
+
+        return worker
+
+    def _release(self, worker):
+        """Return a worker to the pool, or stop it if it's unusable."""
+
+        with self._condition:
+            if worker.alive and not self._closed and self._count <= self._size:
+                self._idle.append(worker)
+                worker = None
+            else:
+                self._count -= 1
+
+            self._condition.notify()
+
+        if worker:
+            worker.stop()
+
+    def _run(self, commands, worker=None):
+        """Run PostScript commands, returning the lines they printed.
+
+        Raises PoolError if the commands failed.
+        """
+
+        if worker:
+            return worker.run(commands, self.job_timeout)
+
+        worker = self._acquire()
+        try:
+            return worker.run(commands, self.job_timeout)
+        finally:
+            self._release(worker)
+
+    # ------------------------------------------------------------------------
+
+    @property
+    def available(self):
+        """The number of jobs that could start without waiting."""
+
+        with self._condition:
+            if self._closed:
+                return 0
+
+            return len(self._idle) + max(0, self._size - self._count)
+
+    @property
+    def size(self):
+        """The maximum number of Ghostscript processes.
+
+        If this is 0, the pool is disabled. Reducing the size stops
+        extra processes as they become idle.
+        """
+
+        return self._size
+
+    @size.setter
+    def size(self, value):
+        with self._condition:
+            self._size = max(0, value)
+
+            extra = []
+            while self._idle and self._count > self._size:
+                extra.append(self._idle.pop())
+                self._count -= 1
+
+            self._condition.notify_all()
+
+        for worker in extra:
+            worker.stop()
+
+
+class PooledGhostscriptBackend(object):
+    """Rendering backend for PDF files that uses a GhostscriptPool.
+
+    This has the same interface as tkDocViewer's GhostscriptBackend,
+    and falls back to it if the pool can't handle a document.
+    """
+
+    __slots__ = ["input_path", "enable_downscaling", "pool", "_fallback"]
+
+    def __init__(self, input_path, pool, enable_downscaling=False):
+        """Return a new PooledGhostscriptBackend."""
+
+        self.input_path = input_path
+        self.enable_downscaling = enable_downscaling
+        self.pool = pool
+
+        # Created if the pool fails
+        self._fallback = None
+
+    def page_count(self):
+        """Return the number of pages in the input file."""
+
+        if not self._fallback:
+            try:
+                return self.pool.page_count(self.input_path)
+            except (PoolError):
+                pass
+
+        return self._fallback_backend().page_count()
+
+    def render_page(self, page_num):
+        """Render the specified page of the input file."""
+
+        if not self._fallback:
+            downscale = PIL and self.enable_downscaling
+            dpi = 2 * gs_dpi if downscale else gs_dpi
+
+            try:
+                image_data = self.pool.render_page(self.input_path,
+                                                   page_num, dpi)
+            except (PoolError):
+                pass
+
+            else:
+                if downscale:
+                    # Scale down the output, as GhostscriptBackend does
+                    page_image = PIL.Image.open(io.BytesIO(image_data))
+                    w, h = page_image.size
+                    return page_image.resize((w // 2, h // 2),
+                                             resample=PIL.Image.BICUBIC)
+
+                return image_data
+
+        return self._fallback_backend().render_page(page_num)
+
+    def _fallback_backend(self):
+        """Return a regular GhostscriptBackend for the input file."""
+
+        if not self._fallback:
+            self._fallback = GhostscriptBackend(
+                self.input_path,
+                enable_downscaling=self.enable_downscaling)
+
+        return self._fallback
+
+
+class PoolError(Exception):
+    """Exception raised when the pool could not complete a job."""
+
+    pass
+
+
+class _Worker(object):
+    """A single Ghostscript process in a pool."""
+
+    def __init__(self, executable):
+        """Start a new Ghostscript process."""
+
+        # Ghostscript writes each page here, then switches to the idle
+        # file so the page is flushed and closed
+        fd, self.output_path = tempfile.mkstemp(suffix=".ppm")
+        os.close(fd)
+        fd, self.idle_path = tempfile.mkstemp(suffix=".ppm")
+        os.close(fd)
+
+        gs_args = [executable,
+                   "-q",
+                   "-dNOPAUSE",
+                   "-dNOSAFER",
+                   "-dNOPROMPT",
+                   "-dPrinted=false",
+                   "-dTextAlphaBits=4",
+                   "-dGraphicsAlphaBits=4",
+                   "-dCOLORSCREEN",
+                   "-dDOINTERPOLATE",
+                   "-sDEVICE=ppmraw",
+                   "-r{0}".format(gs_dpi),
+                   "-sOutputFile={0}".format(self.idle_path),
+                   "-"]
+
+        subprocess_kw = {}
+        if sys.platform.startswith("win"):
+            # Hide the console window when running under pythonw.exe
+            si = subprocess.STARTUPINFO()
+            si.dwFlags |= subprocess.STARTF_USESHOWWINDOW
+            si.wShowWindow = subprocess.SW_HIDE
+            subprocess_kw["startupinfo"] = si
+
+        self._process = subprocess.Popen(gs_args,
+                                         stdin=subprocess.PIPE,
+                                         stdout=subprocess.PIPE,
+                                         stderr=subprocess.STDOUT,
+                                         **subprocess_kw)
+
+        # Lines printed by Ghostscript, read by a background thread so
+        # we can wait on them with a timeout
+        self._lines = queue.Queue()
+        reader = threading.Thread(target=self._read_output)
+        reader.daemon = True
+        reader.start()
+
+        # Identifies each job's status line
+        self._next_id = 1
+
+        self._last_used = time.time()
+
+    # ------------------------------------------------------------------------
+
+    def healthy(self, idle_interval):
+        """Return whether the process is running and responsive.
+
+        A process that has been idle for longer than idle_interval
+        seconds is sent a trivial job to make sure it still answers.
+        """
+
+        if not self.alive:
+            return False
+
+        if time.time() - self._last_used > idle_interval:
+            try:
+                self.run("", timeout=5)
+            except (PoolError):
+                return False
+
+        return True
+
+    def run(self, commands, timeout):
+        """Run PostScript commands, returning the lines they printed.
+
+        Raises PoolError if the commands failed. If the process died
+        or did not finish in time, it is killed.
+        """
+
+        job_id = self._next_id
+        self._next_id += 1
+
+        # Run the commands in a stopped context so errors are reported
+        # rather than left for the interpreter, and undo any changes
+        # they made to the interpreter's state afterward
+        script = ("/pdfrenamer_dicts countdictstack def "
+                  "save mark "
+                  "{{ {0} }} stopped "
+                  "{{ cleartomark countdictstack pdfrenamer_dicts sub "
+                  "{{ end }} repeat restore "
+                  "({1}ERROR {2} ) print $error /errorname get == flush }} "
+                  "{{ cleartomark restore ({1}OK {2}) = flush }} ifelse\n"
+                  .format(commands, _MARKER, job_id))
+
+        try:
+            self._process.stdin.write(script.encode("latin-1"))
+            self._process.stdin.flush()
+
+        except (Exception) as err:
+            self.stop()
+            raise PoolError("Ghostscript stopped unexpectedly: {0}"
+                            .format(err))
+
+        output = []
+        deadline = time.time() + timeout
+
+        while True:
+            try:
+                line = self._lines.get(timeout=max(0, deadline - time.time()))
+            except (queue.Empty):
+                self.stop()
+                raise PoolError("Ghostscript did not respond in time.")
+
+            if line is None:
+                self.stop()
+                raise PoolError("Ghostscript stopped unexpectedly:\n"
+                                "{0}".format("\n".join(output)))
+
+            if line == "{0}OK {1}".format(_MARKER, job_id):
+                self._last_used = time.time()
+                return output
+
+            elif line.startswith("{0}ERROR {1} ".format(_MARKER, job_id)):
+                self._last_used = time.time()
+                output.append(line)
+                raise PoolError("\n".join(output))
+
+            output.append(line)
+
+    def stop(self):
+        """Stop the process and clean up its files."""
+
+        process = self._process
+
+        if process.poll() is None:
+            try:
+                process.stdin.close()
+                process.kill()
+            except (Exception):
+                pass
+
+        process.wait()
+
+        for path in self.output_path, self.idle_path:
+            try:
+                os.remove(path)
+            except (OSError):
+                pass
+
+    # ------------------------------------------------------------------------
+
+    def _read_output(self):
+        """Forward lines printed by Ghostscript to the queue."""
+
+        for line in iter(self._process.stdout.readline, b""):
+            self._lines.put(line.decode("latin-1").rstrip("\r\n"))
+
+        # A None value indicates the process has exited
+        self._lines.put(None)
+
+    # ------------------------------------------------------------------------
+
+    @property
+    def alive(self):
+        """Whether the process is still running."""
+
+        return self._process.poll() is None
@@ -1,75 +1,29 @@
-# Select the appropriate data type for Tkinter's PhotoImage
-if isinstance('test', bytes): _data = bytearray
-else: _data = bytes
+# Base64-encoded GIF data, which Tkinter's PhotoImage accepts directly
 # mini icons - famfamfam.com
 # Contact: mjames@gmail.com
-action_back_gif = _data([
-    0x47, 0x49, 0x46, 0x38, 0x39, 0x61, 0x10, 0x00, 0x10, 0x00, 0xc4, 0x1f,
-    0x00, 0x24, 0x4e, 0x15, 0xdc, 0xf2, 0xd3, 0x4c, 0xa8, 0x2d, 0xb0, 0xe1,
-    0x9d, 0x44, 0x95, 0x28, 0x57, 0xbe, 0x39, 0x5d, 0xc2, 0x3c, 0xc5, 0xe9,
-    0xb8, 0xb3, 0xe2, 0xa2, 0x2b, 0x5f, 0x1a, 0x8a, 0xdd, 0x5a, 0x77, 0xd1,
-    0x4d, 0x74, 0xcb, 0x5c, 0xbc, 0xe6, 0xa9, 0x7d, 0xd4, 0x51, 0x84, 0xda,
-    0x56, 0x3c, 0x83, 0x24, 0x64, 0xc4, 0x41, 0xa3, 0xdd, 0x8c, 0x8f, 0xe0,
-    0x5d, 0x70, 0xcb, 0x49, 0xce, 0xec, 0xc3, 0x6a, 0xca, 0x45, 0xd8, 0xf0,
-    0xcf, 0xd3, 0xee, 0xc9, 0x51, 0xba, 0x35, 0x34, 0x73, 0x1f, 0x8c, 0xd4,
-    0x73, 0xdf, 0xf3, 0xd8, 0x7d, 0xce, 0x65, 0xff, 0xff, 0xff, 0xff, 0xff,
-    0xff, 0x21, 0xf9, 0x04, 0x01, 0x00, 0x00, 0x1f, 0x00, 0x2c, 0x00, 0x00,
-    0x00, 0x00, 0x10, 0x00, 0x10, 0x00, 0x00, 0x05, 0x87, 0xe0, 0x27, 0x8e,
-    0x5e, 0xe9, 0x8d, 0x28, 0xe9, 0x09, 0x2c, 0x51, 0xa6, 0xe2, 0x2a, 0x70,
-    0x5c, 0x70, 0x11, 0x6e, 0xba, 0xd2, 0xcd, 0xa4, 0x0c, 0x98, 0x0a, 0xe4,
-    0x14, 0x9b, 0x55, 0x26, 0x3e, 0xc5, 0xc3, 0x81, 0x38, 0x68, 0x88, 0x3b,
-    0xe4, 0xc4, 0xb3, 0x5c, 0x50, 0x9c, 0xa7, 0x55, 0xa0, 0xa1, 0x50, 0x94,
-    0x1c, 0x56, 0xcb, 0xa6, 0x91, 0x28, 0x11, 0x2e, 0x8f, 0x87, 0xc9, 0x14,
-    0x31, 0x90, 0xcd, 0x18, 0x87, 0x63, 0x5d, 0x32, 0x14, 0x10, 0x65, 0x0f,
-    0xa4, 0x22, 0xb1, 0x96, 0x2c, 0x6d, 0x05, 0x0c, 0x08, 0x00, 0x59, 0x10,
-    0x07, 0x16, 0x80, 0x1e, 0x06, 0x76, 0x19, 0x84, 0x50, 0x1a, 0x07, 0x12,
-    0x6d, 0x76, 0x05, 0x19, 0x1b, 0x03, 0x85, 0x24, 0x1a, 0x0d, 0x0d, 0x1d,
-    0x19, 0x19, 0x0c, 0x03, 0x99, 0x44, 0x24, 0x09, 0x09, 0x08, 0x08, 0xa3,
-    0x00, 0x9a, 0x30, 0x25, 0xac, 0xac, 0x2f, 0x30, 0x2a, 0xb2, 0x28, 0x21,
-    0x00, 0x3b
-])
-action_forward_gif = _data([
-    0x47, 0x49, 0x46, 0x38, 0x39, 0x61, 0x10, 0x00, 0x10, 0x00, 0xc4, 0x1f,
-    0x00, 0x24, 0x4e, 0x15, 0xde, 0xf3, 0xd7, 0x4c, 0xa8, 0x2d, 0xb0, 0xe1,
-    0x9d, 0x44, 0x95, 0x28, 0x74, 0xcb, 0x5c, 0x8a, 0xdd, 0x59, 0x57, 0xbe,
-    0x39, 0xc5, 0xe9, 0xb8, 0xb3, 0xe2, 0xa2, 0x5d, 0xc2, 0x3c, 0x2b, 0x5f,
-    0x1a, 0xbc, 0xe6, 0xa9, 0x84, 0xd9, 0x56, 0x6b, 0xc9, 0x46, 0x78, 0xd1,
-    0x4e, 0x3c, 0x83, 0x24, 0xa3, 0xdd, 0x8c, 0x8f, 0xe0, 0x5d, 0xce, 0xec,
-    0xc3, 0x63, 0xc4, 0x40, 0x72, 0xcf, 0x4b, 0xd9, 0xf0, 0xd0, 0xd3, 0xee,
-    0xc9, 0x7e, 0xd6, 0x52, 0x51, 0xba, 0x35, 0x34, 0x73, 0x1f, 0x8c, 0xd4,
-    0x73, 0x6d, 0xcb, 0x47, 0x7d, 0xce, 0x65, 0xff, 0xff, 0xff, 0xff, 0xff,
-    0xff, 0x21, 0xf9, 0x04, 0x01, 0x00, 0x00, 0x1f, 0x00, 0x2c, 0x00, 0x00,
-    0x00, 0x00, 0x10, 0x00, 0x10, 0x00, 0x00, 0x05, 0x86, 0xe0, 0x27, 0x8e,
-    0x5e, 0xe9, 0x8d, 0x28, 0xe9, 0x09, 0x2c, 0x51, 0xa6, 0xe2, 0x2a, 0x04,
-    0xb4, 0x45, 0xb8, 0xe9, 0x4a, 0x33, 0x92, 0x31, 0x5c, 0x13, 0xc8, 0x29,
-    0x36, 0x9b, 0x48, 0x7a, 0x86, 0xc6, 0x23, 0x81, 0xd0, 0x0c, 0x75, 0xc7,
-    0x9e, 0xe7, 0xf1, 0xe0, 0x34, 0x4f, 0x2b, 0x0b, 0xc3, 0xc0, 0x6d, 0x94,
-    0x1c, 0x8e, 0x0d, 0x63, 0x51, 0x22, 0x58, 0x1a, 0x5e, 0x53, 0x89, 0xa2,
-    0x18, 0x97, 0x2f, 0x18, 0x8c, 0xba, 0xa4, 0x38, 0x24, 0xc8, 0x1e, 0xc8,
-    0x24, 0x52, 0xe9, 0x73, 0xe8, 0x07, 0x05, 0x09, 0x00, 0x58, 0x10, 0x08,
-    0x1c, 0x60, 0x14, 0x1e, 0x75, 0x19, 0x83, 0x4f, 0x1a, 0x08, 0x11, 0x6c,
-    0x75, 0x07, 0x19, 0x1b, 0x03, 0x84, 0x24, 0x1a, 0x0c, 0x0c, 0x1d, 0x19,
-    0x19, 0x05, 0x03, 0x98, 0x43, 0x24, 0x0b, 0x0b, 0x09, 0x09, 0xa2, 0x00,
-    0x99, 0x30, 0x25, 0xab, 0xab, 0x2f, 0x30, 0x2a, 0xb1, 0x28, 0x21, 0x00,
-    0x3b
-])
-icon_wand_gif = _data([
-    0x47, 0x49, 0x46, 0x38, 0x39, 0x61, 0x10, 0x00, 0x10, 0x00, 0xc4, 0x10,
-    0x00, 0xff, 0xdc, 0xa6, 0xff, 0xc6, 0x70, 0xdb, 0xdb, 0xdb, 0xdd, 0x91,
-    0x20, 0xff, 0xa4, 0x1b, 0xff, 0xb9, 0x4f, 0xa9, 0xb9, 0xac, 0xc4, 0xad,
-    0x80, 0xad, 0x77, 0x26, 0xff, 0xb0, 0x3a, 0xdd, 0x93, 0x24, 0xa9, 0xb0,
-    0xac, 0xff, 0xf3, 0x71, 0x93, 0xab, 0xbb, 0xff, 0xff, 0xff, 0x00, 0x00,
-    0x00, 0xff, 0xff, 0xff, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00,
-    0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00,
-    0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00,
-    0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00,
-    0x00, 0x21, 0xf9, 0x04, 0x01, 0x00, 0x00, 0x10, 0x00, 0x2c, 0x00, 0x00,
-    0x00, 0x00, 0x10, 0x00, 0x10, 0x00, 0x00, 0x05, 0x4a, 0x20, 0x24, 0x8e,
-    0x64, 0x29, 0x32, 0x24, 0x60, 0x92, 0x4c, 0x0b, 0x31, 0xc1, 0x3a, 0x32,
-    0x04, 0x31, 0x18, 0x05, 0xa4, 0xca, 0x83, 0xe2, 0x38, 0x87, 0x98, 0xac,
-    0x35, 0x10, 0xfc, 0x16, 0x32, 0x40, 0xa0, 0x90, 0x40, 0x08, 0x1e, 0x8f,
-    0x86, 0x4c, 0xa4, 0x6c, 0x40, 0xa3, 0xc9, 0x91, 0x15, 0x2a, 0x9d, 0x8a,
-    0xb6, 0x58, 0x2f, 0x04, 0xdc, 0xf5, 0x92, 0xc5, 0xe3, 0xc7, 0xaf, 0x3c,
-    0x6d, 0x18, 0x1d, 0x6c, 0x99, 0x1b, 0x8e, 0x1e, 0x37, 0x1a, 0x21, 0x00,
-    0x3b
-])
+
+action_back_gif = (
+    "R0lGODlhEAAQAMQfACROFdzy00yoLbDhnUSVKFe+OV3CPMXpuLPioitfGordWnfRTXTL"
+    "XLzmqX3UUYTaVjyDJGTEQaPdjI/gXXDLSc7sw2rKRdjwz9PuyVG6NTRzH4zUc9/z2H3O"
+    "Zf///////yH5BAEAAB8ALAAAAAAQABAAAAWH4CeOXumNKOkJLFGm4ipwXHARbrrSzaQM"
+    "mArkFJtVJj7Fw4E4aIg75MSzXFCcp1WgoVCUHFbLppEoES6Ph8kUMZDNGIdjXTIUEGUP"
+    "pCKxlixtBQwIAFkQBxaAHgZ2GYRQGgcSbXYFGRsDhSQaDQ0dGRkMA5lEJAkJCAijAJow"
+    "JaysLzAqsighADs="
+)
+
+action_forward_gif = (
+    "R0lGODlhEAAQAMQfACROFd7z10yoLbDhnUSVKHTLXIrdWVe+OcXpuLPiol3CPCtfGrzm"
+    "qYTZVmvJRnjRTjyDJKPdjI/gXc7sw2PEQHLPS9nw0NPuyX7WUlG6NTRzH4zUc23LR33O"
+    "Zf///////yH5BAEAAB8ALAAAAAAQABAAAAWG4CeOXumNKOkJLFGm4ioEtEW46UozkjFc"
+    "E8gpNptIeobGI4HQDHXHnufx4DRPKwvDwG2UHI4NY1EiWBpeU4miGJcvGIy6pDgkyB7I"
+    "JFLpc+gHBQkAWBAIHGAUHnUZg08aCBFsdQcZGwOEJBoMDB0ZGQUDmEMkCwsJCaIAmTAl"
+    "q6svMCqxKCEAOw=="
+)
+
+icon_wand_gif = (
+    "R0lGODlhEAAQAMQQAP/cpv/GcNvb292RIP+kG/+5T6m5rMStgK13Jv+wOt2TJKmwrP/z"
+    "cZOru////wAAAP///wAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAA"
+    "AAAAAAAAACH5BAEAABAALAAAAAAQABAAAAVKICSOZCkyJGCSTAsxwToyBDEYBaTKg+I4"
+    "h5isNRD8FjJAoJBACB6PhkykbECjyZEVKp2KtlgvBNz1ksXjx688bRgdbJkbjh43GiEA"
+    "Ow=="
+)
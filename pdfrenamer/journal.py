@@ -0,0 +1,311 @@
+"""Write-ahead journal of file renames.
+
+Each rename is recorded in the journal before the file is touched,
+and marked as committed or aborted afterward. If the application
+dies partway through a rename, the next session can look at which
+renames were started but never finished and put things right.
+
+The journal is a text file with one JSON record per line, which is
+only ever appended to during a session.
+"""
+
+import json
+import os
+import threading
+import time
+
+
+__all__ = ["RenameJournal"]
+
+
+# How long to keep an unfinished copy that's never resumed, in seconds
+_COPY_MAX_AGE = 7 * 24 * 60 * 60
+
+
+class RenameJournal(object):
+    """Write-ahead journal of file renames.
+
+    Call begin() before renaming a file, and commit() or abort() once
+    it's done. Records are buffered; call sync() to make sure they've
+    reached the disk. Only begin records need to be synced before the
+    file is renamed, so several renames can share one sync.
+
+    The journal also keeps track of unfinished copies left by failed
+    moves to another filesystem, so has_copy() can tell whether a
+    temporary file is ours to resume. They're carried over from one
+    session to the next until they're resumed or grow too old.
+
+    This is safe to use from multiple threads.
+    """
+
+    def __init__(self, path):
+        """Return a new RenameJournal."""
+
+        self.path = path
+
+        # Open on demand
+        self._file = None
+
+        # Identifies each rename in the journal
+        self._next_id = 1
+
+        # Paths of unfinished copies left by failed moves
+        self._copies = set()
+
+        self._lock = threading.Lock()
+
+    # ------------------------------------------------------------------------
+
+    def abort(self, request):
+        """Record that a rename failed without changing anything.
+
+        If it left an unfinished copy, that's recorded too.
+        """
+
+        record = {"op": "abort", "id": request.journal_id}
+
+        if os.path.exists(request.part_path):
+            record["part"] = request.part_path
+            with self._lock:
+                self._copies.add(request.part_path)
+
+        self._write(record)
+
+    def begin(self, request):
+        """Record that a rename is about to start.
+
+        This assigns the request's journal_id.
+        """
+
+        with self._lock:
+            request.journal_id = self._next_id
+            self._next_id += 1
+
+        self._write({"op": "begin",
+                     "id": request.journal_id,
+                     "src": request.src_path,
+                     "dst": request.dst_path,
+                     "part": request.part_path})
+
+    def close(self):
+        """Sync and close the journal."""
+
+        with self._lock:
+            if self._file:
+                self._sync()
+                self._file.close()
+                self._file = None
+
+    def commit(self, request):
+        """Record that a rename finished successfully."""
+
+        with self._lock:
+            self._copies.discard(request.part_path)
+
+        self._write({"op": "commit", "id": request.journal_id})
+
+    def has_copy(self, part_path):
+        """Return whether an unfinished copy at part_path is ours."""
+
+        with self._lock:
+            return part_path in self._copies and os.path.exists(part_path)
+
+    def recover(self):
+        """Finish or roll back renames interrupted in a previous session.
+
+        This must be called before any new renames are recorded. Once
+        every interrupted rename has been dealt with, the journal is
+        emptied for the new session, except for unfinished copies kept
+        to be resumed.
+
+        Returns a list of messages describing what was done.
+        """
+
+        messages = []
+
+        with self._lock:
+            # Renames that were started but never finished, by ID
+            unfinished = {}
+
+            # Unfinished copies kept for resuming, and what they're of
+            copies = {}
+
+            # Every rename started, so commits can be matched up
+            begun = {}
+
+            try:
+                with open(self.path, "r") as journal_file:
+                    for line in journal_file:
+                        try:
+                            record = json.loads(line)
+                        except (ValueError):
+                            # The last record may have been cut short
+                            continue
+
+                        op = record.get("op")
+
+                        if op == "begin":
+                            unfinished[record["id"]] = record
+                            begun[record["id"]] = record
+
+                        elif op == "copy":
+                            copies[record["part"]] = record["src"]
+
+                        else:
+                            unfinished.pop(record.get("id"), None)
+                            started = begun.get(record.get("id"), {})
+
+                            if "part" in record:
+                                copies[record["part"]] = started.get(
+                                    "src", record["part"])
+                            elif op == "commit":
+                                copies.pop(started.get("part"), None)
+
+            except (IOError, OSError):
+                # No journal, so nothing to recover
+                pass
+
+            for record_id in sorted(unfinished):
+                record = unfinished[record_id]
+                messages.append(self._recover(record))
+
+                part_path = record.get("part")
+                if (part_path and os.path.exists(part_path)
+                        and os.path.exists(record["src"])):
+                    copies[part_path] = record["src"]
+
+            self._copies = set()
+            for part_path, src_path in sorted(copies.items()):
+                message = self._expire_copy(part_path, src_path)
+                if message:
+                    messages.append(message)
+                elif os.path.exists(part_path):
+                    self._copies.add(part_path)
+
+            # Start the new session with an empty journal, apart from
+            # the copies we're keeping
+            journal_dir = os.path.dirname(self.path)
+            if not os.path.isdir(journal_dir):
+                os.makedirs(journal_dir)
+
+            self._file = open(self.path, "w")
+            for part_path in sorted(self._copies):
+                self._file.write(json.dumps({"op": "copy",
+                                             "src": copies[part_path],
+                                             "part": part_path}) + "\n")
+            self._sync()
+
+        return messages
+
+    def sync(self):
+        """Make sure all records written so far have reached the disk."""
+
+        with self._lock:
+            if self._file:
+                self._sync()
+
+    # ------------------------------------------------------------------------
+
+    @staticmethod
+    def _expire_copy(part_path, src_path):
+        """Remove an unfinished copy that's too old to be worth keeping.
+
+        Returns a message if the copy was removed, or None if not.
+        """
+
+        try:
+            age = time.time() - os.path.getmtime(part_path)
+        except (OSError):
+            # Already gone
+            return None
+
+        if age < _COPY_MAX_AGE:
+            return None
+
+        try:
+            os.remove(part_path)
+            return ("Removed an old unfinished copy of {0} from {1}."
+                    .format(src_path, part_path))
+
+        except (OSError) as err:
+            return ("Could not remove an old unfinished copy of {0} "
+                    "from {1}: {2}"
+                    .format(src_path, part_path, err))
+
+    @staticmethod
+    def _recover(record):
+        """Deal with a rename that was started but never finished.
+
+        An unfinished move to another filesystem leaves its temporary
+        file in place, so renaming the file again picks up where the
+        copy left off. move_file() never leaves a partial file at the
+        destination itself, so if both paths exist, they're both the
+        user's files.
+        """
+
+        src_path = record["src"]
+        dst_path = record["dst"]
+
+        src_exists = os.path.exists(src_path)
+        dst_exists = os.path.exists(dst_path)
+
+        if src_exists and os.path.exists(record.get("part", "")):
+            # The move stopped partway through copying; the original is
+            # safe, so keep the copy to resume
+            return ("Kept an unfinished copy of {0} at {1}, which will be "
+                    "resumed if it's renamed to {2} again."
+                    .format(src_path, record["part"], dst_path))
+
+        # Older versions didn't record where they copied files to, and
+        # their copies can't be resumed
+        part_path = dst_path + ".part"
+
+        if (src_exists and "part" not in record
+                and os.path.exists(part_path)):
+            try:
+                os.remove(part_path)
+                return ("Removed an unfinished copy of {0} from {1}."
+                        .format(src_path, part_path))
+
+            except (OSError) as err:
+                return ("Could not remove an unfinished copy of {0} "
+                        "from {1}: {2}"
+                        .format(src_path, part_path, err))
+
+        elif dst_exists and not src_exists:
+            return "Finished renaming {0} to {1}.".format(src_path, dst_path)
+
+        elif src_exists and dst_exists:
+            # Either the rename finished and another file has since
+            # appeared at the old path, or a move finished copying but
+            # didn't get to delete the original; either way, don't
+            # touch anything
+            return ("Both {0} and {1} exist, so neither was changed."
+                    .format(src_path, dst_path))
+
+        elif src_exists:
+            return "{0} was not renamed.".format(src_path)
+
+        else:
+            return ("Could not find {0} or {1}."
+                    .format(src_path, dst_path))
+
+    def _sync(self):
+        """Flush the journal to disk. The caller must hold the lock."""
+
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def _write(self, record):
+        """Append a record to the journal."""
+
+        line = json.dumps(record) + "\n"
+
+        with self._lock:
+            if not self._file:
+                journal_dir = os.path.dirname(self.path)
+                if not os.path.isdir(journal_dir):
+                    os.makedirs(journal_dir)
+                self._file = open(self.path, "a")
+
+            self._file.write(line)
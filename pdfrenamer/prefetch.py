@@ -0,0 +1,175 @@
+"""Background rendering of documents the user is likely to view next."""
+
+import threading
+
+from .cache import image_size
+from .render import can_render
+
+
+__all__ = ["Prefetcher"]
+
+
+class Prefetcher(object):
+    """Render documents ahead of the viewer.
+
+    Jobs are created by calling create_job() with a document's path.
+    Usually this is the create_job() method of the viewer widget.
+
+    Call prefetch() with the paths the user is likely to view next,
+    most likely first. Jobs are rendered one at a time by a single
+    background thread so prefetching never competes with itself for
+    the CPU. Call take() to claim a job when its document is displayed.
+
+    Only the first page and page count of each document are rendered,
+    which is all the viewer needs to show it; the rest is rendered once
+    the job is taken. No more jobs are started while the pages already
+    rendered take up more than memory_limit bytes.
+
+    Only the most recent list of paths is kept. Jobs for documents
+    that are no longer wanted are canceled and their pages discarded.
+    """
+
+    def __init__(self, create_job, memory_limit=64 * 1024 * 1024):
+        """Return a new Prefetcher."""
+
+        # Factory function for rendering jobs
+        self._create_job = create_job
+
+        # Maximum size of the prefetched pages, in bytes
+        self.memory_limit = memory_limit
+
+        # Jobs by path, in the order they should be rendered
+        self._jobs = {}
+        self._order = []
+
+        # Used to wake up the rendering thread
+        self._condition = threading.Condition()
+
+        # Rendering thread; created on demand
+        self._thread = None
+
+    # ------------------------------------------------------------------------
+
+    def clear(self):
+        """Cancel and discard all prefetched documents."""
+
+        self.prefetch([])
+
+    def keep(self, paths):
+        """Cancel and discard prefetched documents not in paths.
+
+        Unlike prefetch(), this never starts rendering anything new,
+        which is what we want while the user is moving too quickly for
+        new documents to be worth rendering.
+        """
+
+        with self._condition:
+            for path in list(self._jobs):
+                if path not in paths:
+                    self._jobs.pop(path).cancel()
+
+            self._order = [path for path in self._order if path in self._jobs]
+            self._condition.notify()
+
+    def prefetch(self, paths):
+        """Render the specified documents in the background."""
+
+        paths = [path for path in paths if can_render(path)]
+
+        with self._condition:
+            jobs = {}
+
+            for path in paths:
+                job = self._jobs.pop(path, None)
+                new_job = self._create_job(path)
+
+                # Only render the first page until it's displayed
+                new_job.lazy = True
+
+                if self._usable(job, new_job.options):
+                    jobs[path] = job
+                else:
+                    jobs[path] = new_job
+
+                    if job:
+                        job.cancel()
+
+            # Cancel anything we no longer need
+            for job in self._jobs.values():
+                job.cancel()
+
+            self._jobs = jobs
+            self._order = paths
+
+            if paths and not self._thread:
+                self._thread = threading.Thread(target=self._run)
+                self._thread.daemon = True
+                self._thread.start()
+
+            self._condition.notify()
+
+    def take(self, path, **options):
+        """Claim the prefetched job for the specified path.
+
+        Returns a RenderJob if the document was prefetched with the
+        specified rendering options, or None otherwise. The job is
+        removed from the prefetch list; if it had not started yet, the
+        caller is responsible for starting it.
+        """
+
+        with self._condition:
+            job = self._jobs.pop(path, None)
+
+            if path in self._order:
+                self._order.remove(path)
+
+            # This may have made room for another job
+            self._condition.notify()
+
+        if self._usable(job, options):
+            if not options.get("lazy"):
+                job.render_all()
+            return job
+
+        elif job:
+            job.cancel()
+
+    # ------------------------------------------------------------------------
+
+    def _next_job(self):
+        """Return the next job to render, waiting if necessary."""
+
+        with self._condition:
+            while True:
+                if self._size() < self.memory_limit:
+                    for path in self._order:
+                        job = self._jobs[path]
+                        if not job.started:
+                            return job
+
+                self._condition.wait()
+
+    def _run(self):
+        """Render prefetched documents in the background."""
+
+        while True:
+            self._next_job().run()
+
+    def _size(self):
+        """Return the size of the prefetched pages, in bytes.
+
+        The caller must hold the lock.
+        """
+
+        return sum(image_size(image_data)
+                   for job in self._jobs.values()
+                   for image_data in list(job.pages.values()))
+
+    @staticmethod
+    def _usable(job, options):
+        """Return whether a prefetched job can be displayed."""
+
+        return (job is not None
+                and not job.canceled
+                and not job.error
+                and job.options == options)
@@ -0,0 +1,544 @@
+"""Core renaming functions.
+
+These are shared by the user interface and the batch renamer, and
+do not depend on Tk.
+"""
+
+import errno
+import hashlib
+import os
+import shutil
+import threading
+import time
+
+try:
+    # Python 3
+    import queue
+except (ImportError):
+    # Python 2
+    import Queue as queue
+
+
+__all__ = ["RenameRequest", "RenameWorker", "RenamerError",
+           "move_file", "new_path", "part_path"]
+
+
+# Amount of data to copy between filesystems at once
+_COPY_CHUNK_SIZE = 8 * 2**20
+
+# Amount of data at the end of a partial copy to check before resuming it
+_RESUME_CHECK_SIZE = 2**20
+
+
+def move_file(src_path, dst_path, progress=None, resume=False,
+              keep_part=False):
+    """Rename or move a file.
+
+    A file moved to another filesystem is copied to a temporary file
+    next to its destination, which is checked against the original
+    before the original is deleted. The temporary file's name is given
+    by part_path(), and a file that's already there is never touched
+    unless resume is True.
+
+    If resume is True, the caller knows an earlier move of this file
+    was interrupted, leaving the temporary file, and the copy picks up
+    where it left off. If keep_part is True, the temporary file is left
+    in place if the move fails, so it can be resumed later; otherwise
+    it's removed.
+
+    The progress argument is a function that is called periodically
+    during a copy with a stage ("copying" or "verifying"), the number
+    of bytes processed, and the total.
+
+    An existing file at the destination is never replaced.
+
+    Raises RenamerError if the file could not be renamed.
+    """
+
+    try:
+        try:
+            _rename_new(src_path, dst_path)
+
+        except (OSError) as err:
+            if err.errno != errno.EXDEV or not os.path.isfile(src_path):
+                raise
+
+            # The destination is on another filesystem
+            part = part_path(dst_path)
+            if not resume and os.path.lexists(part):
+                raise OSError(errno.EEXIST, "File already exists", part)
+
+            try:
+                _copy_file(src_path, part, progress, resume)
+                shutil.copystat(src_path, part)
+                _rename_new(part, dst_path)
+
+            except (Exception) as copy_err:
+                # Unless someone else's file got there first, anything at
+                # the temporary path is our unfinished copy
+                ours = not (isinstance(copy_err, OSError)
+                            and copy_err.errno == errno.EEXIST
+                            and copy_err.filename == part)
+
+                if ours and not keep_part:
+                    try:
+                        os.remove(part)
+                    except (OSError):
+                        pass
+
+                raise
+
+            os.remove(src_path)
+
+    except (Exception) as err:
+        # IOError, OSError, and maybe shutil.Error are the most likely
+        # exceptions, but we may as well catch them all so this will fail
+        # gracefully if someone ever finds a weird corner case.
+        raise RenamerError("Could not rename:\n"
+                           "{0}\n"
+                           "\n"
+                           "{1}"
+                           .format(src_path, err))
+
+
+def part_path(dst_path):
+    """Return the temporary path for a file being moved to dst_path.
+
+    The name is hidden and specific to this program, so it's unlikely
+    to belong to anyone else.
+    """
+
+    dst_dir, dst_name = os.path.split(dst_path)
+    return os.path.join(dst_dir, ".{0}.pdfrenamer-part".format(dst_name))
+
+
+def new_path(src_path, dst_base, dst_dir=None, exists=os.path.exists):
+    """Return the new path for a file.
+
+    The dst_base argument is the file's new basename, minus the
+    extension; the file keeps its original extension. If dst_dir is
+    specified, the new path is in that directory. Otherwise, it is in
+    the same directory as the original file.
+
+    The exists argument is a function used to check whether a file
+    already exists at the new path.
+
+    Raises RenamerError if dst_base is empty or the new path is taken.
+    """
+
+    if not dst_base:
+        raise RenamerError("Please enter a new name for this file.")
+
+    # Separate the dirname and basename
+    src_dir, src_base = os.path.split(src_path)
+
+    # Separate the basename and extension
+    src_base, ext = os.path.splitext(src_base)
+
+    # Identify the destination directory
+    if not dst_dir:
+        dst_dir = src_dir
+
+    # Reconstruct the filename using the new basename
+    dst_path = os.path.join(dst_dir, dst_base + ext)
+
+    # Sanity check: Make sure there's no existing file with this name
+    if src_path != dst_path and exists(dst_path):
+        raise RenamerError("File already exists:\n"
+                           "{0}"
+                           .format(dst_path))
+
+    return dst_path
+
+
+def _copy_chunk(src_fd, dst_fd, offset, count, methods):
+    """Copy part of a file, returning the number of bytes copied.
+
+    The methods argument is a list of the copy methods to try, which
+    is updated to remove any the system turns out not to support.
+    """
+
+    while methods[0] != "read":
+        method = methods[0]
+        try:
+            if method == "copy_file_range":
+                # Let the kernel (or the file server) copy the data
+                return os.copy_file_range(src_fd, dst_fd, count,
+                                          offset, offset)
+
+            elif method == "sendfile":
+                # Copies without passing the data through Python
+                os.lseek(dst_fd, offset, os.SEEK_SET)
+                return os.sendfile(dst_fd, src_fd, offset, count)
+
+        except (OSError) as err:
+            if err.errno not in (errno.EXDEV, errno.EINVAL, errno.ENOSYS,
+                                 errno.EOPNOTSUPP, errno.ENOTSOCK):
+                raise
+
+            # Not supported between these filesystems; try the next method
+            methods.pop(0)
+
+    os.lseek(src_fd, offset, os.SEEK_SET)
+    os.lseek(dst_fd, offset, os.SEEK_SET)
+    data = os.read(src_fd, count)
+
+    written = 0
+    while written < len(data):
+        written += os.write(dst_fd, data[written:])
+
+    return len(data)
+
+
+def _copy_file(src_path, dst_path, progress=None, resume=False):
+    """Copy a file's data to a new file.
+
+    If resume is True, dst_path is an earlier, unfinished copy, which is
+    continued if it matches the original so far. Otherwise, dst_path
+    must not exist yet.
+
+    Raises RenamerError if the copy does not match the original.
+    """
+
+    methods = [method for method in ("copy_file_range", "sendfile")
+               if hasattr(os, method)]
+    methods.append("read")
+
+    total = os.path.getsize(src_path)
+    offset = _resume_offset(src_path, dst_path, total) if resume else 0
+
+    flags = os.O_WRONLY | os.O_CREAT | getattr(os, "O_BINARY", 0)
+    if not resume:
+        # Never write to a file we didn't create
+        flags |= os.O_EXCL
+
+    src_fd = os.open(src_path, os.O_RDONLY | getattr(os, "O_BINARY", 0))
+    try:
+        dst_fd = os.open(dst_path, flags, 0o666)
+        try:
+            # Discard anything past the part we're keeping
+            os.ftruncate(dst_fd, offset)
+
+            while offset < total:
+                count = min(_COPY_CHUNK_SIZE, total - offset)
+                copied = _copy_chunk(src_fd, dst_fd, offset, count, methods)
+                if not copied:
+                    # The source got shorter while we were copying it
+                    break
+
+                offset += copied
+                if progress:
+                    progress("copying", offset, total)
+
+            os.fsync(dst_fd)
+
+            if hasattr(os, "posix_fadvise"):
+                # Make sure we verify what's on the disk, not what's
+                # still in memory from the copy
+                os.posix_fadvise(dst_fd, 0, 0, os.POSIX_FADV_DONTNEED)
+
+        finally:
+            os.close(dst_fd)
+    finally:
+        os.close(src_fd)
+
+    # Check the copy before the caller deletes the original
+    def verify_progress(done):
+        if progress:
+            progress("verifying", done, 2 * total)
+
+    src_hash = _file_hash(src_path, verify_progress)
+    dst_hash = _file_hash(dst_path,
+                          lambda done: verify_progress(total + done))
+
+    if src_hash != dst_hash:
+        os.remove(dst_path)
+        raise RenamerError("The copy did not match the original:\n"
+                           "{0}"
+                           .format(src_path))
+
+
+def _file_hash(path, progress=None, start=0, end=None):
+    """Return a hash of the contents of a file.
+
+    If start or end is specified, only that part of the file is hashed.
+    The progress argument is a function that is called periodically
+    with the number of bytes hashed so far.
+    """
+
+    h = hashlib.sha1()
+
+    with open(path, "rb") as f:
+        f.seek(start)
+        done = 0
+        remaining = end - start if end is not None else None
+
+        while remaining is None or remaining > 0:
+            size = _COPY_CHUNK_SIZE
+            if remaining is not None:
+                size = min(size, remaining)
+                remaining -= size
+
+            data = f.read(size)
+            if not data:
+                break
+
+            h.update(data)
+            done += len(data)
+            if progress:
+                progress(done)
+
+    return h.digest()
+
+
+def _rename_new(src_path, dst_path):
+    """Rename a file to a path that must not exist yet.
+
+    Where hard links are supported, the file is linked to its new path,
+    which fails if something is already there, then unlinked from its
+    old one. Otherwise, the best we can do is check just before
+    renaming it.
+    """
+
+    link = getattr(os, "link", None)
+
+    try:
+        if not link:
+            raise OSError(errno.ENOSYS, "Hard links are not supported")
+        link(src_path, dst_path)
+
+    except (OSError) as err:
+        if err.errno == errno.EXDEV:
+            raise
+
+        if os.path.lexists(dst_path):
+            if (err.errno != errno.EEXIST
+                    or not os.path.samefile(src_path, dst_path)):
+                raise OSError(errno.EEXIST, "File already exists", dst_path)
+
+            # The new path only differs in case on a filesystem that
+            # ignores case, so it's the same file
+            os.rename(src_path, dst_path)
+
+        else:
+            # Hard links aren't supported here
+            os.rename(src_path, dst_path)
+
+    else:
+        os.unlink(src_path)
+
+
+def _resume_offset(src_path, part_path, total):
+    """Return how much of an earlier copy can be kept, in bytes."""
+
+    try:
+        size = os.path.getsize(part_path)
+    except (OSError):
+        return 0
+
+    if size > total:
+        return 0
+
+    # The end of an interrupted copy is the part most likely to be wrong,
+    # so that's what we check; the whole file is verified at the end
+    start = max(0, size - _RESUME_CHECK_SIZE)
+    if (_file_hash(src_path, start=start, end=size)
+            != _file_hash(part_path, start=start, end=size)):
+        return 0
+
+    return size
+
+
+class RenameRequest(object):
+    """A file to be renamed by a RenameWorker.
+
+    The action is a string the caller can use to tell what kind of
+    rename this is, such as "undo" or "redo"; the worker ignores it.
+
+    While a file is being copied to another filesystem, progress is a
+    (stage, done, total) tuple as passed by move_file(); otherwise it
+    is None.
+
+    Once the request has been processed, error is None if the file was
+    renamed successfully, or a RenamerError otherwise.
+
+    The submitted, started, and finished attributes record when the
+    request was made, and when the worker started and finished it, as
+    returned by time.time().
+    """
+
+    __slots__ = ["src_path", "dst_path", "part_path", "action", "error",
+                 "journal_id", "progress", "submitted", "started",
+                 "finished"]
+
+    def __init__(self, src_path, dst_path, action="rename"):
+        """Return a new RenameRequest."""
+
+        self.src_path = src_path
+        self.dst_path = dst_path
+        self.action = action
+        self.error = None
+
+        # Where the file is copied if it's moved to another filesystem
+        self.part_path = part_path(dst_path)
+
+        # Assigned by the RenameJournal
+        self.journal_id = None
+
+        # Updated by the worker thread
+        self.progress = None
+
+        self.submitted = time.time()
+        self.started = None
+        self.finished = None
+
+
+class RenameWorker(object):
+    """Rename files in a background thread.
+
+    Moving a file to another filesystem means copying it, which can
+    take a long time. Requests are processed one at a time, in the
+    order they were submitted, and each one is put on the results
+    queue once it is done. The user interface thread should poll
+    the results queue rather than waiting on it.
+
+    If a RenameJournal is specified, each rename is recorded in it
+    before the file is touched. Requests that are waiting together
+    share a single sync of the journal, so renaming many files in a
+    row doesn't wait on the disk for each one.
+    """
+
+    def __init__(self, journal=None):
+        """Return a new RenameWorker."""
+
+        self.journal = journal
+
+        # Requests waiting to be processed
+        self.requests = queue.Queue()
+
+        # Requests that have been processed
+        self.results = queue.Queue()
+
+        # Created on demand
+        self._thread = None
+
+    # ------------------------------------------------------------------------
+
+    def stop(self):
+        """Finish processing requests and stop the worker thread."""
+
+        if self._thread:
+            self.requests.put(None)
+            self._thread.join()
+            self._thread = None
+
+    def submit(self, src_path, dst_path, action="rename"):
+        """Rename a file in the background.
+
+        Returns the RenameRequest for this file.
+        """
+
+        request = RenameRequest(src_path, dst_path, action)
+        self.requests.put(request)
+
+        if not self._thread:
+            self._thread = threading.Thread(target=self._run)
+            self._thread.daemon = True
+            self._thread.start()
+
+        return request
+
+    # ------------------------------------------------------------------------
+
+    def _run(self):
+        """Process requests until told to stop."""
+
+        journal = self.journal
+        stopping = False
+
+        while not stopping:
+            # Take every request that's waiting so they can share a sync
+            batch = [self.requests.get()]
+            try:
+                while batch[-1] is not None:
+                    batch.append(self.requests.get_nowait())
+            except (queue.Empty):
+                pass
+
+            if batch[-1] is None:
+                # A None value indicates we can stop
+                batch.pop()
+                stopping = True
+
+            started = time.time()
+            for request in batch:
+                request.started = started
+
+            if journal:
+                try:
+                    for request in batch:
+                        journal.begin(request)
+                    journal.sync()
+
+                except (Exception) as err:
+                    # Without a record of these renames, they couldn't
+                    # be recovered if we crashed partway through, so
+                    # don't touch the files
+                    for request in batch:
+                        request.error = RenamerError(
+                            "Could not rename {0} because the rename "
+                            "could not be recorded in the journal: {1}"
+                            .format(request.src_path, err))
+                        request.finished = time.time()
+                        self.results.put(request)
+                    continue
+
+            for request in batch:
+                def progress(stage, done, total, request=request):
+                    request.progress = stage, done, total
+
+                # With a journal, an unfinished copy can be resumed
+                # later, since the journal records that it's ours
+                resume = bool(journal
+                              and journal.has_copy(request.part_path))
+
+                try:
+                    move_file(request.src_path, request.dst_path, progress,
+                              resume=resume, keep_part=bool(journal))
+
+                except (RenamerError) as err:
+                    request.error = err
+
+                request.progress = None
+
+                if journal:
+                    try:
+                        if request.error:
+                            journal.abort(request)
+                        else:
+                            journal.commit(request)
+
+                        # Make sure the outcome is on disk before anything
+                        # else can happen to these paths
+                        journal.sync()
+
+                    except (Exception):
+                        # The file is where it's going to stay either
+                        # way, and recovering it next time only finds
+                        # out which
+                        pass
+
+                request.finished = time.time()
+                self.results.put(request)
+
+        if journal:
+            try:
+                journal.sync()
+            except (Exception):
+                pass
+
+
+class RenamerError(Exception):
+    """Exception representing an error message during a rename operation."""
+
+    pass
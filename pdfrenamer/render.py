@@ -0,0 +1,605 @@
+"""Support for rendering documents in the background.
+
+tkDocViewer renders each document in a thread of its own, which is
+started by display_file() and forgotten once the document is on the
+canvas. This module splits that work into a RenderJob object that can
+be created ahead of time, rendered by any thread, and then handed to
+the viewer widget for display.
+"""
+
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from tkdocviewer.backends import (AutoBackend, BACKENDS_BY_EXTENSION,
+                                  GhostscriptBackend, gs_dpi)
+
+from .cache import PageCache, file_identity
+from .frames import FrameBackend, is_frame_image
+from .gspool import PoolError, PooledGhostscriptBackend
+
+
+__all__ = ["PREVIEW_SCALE", "RenderJob", "can_render"]
+
+
+# The quick preview of a document's first page is rendered at this
+# fraction of the normal resolution, and zoomed by this much to display
+PREVIEW_SCALE = 2
+
+
+def can_render(path):
+    """Return whether the specified file is rendered by a backend.
+
+    Only these file types are slow enough to be worth rendering
+    ahead of time; images and plain text are displayed directly by
+    the viewer widget.
+    """
+
+    base, ext = os.path.splitext(path)
+    return ext.lower() in BACKENDS_BY_EXTENSION
+
+
+class RenderJob(object):
+    """Rendering operation for a single document.
+
+    The rendered pages are collected in the pages dict, keyed by page
+    number, as they become available. The viewer polls this dict from
+    the user interface thread, so the rendering thread never touches
+    Tk itself.
+
+    A job renders at most once. Calling run() or start() on a job that
+    is already running or finished has no effect.
+
+    Call start_preview() to render a quick, low-resolution version of
+    the first page alongside the job, which can be displayed until the
+    real first page is ready.
+
+    Pages passed to request() are rendered before any others. A lazy
+    job renders only the first page and the pages that are requested,
+    and finishes once it runs out of requests; requesting more pages
+    afterward starts it again in a new background thread.
+
+    If a PageCache is specified, pages are looked up there before they
+    are rendered, and stored there afterward. A document whose pages
+    are all in the cache is displayed without starting a backend.
+
+    If a DiskCache is specified, the first page and page count are also
+    looked up and stored there, so single-page documents that were
+    rendered in an earlier session are displayed without a backend.
+
+    If a GhostscriptPool is specified, PDF files are rendered by its
+    processes instead of starting Ghostscript for each page.
+
+    Multi-frame images like GIF and TIFF are always rendered lazily,
+    since an animation or a long fax can have hundreds of frames. Their
+    frames are decoded one at a time by a FrameBackend.
+
+    Long PDF and PostScript documents are rendered by up to workers
+    threads at once, each running its own Ghostscript process. Pages
+    are handed out in order, and still appear in the pages dict as
+    soon as they're done, so the viewer has to put them back in order.
+
+    Keyword arguments:
+    enable_downscaling -- forwarded to the rendering backend.
+    fit_size -- the size of the viewer the pages are displayed in.
+      This is part of the cache key, but does not affect rendering.
+    lazy -- whether to render only the first page and requested pages.
+    workers -- the number of pages of a long document to render at once.
+      This does not affect the rendered pages.
+    """
+
+    # Documents with fewer pages than this are rendered one page at a time
+    parallel_threshold = 8
+
+    __slots__ = ["path", "cache", "disk_cache", "pool", "workers",
+                 "enable_downscaling", "fit_size", "lazy", "_lazy_option",
+                 "page_count", "pages", "preview", "error",
+                 "canceler", "finished",
+                 "_active", "_backend", "_cache_checked", "_claimed", "_cursor",
+                 "_disk_variant", "_first_page_cached", "_identity", "_lock",
+                 "_running", "_started", "_wanted"]
+
+    def __init__(self, path, cache=None, disk_cache=None, pool=None,
+                 enable_downscaling=False, fit_size=None, lazy=False,
+                 workers=1):
+        """Return a new rendering job."""
+
+        # The document to render
+        self.path = path
+
+        # Caches of rendered pages, shared between jobs
+        self.cache = cache
+        self.disk_cache = disk_cache
+
+        # Ghostscript processes, shared between jobs
+        self.pool = pool
+
+        # Maximum number of threads rendering at once
+        self.workers = max(1, workers)
+
+        # Rendering options
+        self.enable_downscaling = enable_downscaling
+        self.fit_size = fit_size
+        self.lazy = lazy or is_frame_image(path)
+
+        # The lazy option as specified, which is what a viewer compares
+        # its own options against
+        self._lazy_option = lazy
+
+        # The number of pages in the document, once known
+        self.page_count = None
+
+        # Rendered image data, by page number
+        self.pages = {}
+
+        # Low-resolution image data for the first page, if rendered
+        self.preview = None
+
+        # Error message if rendering failed
+        self.error = None
+
+        # Set to abort rendering, or once rendering has stopped
+        self.canceler = threading.Event()
+        self.finished = threading.Event()
+
+        # Used to ensure the job is only rendered once
+        self._lock = threading.Lock()
+        self._started = False
+
+        # Pages to render before any others, guarded by the lock
+        self._wanted = []
+
+        # Pages that have been handed to a rendering thread
+        self._claimed = set()
+
+        # The first page that might not have been handed out yet
+        self._cursor = 1
+
+        # Whether any threads are rendering pages, and how many
+        self._running = False
+        self._active = 0
+
+        # Set once run() has looked for the first page in the caches,
+        # and whether it found it there
+        self._cache_checked = threading.Event()
+        self._first_page_cached = False
+
+        # Set up by run() for rendering pages
+        self._backend = None
+        self._disk_variant = None
+        self._identity = None
+
+    # ------------------------------------------------------------------------
+
+    def cancel(self):
+        """Stop rendering after the current page."""
+
+        self.canceler.set()
+
+    def render_all(self):
+        """Render every page, even though the job was started lazily.
+
+        Prefetched documents are only rendered up to their first page,
+        and this renders the rest once one is displayed. Multi-frame
+        images are still rendered lazily.
+        """
+
+        with self._lock:
+            if not self.lazy or is_frame_image(self.path):
+                return
+
+            self.lazy = False
+
+            restart = (self._started
+                       and not self._running
+                       and self.page_count is not None
+                       and len(self.pages) < self.page_count
+                       and not self.canceler.is_set()
+                       and not self.error)
+
+            if restart:
+                self._running = True
+                self._active = 1
+                self.finished.clear()
+
+        if restart:
+            thread = threading.Thread(target=self._render_pages)
+            thread.daemon = True
+            thread.start()
+
+    def request(self, pages):
+        """Render the specified pages next, in the order given.
+
+        This replaces any earlier request. A lazy job that has already
+        finished is started again to render the requested pages.
+        """
+
+        with self._lock:
+            self._wanted = [page for page in pages if page not in self.pages]
+
+            restart = (self.lazy
+                       and self._started
+                       and not self._running
+                       and self._wanted
+                       and not self.canceler.is_set()
+                       and not self.error)
+
+            if restart:
+                self._running = True
+                self._active = 1
+                self.finished.clear()
+
+        if restart:
+            thread = threading.Thread(target=self._render_worker)
+            thread.daemon = True
+            thread.start()
+
+    def run(self):
+        """Render the document in the calling thread."""
+
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+            self._running = True
+            self._active = 1
+
+        try:
+            if not os.path.isfile(self.path):
+                raise IOError("File does not exist: {0}".format(self.path))
+
+            # Without a cache, every lookup simply misses
+            if self.cache is None:
+                self.cache = PageCache(memory_limit=0)
+            cache = self.cache
+
+            # Cached pages stay valid if the file is renamed
+            identity = self._identity = file_identity(self.path)
+
+            if self.enable_downscaling:
+                disk_variant = self._disk_variant = "page1-downscaled"
+            else:
+                disk_variant = self._disk_variant = "page1"
+
+            self.page_count = cache.get((identity, "page_count"))
+
+            if self.page_count is None and self.disk_cache is not None:
+                entry = self.disk_cache.get(self.path, identity, disk_variant)
+                if entry:
+                    # Use the first page from the disk cache
+                    self.page_count, image_data = entry
+                    cache.put((identity, "page_count"), self.page_count, 0)
+                    cache.put(self._page_key(1), image_data)
+
+            self._first_page_cached = (self.page_count is not None
+                                       and self._page_key(1) in cache)
+            self._cache_checked.set()
+
+            if self.page_count is None:
+                self._backend = self._create_backend()
+                self.page_count = self._backend.page_count()
+                cache.put((identity, "page_count"), self.page_count, 0)
+
+        except (Exception) as err:
+            # Forward the error message to the user interface thread
+            self.error = str(err)
+            self._cache_checked.set()
+
+            with self._lock:
+                self._stop_worker()
+
+        else:
+            self._render_pages()
+
+    def start(self):
+        """Render the document in a new background thread."""
+
+        thread = threading.Thread(target=self.run)
+        thread.daemon = True
+        thread.start()
+
+        return self
+
+    def start_preview(self, budget):
+        """Render a quick preview of the first page in the background.
+
+        This only applies to PDF files, which are slow to render. The
+        preview is given up if it takes longer than budget seconds, if
+        the job is canceled, or if the real first page is ready first.
+        It isn't rendered at all if the first page is in the cache, or
+        if the job isn't running.
+
+        If the GhostscriptPool has a process to spare, the preview is
+        rendered by the pool rather than a new Ghostscript process.
+        """
+
+        base, ext = os.path.splitext(self.path)
+
+        if (ext.lower() == ".pdf"
+                and GhostscriptBackend.executable()
+                and 1 not in self.pages):
+            thread = threading.Thread(target=self._render_preview,
+                                      args=(budget,))
+            thread.daemon = True
+            thread.start()
+
+    # ------------------------------------------------------------------------
+
+    def _create_backend(self):
+        """Return a backend to render the document."""
+
+        base, ext = os.path.splitext(self.path)
+
+        if self.pool is not None and self.pool.size and ext.lower() == ".pdf":
+            return PooledGhostscriptBackend(
+                self.path, self.pool,
+                enable_downscaling=self.enable_downscaling)
+
+        if is_frame_image(self.path):
+            return FrameBackend(self.path,
+                                enable_downscaling=self.enable_downscaling)
+
+        return AutoBackend(self.path,
+                           enable_downscaling=self.enable_downscaling)
+
+    def _next_page(self):
+        """Return the next page to render, or None if there is none.
+
+        If there is none, the calling thread should stop rendering. Once
+        every thread has stopped, the job is marked as finished.
+        """
+
+        with self._lock:
+            page = None
+
+            if self.canceler.is_set() or self.error:
+                pass
+
+            elif 1 not in self._claimed:
+                # The first page is always rendered, and always first
+                page = 1
+
+            else:
+                while self._wanted and page is None:
+                    page = self._wanted.pop(0)
+                    if (page in self._claimed
+                            or not 1 <= page <= self.page_count):
+                        page = None
+
+                if page is None and not self.lazy:
+                    while self._cursor in self._claimed:
+                        self._cursor += 1
+                    if self._cursor <= self.page_count:
+                        page = self._cursor
+
+            if page is None:
+                self._stop_worker()
+            else:
+                self._claimed.add(page)
+
+            return page
+
+    def _page_key(self, page):
+        """Return the cache key for the specified page."""
+
+        return self._identity, self.enable_downscaling, self.fit_size, page
+
+    def _render_preview(self, budget):
+        """Render the preview of the first page."""
+
+        deadline = time.time() + budget
+
+        # A page from the cache is ready long before any preview
+        if (not self._cache_checked.wait(budget)
+                or self._first_page_cached
+                or self.canceler.is_set()
+                or self.error):
+            return
+
+        pool = self.pool
+        if pool is not None and pool.available > 1:
+            # Leave a process for the first page itself. The pool can't
+            # stop a job partway, so a late preview is just dropped.
+            try:
+                preview = pool.render_page(self.path, 1,
+                                           gs_dpi // PREVIEW_SCALE)
+            except (PoolError):
+                return
+
+            if (1 not in self.pages
+                    and not self.canceler.is_set()
+                    and time.time() <= deadline):
+                self.preview = preview
+            return
+
+        fd, preview_path = tempfile.mkstemp(suffix=".ppm")
+        os.close(fd)
+
+        # Ghostscript writes to a file so we never have to wait on a pipe
+        gs_args = [GhostscriptBackend.executable(),
+                   "-q",
+                   "-r{0}".format(gs_dpi // PREVIEW_SCALE),
+                   "-dBATCH",
+                   "-dNOPAUSE",
+                   "-dNOSAFER",
+                   "-dTextAlphaBits=4",
+                   "-dGraphicsAlphaBits=4",
+                   "-dFirstPage=1",
+                   "-dLastPage=1",
+                   "-sDEVICE=ppmraw",
+                   "-sOutputFile={0}".format(preview_path),
+                   self.path]
+
+        subprocess_kw = {}
+        if sys.platform.startswith("win"):
+            # Hide the console window when running under pythonw.exe
+            si = subprocess.STARTUPINFO()
+            si.dwFlags |= subprocess.STARTF_USESHOWWINDOW
+            si.wShowWindow = subprocess.SW_HIDE
+            subprocess_kw["startupinfo"] = si
+
+        try:
+            with open(os.devnull, "r+b") as devnull:
+                proc = subprocess.Popen(gs_args,
+                                        stdin=devnull,
+                                        stdout=devnull,
+                                        stderr=devnull,
+                                        **subprocess_kw)
+
+            while proc.poll() is None:
+                if (self.canceler.is_set()
+                        or 1 in self.pages
+                        or time.time() > deadline):
+                    # The preview would no longer be of any use
+                    proc.kill()
+                    proc.wait()
+                    return
+
+                time.sleep(0.01)
+
+            if proc.returncode == 0 and 1 not in self.pages:
+                with open(preview_path, "rb") as preview_file:
+                    self.preview = preview_file.read()
+
+        except (Exception):
+            # The preview is only a convenience, so never mind
+            pass
+
+        finally:
+            try:
+                os.remove(preview_path)
+            except (OSError):
+                pass
+
+    def _render_pages(self):
+        """Render the document's pages using one or more threads."""
+
+        base, ext = os.path.splitext(self.path)
+
+        threads = 1
+        if (not self.lazy
+                and ext.lower() in (".pdf", ".ps")
+                and self.page_count >= self.parallel_threshold):
+            threads = min(self.workers, self.page_count)
+
+        if threads > 1:
+            try:
+                # The threads share a backend, so create it up front
+                # (Ghostscript backends don't keep any state per page)
+                if not self._backend:
+                    self._backend = self._create_backend()
+
+            except (Exception):
+                # Let a single thread run into the error and report it
+                threads = 1
+
+        with self._lock:
+            self._active = threads
+
+        for i in range(threads - 1):
+            thread = threading.Thread(target=self._render_worker)
+            thread.daemon = True
+            thread.start()
+
+        self._render_worker()
+
+    def _render_worker(self):
+        """Render pages until there are none left to render."""
+
+        cache = self.cache
+
+        try:
+            while True:
+                page = self._next_page()
+                if page is None:
+                    break
+
+                image_data = cache.get(self._page_key(page))
+
+                if image_data is None:
+                    if not self._backend:
+                        # Created on demand since Ghostscript is slow to start
+                        self._backend = self._create_backend()
+                    image_data = self._backend.render_page(page)
+                    cache.put(self._page_key(page), image_data)
+                    self.pages[page] = image_data
+
+                    # Storing the page hashes the whole file, so only
+                    # do that once the page can be displayed
+                    if page == 1 and self.disk_cache is not None:
+                        self.disk_cache.put(self.path, self._identity,
+                                            self._disk_variant,
+                                            self.page_count, image_data)
+
+                else:
+                    self.pages[page] = image_data
+
+        except (Exception) as err:
+            # Forward the error message to the user interface thread
+            self.error = str(err)
+
+            with self._lock:
+                self._stop_worker()
+
+    def _stop_worker(self):
+        """Note that a rendering thread has stopped.
+
+        The caller must hold the lock.
+        """
+
+        self._active -= 1
+
+        if self._active <= 0:
+            self._active = 0
+            self._running = False
+
+            # Don't hold the file open while nothing is being rendered,
+            # so it can be renamed
+            close = getattr(self._backend, "close", None)
+            if close:
+                close()
+
+            self.finished.set()
+
+    # ------------------------------------------------------------------------
+
+    @property
+    def canceled(self):
+        """Whether rendering was canceled."""
+
+        return self.canceler.is_set()
+
+    @property
+    def complete(self):
+        """Whether every page of the document was rendered successfully."""
+
+        return (self.finished.is_set()
+                and not self.error
+                and self.page_count is not None
+                and len(self.pages) == self.page_count)
+
+    @property
+    def identity(self):
+        """The file_identity() of the file when rendering started.
+
+        This is None until the job has started running.
+        """
+
+        return self._identity
+
+    @property
+    def options(self):
+        """The rendering options for this job, as a dict."""
+
+        return {"enable_downscaling": self.enable_downscaling,
+                "fit_size": self.fit_size,
+                "lazy": self._lazy_option}
+
+    @property
+    def started(self):
+        """Whether rendering has started."""
+
+        return self._started
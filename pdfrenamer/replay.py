@@ -0,0 +1,560 @@
+"""Recording and replaying sessions for latency regression testing.
+
+Run the program with --record-session FILE to record the actions taken
+in its window, such as opening files, moving through them, and
+renaming them. Replay the session with
+
+    python -m pdfrenamer.replay FILE
+
+which runs each action again in a fresh window, times it, and reports
+the distribution of latencies for each kind of action as JSON. If
+there is no display, the session is replayed on a virtual one using
+Xvfb.
+
+Each action is timed from when it is called until the window is idle
+again: no file is waiting to be displayed, the viewer has finished
+rendering, no renames are waiting to finish, and no folder is being
+scanned. If a document finishes
+rendering along the way, the time of its <<DocumentFinished>> event is
+used, which isn't affected by how often we check.
+
+Dialog boxes are answered automatically during replay, and their
+messages are included in the report.
+"""
+
+import argparse
+import json
+import math
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from . import config
+from .util import find_executable
+
+
+__all__ = ["VirtualDisplay", "percentile", "read_session", "recording",
+           "replay_session", "wait_until_idle", "main"]
+
+
+def _no_args(args):
+    return []
+
+
+def _first_arg(args):
+    return list(args[:1])
+
+
+# Methods that are recorded, with a function returning the arguments to
+# record from those passed to each; events aren't saved, but a reload
+# with an event is a forced one, so that's recorded as an argument
+_RECORDED = {
+    "close_file": _no_args,
+    "go_next": _no_args,
+    "go_previous": _no_args,
+    "open": list,
+    "open_dir": _first_arg,
+    "redo_rename": _no_args,
+    "reload": lambda args: [True] if args and args[0] else [],
+    "rename": _no_args,
+    "rename_and_go_next": _no_args,
+    "undo_rename": _no_args,
+    "_preview": _first_arg,
+}
+
+# Names used in the session file for methods that are private
+_ACTION_NAMES = {"_preview": "select"}
+
+# Actions that use the name in the filename entry, which is recorded
+# just before them
+_NAMED_ACTIONS = frozenset(["rename", "rename_and_go_next"])
+
+# Actions whose arguments are paths
+_PATH_ACTIONS = frozenset(["open", "open_dir"])
+
+# Identifies a session file
+_FORMAT = "pdfrenamer-session"
+
+
+def percentile(values, p):
+    """Return the p-th percentile of a sorted list, by nearest rank."""
+
+    if not values:
+        return None
+
+    rank = int(math.ceil(p / 100.0 * len(values)))
+    return values[min(len(values), max(1, rank)) - 1]
+
+
+def read_session(path):
+    """Return the actions in a session file.
+
+    Each action is returned as a (time, name, args) tuple, where time
+    is when it happened, in seconds since the session started.
+    """
+
+    actions = []
+
+    with open(path, "r") as session_file:
+        try:
+            header = json.loads(session_file.readline())
+        except (ValueError):
+            header = None
+
+        if not isinstance(header, dict) or header.get("format") != _FORMAT:
+            raise ValueError("Not a recorded session: {0}".format(path))
+
+        for line in session_file:
+            try:
+                record = json.loads(line)
+            except (ValueError):
+                # The last line may have been cut short
+                continue
+
+            actions.append((record["t"], record["action"], record["args"]))
+
+    return actions
+
+
+def recording(cls, path):
+    """Return a subclass of a PDFRenamer class that records its actions.
+
+    Actions are written to the session file at path. Actions taken by
+    other actions, like the select that goes with go_next, aren't
+    recorded, since they'll happen again on replay.
+    """
+
+    writer = _SessionWriter(path)
+
+    def wrap(name, get_args):
+        method = getattr(cls, name)
+        action = _ACTION_NAMES.get(name, name)
+
+        def wrapper(self, *args, **kw):
+            if not writer.depth:
+                if action in _NAMED_ACTIONS:
+                    writer.write("set_name", [self._new_name.get()])
+
+                action_args = get_args(args)
+                if action in _PATH_ACTIONS:
+                    action_args = [os.path.abspath(p) for p in action_args]
+                writer.write(action, action_args)
+
+            writer.depth += 1
+            try:
+                return method(self, *args, **kw)
+            finally:
+                writer.depth -= 1
+
+        wrapper.__name__ = name
+        wrapper.__doc__ = method.__doc__
+        return wrapper
+
+    members = dict((name, wrap(name, get_args))
+                   for name, get_args in _RECORDED.items())
+
+    return type("Recording" + cls.__name__, (cls,), members)
+
+
+def replay_session(actions, path_map=None, real_time=False, timeout=60.0):
+    """Replay a session in a new window.
+
+    The actions argument is a list as returned by read_session(). Paths
+    starting with a key in path_map are changed to start with its value
+    instead. If real_time is True, actions are spaced out as they were
+    recorded, giving background tasks like prefetching the same time to
+    work; otherwise each starts as soon as the last one is done.
+
+    Returns a (latencies, timeouts, dialogs) tuple, where latencies is a
+    list of (action, seconds) pairs, timeouts is a list of the actions
+    that didn't finish in time, and dialogs is a list of the messages
+    that would have been shown in dialog boxes.
+    """
+
+    try:
+        # Python 3
+        from tkinter import Tk
+    except (ImportError):
+        # Python 2
+        from Tkinter import Tk
+
+    from . import ui
+
+    latencies = []
+    timeouts = []
+    dialogs = []
+
+    def answer_dialog(title, message, **kw):
+        dialogs.append("{0}: {1}".format(title, message))
+
+    saved_dialogs = ui.showerror, ui.showwarning
+    ui.showerror = ui.showwarning = answer_dialog
+
+    try:
+        root = Tk()
+        renamer = ui.PDFRenamer(root)
+        renamer.pack(side="top", expand=1, fill="both")
+
+        # Note when each document finishes rendering, and whether a
+        # rename or scan was still running at the time
+        finished = []
+
+        def document_finished(event):
+            busy = bool(renamer._pending_renames or renamer._scanner)
+            finished.append((time.time(), busy))
+
+        renamer.viewer.bind("<<DocumentFinished>>", document_finished,
+                            add="+")
+
+        if not wait_until_idle(renamer, timeout):
+            timeouts.append("startup")
+
+        replay_started = time.time()
+
+        for t, action, args in actions:
+            if real_time:
+                # Let background tasks work until the action is due
+                while time.time() < replay_started + t:
+                    renamer.update()
+                    time.sleep(0.005)
+
+            if action in _PATH_ACTIONS and path_map:
+                args = [_map_path(p, path_map) for p in args]
+
+            del finished[:]
+            started = time.time()
+
+            if action == "set_name":
+                renamer._new_name.set(*args)
+            else:
+                method = dict((v, k) for k, v in _ACTION_NAMES.items())
+                getattr(renamer, method.get(action, action))(*args)
+
+            if wait_until_idle(renamer, timeout):
+                # The action isn't done until the last document has been
+                # displayed and any rename or scan it started has
+                # finished, so only time it by the document if nothing
+                # else was running then
+                done = time.time()
+                if finished and not finished[-1][1]:
+                    done = finished[-1][0]
+                latencies.append((action, done - started))
+            else:
+                timeouts.append(action)
+
+        renamer.close_window()
+
+    finally:
+        ui.showerror, ui.showwarning = saved_dialogs
+
+    return latencies, timeouts, dialogs
+
+
+def wait_until_idle(renamer, timeout=60.0):
+    """Process events until a PDFRenamer window has nothing left to do.
+
+    Returns True once it's idle, or False if it's still busy after
+    timeout seconds.
+    """
+
+    viewer = renamer.viewer
+    deadline = time.time() + timeout
+
+    while time.time() < deadline:
+        renamer.update()
+
+        if not (viewer.rendering.get()
+                or renamer._display_pending
+                or renamer._pending_renames
+                or renamer._scanner):
+            renamer.update_idletasks()
+            return True
+
+        time.sleep(0.001)
+
+    return False
+
+
+# ------------------------------------------------------------------------
+
+
+class VirtualDisplay(object):
+    """An Xvfb server to run the user interface on without a screen.
+
+    Once started, the DISPLAY environment variable points to it until
+    it's stopped. Raises OSError if Xvfb isn't installed.
+    """
+
+    # Seconds to wait for the server to start
+    startup_timeout = 10.0
+
+    def __init__(self, size=(1280, 1024)):
+        """Return a new VirtualDisplay."""
+
+        self.size = size
+
+        # The display name, such as ":99", once started
+        self.name = None
+
+        self._process = None
+        self._saved_display = None
+
+    # ------------------------------------------------------------------------
+
+    def start(self):
+        """Start the server and point DISPLAY to it."""
+
+        executable = find_executable("Xvfb")
+        if not executable:
+            raise OSError("Could not find Xvfb, which is needed to replay "
+                          "sessions without a display.")
+
+        # Find a display number that isn't in use
+        number = 99
+        while (os.path.exists("/tmp/.X{0}-lock".format(number))
+               or os.path.exists("/tmp/.X11-unix/X{0}".format(number))):
+            number += 1
+
+        self.name = ":{0}".format(number)
+        screen = "{0}x{1}x24".format(*self.size)
+
+        with open(os.devnull, "wb") as devnull:
+            self._process = subprocess.Popen([executable, self.name,
+                                              "-screen", "0", screen,
+                                              "-nolisten", "tcp"],
+                                             stdout=devnull,
+                                             stderr=devnull)
+
+        # Wait for the server to start listening
+        socket_path = "/tmp/.X11-unix/X{0}".format(number)
+        deadline = time.time() + self.startup_timeout
+        while not os.path.exists(socket_path):
+            if self._process.poll() is not None or time.time() > deadline:
+                self.stop()
+                raise OSError("Xvfb failed to start on display {0}."
+                              .format(self.name))
+            time.sleep(0.05)
+
+        self._saved_display = os.environ.get("DISPLAY")
+        os.environ["DISPLAY"] = self.name
+
+        return self
+
+    def stop(self):
+        """Stop the server and restore DISPLAY."""
+
+        if self._process:
+            self._process.terminate()
+            self._process.wait()
+            self._process = None
+
+        if self._saved_display is None:
+            os.environ.pop("DISPLAY", None)
+        else:
+            os.environ["DISPLAY"] = self._saved_display
+            self._saved_display = None
+
+
+class _SessionWriter(object):
+    """Write actions to a session file as they're taken."""
+
+    def __init__(self, path):
+        """Return a new _SessionWriter."""
+
+        self.started = time.time()
+
+        # How many recorded actions are running, so actions taken by
+        # other actions aren't recorded
+        self.depth = 0
+
+        self._file = open(path, "w")
+        self._write({"format": _FORMAT,
+                     "version": 1,
+                     "started": time.strftime("%Y-%m-%dT%H:%M:%S%z")})
+
+    def write(self, action, args):
+        """Record an action."""
+
+        self._write({"t": round(time.time() - self.started, 3),
+                     "action": action,
+                     "args": args})
+
+    def _write(self, record):
+        """Write a record and make sure it's saved."""
+
+        self._file.write(json.dumps(record, sort_keys=True) + "\n")
+        self._file.flush()
+
+
+def _common_dir(files, dirs=()):
+    """Return the deepest directory containing every file and folder."""
+
+    split_paths = ([os.path.dirname(path).split(os.sep) for path in files]
+                   + [path.rstrip(os.sep).split(os.sep) for path in dirs])
+    common = os.path.commonprefix(split_paths)
+    return os.sep.join(common) or os.sep
+
+
+def _copy_recorded(files, dirs, files_dir, copy_dir):
+    """Copy the recorded files and folders from files_dir to copy_dir.
+
+    Files and folders inside a recorded folder are copied with it.
+    Anything that no longer exists is skipped.
+    """
+
+    def inside(path, folders):
+        return any(path.startswith(folder.rstrip(os.sep) + os.sep)
+                   for folder in folders)
+
+    path_map = {files_dir: copy_dir}
+
+    for path in sorted(set(dirs)):
+        if os.path.isdir(path) and not inside(path, dirs):
+            shutil.copytree(path, _map_path(path, path_map))
+
+    for path in sorted(set(files)):
+        if os.path.isfile(path) and not inside(path, dirs):
+            dst = _map_path(path, path_map)
+            if not os.path.isdir(os.path.dirname(dst)):
+                os.makedirs(os.path.dirname(dst))
+            shutil.copy2(path, dst)
+
+
+def _map_path(path, path_map):
+    """Return a path with its prefix replaced according to path_map."""
+
+    for old, new in path_map.items():
+        if path == old or path.startswith(old.rstrip(os.sep) + os.sep):
+            return new + path[len(old):]
+
+    return path
+
+
+def _summary(seconds):
+    """Return latency statistics for a list of durations."""
+
+    values = sorted(1000 * s for s in seconds)
+
+    return {"count": len(values),
+            "mean_ms": round(sum(values) / len(values), 3),
+            "p50_ms": round(percentile(values, 50), 3),
+            "p95_ms": round(percentile(values, 95), 3),
+            "p99_ms": round(percentile(values, 99), 3),
+            "max_ms": round(values[-1], 3)}
+
+
+def main(argv=None):
+    """Replay a recorded session from the command line."""
+
+    parser = argparse.ArgumentParser(
+        prog="python -m pdfrenamer.replay",
+        description="Replay a recorded session and report how long each "
+                    "action took.")
+    parser.add_argument("session",
+                        help="session file recorded with --record-session")
+    parser.add_argument("--repeat", type=int, default=1,
+                        help="number of times to replay the session "
+                             "(default: 1)")
+    parser.add_argument("--in-place", action="store_true",
+                        help="use the recorded files rather than copies "
+                             "(this renames them!)")
+    parser.add_argument("--real-time", action="store_true",
+                        help="space actions out as they were recorded")
+    parser.add_argument("--timeout", type=float, default=60.0,
+                        help="seconds to wait for each action (default: 60)")
+    parser.add_argument("--no-virtual-display", action="store_true",
+                        help="don't start Xvfb, even if there's no display")
+    parser.add_argument("--output", metavar="FILE",
+                        help="write the results to a JSON file instead "
+                             "of standard output")
+    args = parser.parse_args(argv)
+
+    try:
+        actions = read_session(args.session)
+    except (EnvironmentError, ValueError) as err:
+        sys.stderr.write("{0}\n".format(err))
+        return 2
+
+    display = None
+    if not os.environ.get("DISPLAY") and not args.no_virtual_display:
+        try:
+            display = VirtualDisplay().start()
+        except (OSError) as err:
+            sys.stderr.write("{0}\n".format(err))
+            return 2
+
+    # Files and folders opened during the session, which are copied for
+    # each replay
+    files = [p for t, action, action_args in actions
+             if action == "open" for p in action_args]
+    dirs = [p for t, action, action_args in actions
+            if action == "open_dir" for p in action_args]
+    files_dir = _common_dir(files, dirs) if files or dirs else None
+
+    if (files_dir and not args.in_place
+            and os.path.dirname(files_dir) == files_dir):
+        # Paths in the session are mapped by replacing this prefix,
+        # which can't be done safely for the root of a drive
+        sys.stderr.write("The recorded files have no folder in common "
+                         "except {0}, so they can't be copied. Use "
+                         "--in-place to replay with the recorded files.\n"
+                         .format(files_dir))
+        return 2
+
+    saved_config_path = config.config_path
+    latencies = {}
+    timeouts = []
+    dialogs = []
+
+    try:
+        for i in range(max(1, args.repeat)):
+            temp_dir = tempfile.mkdtemp()
+            try:
+                # Start each replay with an empty configuration and caches
+                config.config_path = os.path.join(temp_dir, "config",
+                                                  "pdfrenamer.ini")
+
+                path_map = None
+                if files_dir and not args.in_place:
+                    copy_dir = os.path.join(temp_dir, "files")
+                    _copy_recorded(files, dirs, files_dir, copy_dir)
+                    path_map = {files_dir: copy_dir}
+
+                results = replay_session(actions, path_map,
+                                         args.real_time, args.timeout)
+                for action, seconds in results[0]:
+                    latencies.setdefault(action, []).append(seconds)
+                timeouts += results[1]
+                dialogs += results[2]
+
+            finally:
+                shutil.rmtree(temp_dir, ignore_errors=True)
+
+    finally:
+        config.config_path = saved_config_path
+        if display:
+            display.stop()
+
+    report = {"session": os.path.abspath(args.session),
+              "repeat": max(1, args.repeat),
+              "virtual_display": bool(display),
+              "actions": dict((action, _summary(seconds))
+                              for action, seconds in latencies.items()),
+              "timeouts": timeouts,
+              "dialogs": dialogs}
+
+    if args.output:
+        with open(args.output, "w") as out_file:
+            json.dump(report, out_file, indent=2, sort_keys=True)
+    else:
+        json.dump(report, sys.stdout, indent=2, sort_keys=True)
+        sys.stdout.write("\n")
+
+    return 1 if timeouts else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,119 @@
+"""Support for scanning large folders in the background."""
+
+import os
+import threading
+import time
+
+try:
+    # Python 3
+    import queue
+except (ImportError):
+    # Python 2
+    import Queue as queue
+
+
+__all__ = ["DirectoryScanner"]
+
+
+def _scandir(path):
+    """Yield (name, is_file) for each item in the specified directory."""
+
+    if hasattr(os, "scandir"):
+        for entry in os.scandir(path):
+            try:
+                yield entry.name, entry.is_file()
+            except (OSError):
+                # The item was deleted while we were looking at it
+                pass
+
+    else:
+        # Python 2 has no scandir(), so we have to stat each item
+        for name in os.listdir(path):
+            yield name, os.path.isfile(os.path.join(path, name))
+
+
+class DirectoryScanner(object):
+    """Find files in a directory using a background thread.
+
+    The accept argument is a function that takes a file's basename and
+    returns whether to include it. It is called from the scanning
+    thread, so it must not touch Tk.
+
+    Results are put on the queue as (paths, scanned) tuples, where paths
+    is a sorted list of newly found files and scanned is the number of
+    directory entries examined so far. The first file found is passed
+    along immediately so it can be displayed while the scan continues.
+    An exception is put on the queue if the scan fails, and None is put
+    on the queue when the scan is done or canceled.
+    """
+
+    # Maximum number of files to pass along at once
+    batch_size = 1000
+
+    # Maximum time to hold onto found files, in seconds
+    batch_interval = 0.1
+
+    def __init__(self, path, accept):
+        """Return a new DirectoryScanner."""
+
+        self.path = path
+        self.accept = accept
+
+        # Used to pass results back to the user interface thread
+        self.queue = queue.Queue()
+
+        # Set to stop scanning
+        self.canceler = threading.Event()
+
+    # ------------------------------------------------------------------------
+
+    def cancel(self):
+        """Stop scanning."""
+
+        self.canceler.set()
+
+    def start(self):
+        """Start scanning in a new background thread."""
+
+        thread = threading.Thread(target=self._run)
+        thread.daemon = True
+        thread.start()
+
+        return self
+
+    # ------------------------------------------------------------------------
+
+    def _run(self):
+        """Scan the directory."""
+
+        batch = []
+        scanned = 0
+        first = True
+        last_put = time.time()
+
+        try:
+            for name, is_file in _scandir(self.path):
+                if self.canceler.is_set():
+                    break
+
+                scanned += 1
+                if is_file and self.accept(name):
+                    batch.append(os.path.join(self.path, name))
+
+                if batch and (first
+                              or len(batch) >= self.batch_size
+                              or time.time() - last_put > self.batch_interval):
+                    self.queue.put((sorted(batch), scanned))
+                    batch = []
+                    first = False
+                    last_put = time.time()
+
+            if batch and not self.canceler.is_set():
+                self.queue.put((sorted(batch), scanned))
+
+        except (Exception) as err:
+            # Forward the error to the user interface thread
+            self.queue.put(err)
+
+        finally:
+            self.queue.put(None)
@@ -0,0 +1,353 @@
+"""Full-text search over open documents.
+
+Searching uses an inverted index mapping each word to the documents
+it appears in. Like the TextIndex, it is kept in a separate file for
+each folder, and is updated one document at a time as text is
+extracted, rather than rebuilt from scratch.
+"""
+
+import hashlib
+import json
+import os
+import re
+import threading
+
+from bisect import bisect_left
+
+
+__all__ = ["SearchIndex", "parse_query", "tokenize"]
+
+
+# Characters that make up a word
+_WORD = re.compile(r"\w+", re.UNICODE)
+
+# A quoted phrase or a single word in a query
+_QUERY_TERM = re.compile(r'"([^"]*)"?|(\S+)')
+
+# Used to save index files atomically
+_replace = getattr(os, "replace", os.rename)
+
+try:
+    # Python 2
+    basestring
+except (NameError):
+    # Python 3
+    basestring = str
+
+
+def tokenize(text):
+    """Return a list of the words in a string, in lowercase."""
+
+    return [word.lower() for word in _WORD.findall(text)]
+
+
+def parse_query(query):
+    """Split a search query into prefixes and phrases.
+
+    Returns a list of (kind, words) pairs. Each unquoted word is a
+    "prefix", which matches any word starting with it. Quoted text is
+    a "phrase", which matches those exact words in that order.
+    """
+
+    clauses = []
+
+    for phrase, word in _QUERY_TERM.findall(query):
+        if phrase:
+            words = tokenize(phrase)
+            if words:
+                clauses.append(("phrase", words))
+        else:
+            # Punctuation splits a word into several prefixes, so a
+            # search for "ACME-2024" matches "ACME 2024"
+            for prefix in tokenize(word):
+                clauses.append(("prefix", [prefix]))
+
+    return clauses
+
+
+class SearchIndex(object):
+    """Persistent inverted index of the text in each document.
+
+    Documents are identified by their device and inode numbers, like
+    in the TextIndex, so renaming a file doesn't require reindexing it;
+    call rename() to tell the index about the new path. An entry is
+    reindexed if the file's size or modification time changes.
+
+    This is safe to use from multiple threads.
+    """
+
+    def __init__(self, index_dir):
+        """Return a new SearchIndex."""
+
+        self.index_dir = index_dir
+
+        # Index for each folder that has been loaded, by folder path
+        self._shards = {}
+
+        # Current path of each document added this session, by key,
+        # and the reverse
+        self._paths = {}
+        self._keys = {}
+
+        self._lock = threading.Lock()
+
+    # ------------------------------------------------------------------------
+
+    def add(self, path, text, identity):
+        """Index the text in a document.
+
+        The identity is the document's file_identity(). This is cheap
+        if the document has already been indexed, so it can be called
+        again for every file opened.
+        """
+
+        dev, ino, size, mtime = identity
+        key = "{0}:{1}".format(dev, ino)
+
+        with self._lock:
+            old_path = self._paths.get(key)
+            if old_path is not None:
+                self._keys.pop(old_path, None)
+            self._paths[key] = path
+            self._keys[path] = key
+
+            shard = self._load(os.path.dirname(path))
+            doc = shard.docs.get(key)
+            if doc and doc[0] == size and doc[1] == mtime:
+                # Already indexed
+                return
+
+            if doc:
+                # The document has changed since it was indexed
+                shard.remove(key)
+
+            shard.add(key, size, mtime, tokenize(text))
+
+    def has(self, path, identity):
+        """Return whether a document's current contents are indexed."""
+
+        dev, ino, size, mtime = identity
+        key = "{0}:{1}".format(dev, ino)
+
+        with self._lock:
+            doc = self._load(os.path.dirname(path)).docs.get(key)
+            return bool(doc and doc[0] == size and doc[1] == mtime)
+
+    def rename(self, src_path, dst_path):
+        """Update the path of a document after renaming it."""
+
+        with self._lock:
+            key = self._keys.pop(src_path, None)
+            if key is not None:
+                self._paths[key] = dst_path
+                self._keys[dst_path] = key
+
+    def save(self):
+        """Save changed folders to disk."""
+
+        with self._lock:
+            data = []
+            for shard in self._shards.values():
+                if shard.dirty:
+                    data.append((shard.folder, shard.dump()))
+                    shard.dirty = False
+
+        if not data:
+            return
+
+        if not os.path.isdir(self.index_dir):
+            os.makedirs(self.index_dir)
+
+        for folder, contents in data:
+            index_path = self._index_path(folder)
+            temp_path = index_path + ".tmp"
+
+            with open(temp_path, "w") as index_file:
+                json.dump(contents, index_file)
+            _replace(temp_path, index_path)
+
+    def search(self, query):
+        """Return the set of paths to documents matching a query.
+
+        Only documents added during this session are returned, and only
+        if every word and phrase in the query matches. See parse_query()
+        for the syntax.
+        """
+
+        clauses = parse_query(query)
+        if not clauses:
+            return set()
+
+        results = set()
+
+        with self._lock:
+            for shard in self._shards.values():
+                keys = None
+                for kind, words in clauses:
+                    if kind == "prefix":
+                        matches = shard.match_prefix(words[0])
+                    else:
+                        matches = shard.match_phrase(words)
+
+                    keys = matches if keys is None else keys & matches
+                    if not keys:
+                        break
+
+                for key in keys or ():
+                    path = self._paths.get(key)
+                    if path is not None:
+                        results.add(path)
+
+        return results
+
+    # ------------------------------------------------------------------------
+
+    def _index_path(self, folder):
+        """Return the path to the index file for a folder."""
+
+        key = os.path.normcase(os.path.abspath(folder))
+        digest = hashlib.sha1(key.encode("utf-8", "replace")).hexdigest()
+        return os.path.join(self.index_dir, digest + ".json")
+
+    def _load(self, folder):
+        """Return the index for a folder, loading it if needed.
+
+        The caller must hold the lock.
+        """
+
+        shard = self._shards.get(folder)
+
+        if shard is None:
+            shard = _Shard(folder)
+
+            try:
+                with open(self._index_path(folder), "r") as index_file:
+                    shard.load(json.load(index_file))
+            except (Exception):
+                # Not indexed yet, or the index is damaged
+                shard = _Shard(folder)
+
+            self._shards[folder] = shard
+
+        return shard
+
+
+class _Shard(object):
+    """The part of a SearchIndex covering a single folder."""
+
+    __slots__ = ("folder", "docs", "postings", "dirty", "_terms")
+
+    def __init__(self, folder):
+        """Return a new _Shard."""
+
+        self.folder = folder
+
+        # Size and modification time of each document when it was
+        # indexed, and the words in it separated by spaces, by key
+        self.docs = {}
+
+        # Keys of the documents containing each word, by word
+        # Sets are saved as strings of space-separated keys, which load
+        # much faster than lists; each is converted back to a set the
+        # first time it's needed.
+        self.postings = {}
+
+        # Whether this has changed since it was saved
+        self.dirty = False
+
+        # Sorted list of words for prefix searches, or None if the
+        # list needs to be rebuilt
+        self._terms = None
+
+    def add(self, key, size, mtime, words):
+        """Add a document's words to the index."""
+
+        for word in set(words):
+            keys = self._keys(word)
+            if keys is None:
+                keys = self.postings[word] = set()
+                self._terms = None
+            keys.add(key)
+
+        self.docs[key] = [size, mtime, " ".join(words)]
+        self.dirty = True
+
+    def dump(self):
+        """Return the contents of the index for saving."""
+
+        return {"folder": self.folder,
+                "docs": dict(self.docs),
+                "postings": dict((word, keys if isinstance(keys, basestring)
+                                  else " ".join(keys))
+                                 for word, keys in self.postings.items())}
+
+    def load(self, data):
+        """Load the contents of a saved index."""
+
+        self.docs = data["docs"]
+        self.postings = data["postings"]
+        self._terms = None
+
+    def match_phrase(self, words):
+        """Return the set of keys whose documents contain a phrase."""
+
+        postings = [self._keys(word) for word in words]
+        if not all(postings):
+            return set()
+
+        # Start with the rarest word to examine as few documents as
+        # possible
+        postings.sort(key=len)
+        keys = set(postings[0])
+        for word_keys in postings[1:]:
+            keys.intersection_update(word_keys)
+
+        if len(words) == 1:
+            return keys
+
+        # Check that the words are next to each other and in order
+        phrase = " {0} ".format(" ".join(words))
+        docs = self.docs
+        return set(key for key in keys
+                   if phrase in " {0} ".format(docs[key][2]))
+
+    def match_prefix(self, prefix):
+        """Return the set of keys whose documents contain a prefix."""
+
+        if self._terms is None:
+            self._terms = sorted(self.postings)
+
+        terms = self._terms
+        keys = set()
+
+        i = bisect_left(terms, prefix)
+        while i < len(terms) and terms[i].startswith(prefix):
+            keys.update(self._keys(terms[i]))
+            i += 1
+
+        return keys
+
+    def remove(self, key):
+        """Remove a document from the index."""
+
+        size, mtime, words = self.docs.pop(key)
+
+        for word in set(words.split()):
+            keys = self._keys(word)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self.postings[word]
+                    self._terms = None
+
+        self.dirty = True
+
+    def _keys(self, word):
+        """Return the set of keys for a word, or None if there are none."""
+
+        keys = self.postings.get(word)
+
+        if isinstance(keys, basestring):
+            keys = self.postings[word] = set(keys.split())
+
+        return keys
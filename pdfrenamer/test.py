@@ -1,24 +1,71 @@
 """Test cases for PDF Renamer."""
 
+import errno
+import json
 import os
 import shutil
+import subprocess
+import sys
 import tempfile
+import threading
+import time
 import unittest
 
+import PIL.Image
+
+from tkdocviewer.backends import GhostscriptBackend, gs_dpi
+
 try:
     # Python 3
+    import queue
     import tkinter as tk
+    from io import StringIO
 except (ImportError):
     # Python 2
+    import Queue as queue
     import Tkinter as tk
+    from StringIO import StringIO
 
-from . import PDFRenamer
+from . import PDFRenamer, _StartupProfile
+from . import rename as rename_module
+from .batch import BatchRenamer, Rename
+from .bench import bench_rename, bench_scan, generate_corpus
+from .cache import (CompressedPage, DiskCache, PageCache, file_identity,
+                    image_size)
+from .catalog import FileCatalog, existing_files
+from .duplicates import DuplicateFinder, HashCache
+from .filelist import FileList
+from .frames import FrameBackend
+from .gspool import GhostscriptPool, PoolError
+from .journal import RenameJournal
+from .prefetch import Prefetcher
+from .render import PREVIEW_SCALE, RenderJob
+from .rename import (RenameRequest, RenamerError, RenameWorker, move_file,
+                     part_path, _resume_offset)
+from .replay import (_common_dir, _copy_recorded, percentile, read_session,
+                     recording, wait_until_idle)
+from .scan import DirectoryScanner
+from .search import SearchIndex
+from .text import (DEFAULT_TEMPLATES, TextExtractor, TextIndex, extract_text,
+                   parse_template, suggest_name)
+from .tracing import DocumentTrace, Tracer
+from .watch import DirectoryWatcher
 
 
 # Absolute path to this file
 TEST_PY_PATH = os.path.realpath(__file__)
 
 
+def write_script(path, source):
+    """Write a Python script that can be run in place of a program."""
+
+    with open(path, "w") as script:
+        script.write("#!{0}\n{1}".format(sys.executable, source))
+    os.chmod(path, 0o755)
+
+    return path
+
+
 class PDFRenamerTest(unittest.TestCase):
     """Test case for PDF Renamer."""
 
@@ -71,11 +118,10 @@ class PDFRenamerTest(unittest.TestCase):
     def tearDown(self):
         """Clean up the test case."""
 
-        # Briefly display the application window
-        self.root.after(1000, self.pdf_renamer.close_window)
-
-        # Close the PDF Renamer application
-        self.root.wait_window(self.root)
+        # Close the PDF Renamer application once it's done with the
+        # test file, rather than after a fixed delay
+        wait_until_idle(self.pdf_renamer)
+        self.pdf_renamer.close_window()
 
         # Clean up temporary directories
         shutil.rmtree(self.src_dir)
@@ -91,6 +137,7 @@ class PDFRenamerTest(unittest.TestCase):
         p = self.pdf_renamer
         p._new_name.set(self.dst_base)
         p._process_rename()
+        p.wait_for_renames()
         p.reload()
 
         self.assertFalse(os.path.isfile(self.src_path))
@@ -103,8 +150,1655 @@ class PDFRenamerTest(unittest.TestCase):
         p = self.pdf_renamer
         p._new_name.set(self.dst_base)
         p._process_rename(self.dst_dir)
+        p.wait_for_renames()
         p.reload()
 
         self.assertFalse(os.path.isfile(self.src_path))
         self.assertFalse(os.path.isfile(self.dst_path_renamed))
         self.assertTrue(os.path.isfile(self.dst_path_moved))
+
+
+class FileListTest(unittest.TestCase):
+    """Test case for the list of open files."""
+
+    def setUp(self):
+        """Set up the test case."""
+
+        self.root = tk.Tk()
+        self.root.geometry("300x200")
+
+        self.clicked = []
+        self.file_list = FileList(self.root, command=self.clicked.append)
+        self.file_list.pack(side="top", expand=1, fill="both")
+
+        self.paths = [os.path.join(os.sep, "scans", "{0:05}.pdf".format(i))
+                      for i in range(10000)]
+        self.file_list.set_items(self.paths)
+        self.root.update()
+
+    def tearDown(self):
+        """Clean up the test case."""
+
+        self.root.destroy()
+
+    def row_text(self, row):
+        """Return the text drawn in a visible row."""
+
+        canvas = self.file_list._canvas
+        rect, text = self.file_list._rows[row]
+        return canvas.itemcget(text, "text")
+
+    def test_only_visible_rows_are_drawn(self):
+        """Test scrolling a long list that only draws what's visible."""
+
+        fl = self.file_list
+        visible_rows = fl._visible_rows()
+        self.assertLess(visible_rows, 50)
+        self.assertEqual(len(fl._rows), visible_rows)
+
+        fl.select(5000)
+        self.assertTrue(fl._top <= 5000 < fl._top + visible_rows)
+        self.assertEqual(self.row_text(5000 - fl._top), "05000.pdf")
+        self.assertEqual(len(fl._rows), visible_rows)
+
+        # Rows past the end are blank once the list gets shorter
+        del self.paths[10:]
+        fl.refresh()
+        self.assertEqual(fl._top, max(0, 10 - visible_rows))
+        self.assertEqual(self.row_text(9 - fl._top), "00009.pdf")
+        if visible_rows > 10:
+            self.assertEqual(self.row_text(10), "")
+
+    def test_click(self):
+        """Test clicking on a row."""
+
+        fl = self.file_list
+        fl.yview("moveto", 0.5)
+        top = fl._top
+
+        fl._canvas.event_generate("<Button-1>", x=5,
+                                  y=2 * fl._row_height + 1)
+        self.root.update()
+        self.assertEqual(self.clicked, [top + 2])
+
+
+class PageCacheTest(unittest.TestCase):
+    """Test case for the in-memory page cache."""
+
+    def test_eviction(self):
+        """Test that the least recently used pages are evicted first."""
+
+        cache = PageCache(memory_limit=3 * (100 + PageCache._ENTRY_OVERHEAD))
+        for page in range(1, 4):
+            cache.put(page, b"x" * 100)
+
+        # Use the first page so the second is now the oldest
+        self.assertEqual(cache.get(1), b"x" * 100)
+        cache.put(4, b"x" * 100)
+
+        self.assertIn(1, cache)
+        self.assertNotIn(2, cache)
+        self.assertIn(3, cache)
+        self.assertIn(4, cache)
+
+    def test_compressed_page(self):
+        """Test compressing pages that are out of view."""
+
+        data = b"P6\n64 64\n255\n" + b"\xff" * (64 * 64 * 3)
+        page = CompressedPage(data)
+
+        self.assertEqual(page.decompress(), data)
+        self.assertLess(image_size(page), image_size(data))
+
+        # PIL images are stored as PPM data
+        image = PIL.Image.new("RGB", (8, 4), "white")
+        self.assertTrue(CompressedPage(image).decompress().startswith(b"P6"))
+
+    def test_identity_survives_rename(self):
+        """Test that renaming a file does not change its identity."""
+
+        temp_dir = tempfile.mkdtemp()
+        try:
+            src_path = os.path.join(temp_dir, "test.txt")
+            dst_path = os.path.join(temp_dir, "renamed.txt")
+            shutil.copy(TEST_PY_PATH, src_path)
+
+            identity = file_identity(src_path)
+            os.rename(src_path, dst_path)
+            self.assertEqual(identity, file_identity(dst_path))
+
+        finally:
+            shutil.rmtree(temp_dir)
+
+
+class DiskCacheTest(unittest.TestCase):
+    """Test case for the persistent page cache."""
+
+    def setUp(self):
+        """Set up the test case."""
+
+        self.temp_dir = tempfile.mkdtemp()
+        self.cache = DiskCache(os.path.join(self.temp_dir, "cache"))
+
+        # Two files with identical contents
+        self.paths = []
+        for name in "first.txt", "second.txt":
+            path = os.path.join(self.temp_dir, name)
+            shutil.copy(TEST_PY_PATH, path)
+            self.paths.append(path)
+
+    def tearDown(self):
+        """Clean up the test case."""
+
+        shutil.rmtree(self.temp_dir)
+
+    def test_identical_files_share_entry(self):
+        """Test that identical files share one cache entry."""
+
+        first, second = self.paths
+        page = b"P6\n2 1\n255\n\x00\x00\x00\xff\xff\xff"
+
+        self.assertIsNone(self.cache.get(first, file_identity(first), "p"))
+        self.cache.put(first, file_identity(first), "p", 3, page)
+
+        self.assertEqual(self.cache.get(second, file_identity(second), "p"),
+                         (3, page))
+        self.assertIsNotNone(self.cache.get_thumbnail(second))
+
+    def test_same_samples(self):
+        """Test that files whose samples match aren't mixed up."""
+
+        page = b"P6\n2 1\n255\n\x00\x00\x00\xff\xff\xff"
+
+        # Same size, and different only outside the sampled parts
+        data = bytearray(os.urandom(1000000))
+        paths = []
+        for i in range(3):
+            if i == 2:
+                data[100000] ^= 0xff
+            path = os.path.join(self.temp_dir, "large{0}.bin".format(i))
+            with open(path, "wb") as f:
+                f.write(data)
+            paths.append(path)
+
+        first, copy, changed = paths
+        self.cache.put(first, file_identity(first), "p", 3, page)
+
+        # A new cache instance only has the index to go on
+        self.cache.save()
+        cache = DiskCache(os.path.join(self.temp_dir, "cache"))
+
+        self.assertEqual(cache.get(copy, file_identity(copy), "p"),
+                         (3, page))
+        self.assertIsNone(cache.get(changed, file_identity(changed), "p"))
+        self.assertIsNone(cache.get_thumbnail(changed))
+
+
+class PrefetcherTest(unittest.TestCase):
+    """Test case for rendering documents ahead of the viewer."""
+
+    class FakeJob(object):
+        """Stand-in for RenderJob that doesn't render anything."""
+
+        def __init__(self, path):
+            self.path = path
+            self.options = {}
+            self.pages = {}
+            self.started = self.canceled = self.lazy = False
+            self.error = None
+
+        def cancel(self):
+            self.canceled = True
+
+        def render_all(self):
+            self.lazy = False
+
+        def run(self):
+            self.started = True
+
+    def test_keep(self):
+        """Test discarding prefetched documents without adding new ones."""
+
+        prefetcher = Prefetcher(self.FakeJob)
+        prefetcher.prefetch(["a.pdf", "b.pdf", "c.pdf"])
+
+        # Keep "b.pdf", and don't start rendering "d.pdf"
+        prefetcher.keep(["b.pdf", "d.pdf"])
+
+        self.assertIsNone(prefetcher.take("a.pdf"))
+        self.assertIsNone(prefetcher.take("c.pdf"))
+        self.assertIsNone(prefetcher.take("d.pdf"))
+        self.assertEqual(prefetcher.take("b.pdf").path, "b.pdf")
+
+    def test_first_page_only(self):
+        """Test prefetching only first pages, within the memory limit."""
+
+        temp_dir = tempfile.mkdtemp()
+        try:
+            paths = []
+            for name in "a.pdf", "b.pdf":
+                path = os.path.join(temp_dir, name)
+                shutil.copy(TEST_PY_PATH, path)
+                paths.append(path)
+
+            pool = RenderJobTest.FakePool(20)
+            jobs = {}
+
+            def create_job(path):
+                job = jobs[path] = RenderJob(path, pool=pool)
+                return job
+
+            # The first page of the first document is over the limit,
+            # so the second document isn't rendered
+            prefetcher = Prefetcher(create_job, memory_limit=1)
+            prefetcher.prefetch(paths)
+            first, second = paths
+
+            self.assertTrue(jobs[first].finished.wait(10))
+            time.sleep(0.1)
+            self.assertEqual(sorted(jobs[first].pages), [1])
+            self.assertFalse(jobs[second].started)
+
+            # The rest is rendered once the document is displayed, and
+            # taking it makes room for the next one
+            job = prefetcher.take(first, **jobs[first].options)
+            self.assertIs(job, jobs[first])
+            self.assertTrue(jobs[second].finished.wait(10))
+            self.assertEqual(sorted(jobs[second].pages), [1])
+
+            self.assertTrue(job.finished.wait(10))
+            self.assertTrue(job.complete)
+
+        finally:
+            prefetcher.clear()
+            shutil.rmtree(temp_dir)
+
+
+class FrameBackendTest(unittest.TestCase):
+    """Test case for rendering multi-frame images."""
+
+    def setUp(self):
+        """Set up the test case."""
+
+        self.temp_dir = tempfile.mkdtemp()
+        self.gif_path = os.path.join(self.temp_dir, "test.gif")
+
+        frames = [PIL.Image.new("RGB", (16, 8), (50 * frame, 0, 0))
+                  for frame in range(5)]
+        frames[0].save(self.gif_path, save_all=True,
+                       append_images=frames[1:])
+
+    def tearDown(self):
+        """Clean up the test case."""
+
+        shutil.rmtree(self.temp_dir)
+
+    def test_frames(self):
+        """Test counting and rendering frames in any order."""
+
+        backend = FrameBackend(self.gif_path)
+        self.assertEqual(backend.page_count(), 5)
+
+        for frame in (1, 4, 2):
+            self.assertEqual(backend.render_page(frame).size, (16, 8))
+
+        # The image is reopened after it's closed
+        backend.close()
+        self.assertEqual(backend.render_page(5).size, (16, 8))
+        backend.close()
+
+    def test_lazy_job(self):
+        """Test that multi-frame images are rendered lazily."""
+
+        job = RenderJob(self.gif_path).start()
+        self.assertTrue(job.finished.wait(10))
+
+        self.assertTrue(job.lazy)
+        self.assertFalse(job.options["lazy"])
+        self.assertEqual(job.page_count, 5)
+        self.assertEqual(sorted(job.pages), [1])
+
+
+class RenderJobTest(unittest.TestCase):
+    """Test case for rendering documents in the background."""
+
+    class FakePool(object):
+        """Stands in for a GhostscriptPool without running Ghostscript."""
+
+        size = 3
+
+        # Processes free for a preview
+        available = 0
+
+        def __init__(self, page_count, delay=0.01):
+            self._page_count = page_count
+            self._lock = threading.Lock()
+
+            # Seconds to take rendering each full-size page
+            self.delay = delay
+
+            # (page, thread name) for each page rendered, and the
+            # resolution of each preview
+            self.rendered = []
+            self.previews = []
+
+        def page_count(self, path):
+            return self._page_count
+
+        def render_page(self, path, page, dpi):
+            if dpi < gs_dpi:
+                self.previews.append(dpi)
+                return b"P6\n1 1\n255\n\xff\xff\xff"
+
+            with self._lock:
+                self.rendered.append((page,
+                                      threading.current_thread().name))
+            time.sleep(self.delay)
+            return b"P6\n1 1\n255\n\x00\x00\x00"
+
+    def setUp(self):
+        """Set up the test case."""
+
+        self.temp_dir = tempfile.mkdtemp()
+        self.pdf_path = os.path.join(self.temp_dir, "test.pdf")
+        shutil.copy(TEST_PY_PATH, self.pdf_path)
+
+    def tearDown(self):
+        """Clean up the test case."""
+
+        shutil.rmtree(self.temp_dir)
+
+    def test_parallel_pages(self):
+        """Test handing out the pages of a long document to several threads."""
+
+        pool = self.FakePool(12)
+        job = RenderJob(self.pdf_path, pool=pool, workers=3).start()
+        self.assertTrue(job.finished.wait(10))
+
+        self.assertTrue(job.complete)
+        self.assertEqual(sorted(job.pages), list(range(1, 13)))
+
+        # Each page was rendered once, starting with the first page, by
+        # more than one thread
+        pages = [page for page, thread in pool.rendered]
+        self.assertEqual(sorted(pages), list(range(1, 13)))
+        self.assertEqual(pages[0], 1)
+        self.assertGreater(len(set(thread for page, thread
+                                   in pool.rendered)), 1)
+
+        # Short documents are rendered by one thread
+        pool = self.FakePool(RenderJob.parallel_threshold - 1)
+        job = RenderJob(self.pdf_path, pool=pool, workers=3).start()
+        self.assertTrue(job.finished.wait(10))
+        self.assertTrue(job.complete)
+        self.assertEqual(len(set(thread for page, thread
+                                 in pool.rendered)), 1)
+
+    def test_lazy_pages(self):
+        """Test rendering only the first page and requested pages."""
+
+        pool = self.FakePool(20)
+        job = RenderJob(self.pdf_path, pool=pool, lazy=True, workers=3)
+        job.request([3])
+        job.start()
+        self.assertTrue(job.finished.wait(10))
+
+        # Pages requested before starting come right after the first
+        self.assertEqual([page for page, thread in pool.rendered], [1, 3])
+        self.assertFalse(job.complete)
+
+        # Requesting more pages starts the job again, skipping pages
+        # that were already rendered or don't exist
+        job.request([3, 7, 25, 6])
+        self.assertFalse(job.finished.is_set())
+        self.assertTrue(job.finished.wait(10))
+        self.assertEqual([page for page, thread in pool.rendered],
+                         [1, 3, 7, 6])
+        self.assertEqual(sorted(job.pages), [1, 3, 6, 7])
+
+        # Nothing is rendered once the job is canceled
+        job.cancel()
+        job.request([10])
+        self.assertTrue(job.finished.is_set())
+        self.assertNotIn(10, job.pages)
+
+    @unittest.skipIf(sys.platform.startswith("win"), "needs #! scripts")
+    def test_preview(self):
+        """Test rendering a preview, and giving up on a slow one."""
+
+        pid_path = os.path.join(self.temp_dir, "pid")
+        executable = write_script(
+            os.path.join(self.temp_dir, "gs"),
+            "import os, sys, time\n"
+            "with open({0!r}, 'w') as f:\n"
+            "    f.write(str(os.getpid()))\n"
+            "if 'slow' in sys.argv[-1]:\n"
+            "    time.sleep(30)\n"
+            "for arg in sys.argv:\n"
+            "    if arg.startswith('-sOutputFile='):\n"
+            "        with open(arg.split('=', 1)[1], 'wb') as f:\n"
+            "            f.write(b'P6\\n1 1\\n255\\n\\0\\0\\0')\n"
+            .format(pid_path))
+
+        def wait_for_preview(job):
+            deadline = time.time() + 10
+            while job.preview is None and time.time() < deadline:
+                time.sleep(0.01)
+            job.cancel()
+            return job.preview
+
+        saved = GhostscriptBackend.__dict__["executable"]
+        GhostscriptBackend.executable = staticmethod(lambda: executable)
+        try:
+            job = RenderJob(self.pdf_path,
+                            pool=self.FakePool(1, delay=1)).start()
+            job.start_preview(10)
+            self.assertEqual(wait_for_preview(job),
+                             b"P6\n1 1\n255\n\0\0\0")
+            self.assertTrue(os.path.exists(pid_path))
+            os.remove(pid_path)
+
+            # A pool with a process to spare renders the preview
+            pool = self.FakePool(1, delay=1)
+            pool.available = 2
+            job = RenderJob(self.pdf_path, pool=pool).start()
+            job.start_preview(10)
+            self.assertEqual(wait_for_preview(job),
+                             b"P6\n1 1\n255\n\xff\xff\xff")
+            self.assertEqual(pool.previews, [gs_dpi // PREVIEW_SCALE])
+
+            # No preview is rendered if the first page is in the cache
+            cache = PageCache()
+            job = RenderJob(self.pdf_path, cache=cache,
+                            pool=self.FakePool(1)).start()
+            self.assertTrue(job.finished.wait(10))
+
+            job = RenderJob(self.pdf_path, cache=cache,
+                            pool=self.FakePool(1, delay=1))
+            job.start()
+            job.start_preview(0.5)
+            self.assertTrue(job.finished.wait(10))
+            time.sleep(0.6)
+            self.assertIsNone(job.preview)
+            self.assertFalse(os.path.exists(pid_path))
+
+            # A preview that takes too long is given up, and Ghostscript
+            # is killed
+            slow_path = os.path.join(self.temp_dir, "slow.pdf")
+            shutil.copy(self.pdf_path, slow_path)
+
+            job = RenderJob(slow_path, pool=self.FakePool(1, delay=1))
+            job.start()
+            job.start_preview(0.2)
+
+            deadline = time.time() + 10
+            killed = False
+            while not killed and time.time() < deadline:
+                time.sleep(0.05)
+                try:
+                    with open(pid_path) as f:
+                        pid = int(f.read())
+                except (IOError, ValueError):
+                    # Ghostscript hasn't started yet
+                    continue
+
+                try:
+                    os.kill(pid, 0)
+                except (OSError):
+                    killed = True
+
+            self.assertTrue(killed)
+            self.assertIsNone(job.preview)
+            job.cancel()
+
+        finally:
+            GhostscriptBackend.executable = saved
+
+
+@unittest.skipIf(sys.platform.startswith("win"), "needs #! scripts")
+class GhostscriptPoolTest(unittest.TestCase):
+    """Test case for the pool of Ghostscript processes."""
+
+    # Answers jobs the way Ghostscript would, depending on the file name
+    STUB_SOURCE = """
+import re, sys, time
+stdin = getattr(sys.stdin, "buffer", sys.stdin)
+for line in iter(stdin.readline, b""):
+    line = line.decode("latin-1")
+    job_id = re.search(r"PDFRENAMER-OK (\\d+)", line).group(1)
+    if "crash.pdf" in line:
+        sys.exit(1)
+    if "hang.pdf" in line:
+        time.sleep(30)
+    if "broken.pdf" in line:
+        print("PDFRENAMER-ERROR " + job_id + " /undefined")
+    else:
+        if "pdfpagecount" in line:
+            print("PDFRENAMER-RESULT 5")
+        match = re.search(r"/OutputFile \\((.*?)\\) /HWResolution", line)
+        if match:
+            with open(match.group(1), "wb") as f:
+                f.write(b"P6\\n1 1\\n255\\n\\0\\0\\0")
+        print("PDFRENAMER-OK " + job_id)
+    sys.stdout.flush()
+"""
+
+    def setUp(self):
+        """Set up the test case."""
+
+        self.temp_dir = tempfile.mkdtemp()
+        executable = write_script(os.path.join(self.temp_dir, "gs"),
+                                  self.STUB_SOURCE)
+        self.pool = GhostscriptPool(size=2, executable=executable)
+
+        self.paths = {}
+        for name in "test", "broken", "crash", "hang":
+            path = os.path.join(self.temp_dir, name + ".pdf")
+            shutil.copy(TEST_PY_PATH, path)
+            self.paths[name] = path
+
+    def tearDown(self):
+        """Clean up the test case."""
+
+        self.pool.close()
+        shutil.rmtree(self.temp_dir)
+
+    def test_jobs(self):
+        """Test counting and rendering pages with processes kept running."""
+
+        pool = self.pool
+        self.assertEqual(pool.page_count(self.paths["test"]), 5)
+        self.assertEqual(pool.render_page(self.paths["test"], 2),
+                         b"P6\n1 1\n255\n\0\0\0")
+
+        # The same process did both jobs
+        self.assertEqual(pool._count, 1)
+        self.assertEqual(len(pool._idle), 1)
+
+    def test_errors(self):
+        """Test recovering from errors, crashes, and timeouts."""
+
+        pool = self.pool
+        pool.job_timeout = 0.5
+        self.assertEqual(pool.page_count(self.paths["test"]), 5)
+        worker = pool._idle[0]
+
+        # An error in a document leaves the process running
+        self.assertRaises(PoolError, pool.page_count, self.paths["broken"])
+        self.assertIs(pool._idle[0], worker)
+
+        # A process that crashes or stops answering is replaced
+        for name in "crash", "hang":
+            self.assertRaises(PoolError, pool.page_count, self.paths[name])
+            self.assertEqual(pool._count, 0)
+            self.assertFalse(worker.alive)
+
+            self.assertEqual(pool.page_count(self.paths["test"]), 5)
+            self.assertEqual(pool._count, 1)
+            self.assertIsNot(pool._idle[0], worker)
+            worker = pool._idle[0]
+
+        # Nothing runs once the pool is closed
+        pool.close()
+        self.assertRaises(PoolError, pool.page_count, self.paths["test"])
+
+
+class BatchRenamerTest(unittest.TestCase):
+    """Test case for renaming files from a manifest."""
+
+    def setUp(self):
+        """Set up the test case."""
+
+        self.temp_dir = tempfile.mkdtemp()
+
+        for name in "a.txt", "b.txt", "c.txt":
+            shutil.copy(TEST_PY_PATH, os.path.join(self.temp_dir, name))
+
+    def tearDown(self):
+        """Clean up the test case."""
+
+        shutil.rmtree(self.temp_dir)
+
+    def test_chain(self):
+        """Test renaming a file to a name another file is leaving."""
+
+        renamer = BatchRenamer([Rename(1, self.temp_dir, "a.txt", "b"),
+                                Rename(2, self.temp_dir, "b.txt", "d")])
+        self.assertEqual(renamer.check(), [])
+        renamer.apply()
+
+        self.assertEqual(sorted(os.listdir(self.temp_dir)),
+                         ["b.txt", "c.txt", "d.txt"])
+
+    def test_failed_blocker(self):
+        """Test that a file isn't moved onto one that couldn't be moved."""
+
+        # A plain file where a directory is expected
+        with open(os.path.join(self.temp_dir, "blocker"), "w"):
+            pass
+
+        renames = [Rename(1, self.temp_dir, "a.txt", "b"),
+                   Rename(2, self.temp_dir, "b.txt", "blocker/sub/c")]
+        renamer = BatchRenamer(renames)
+        self.assertEqual(renamer.check(), [])
+        renamer.apply()
+
+        self.assertEqual([rename.status for rename in renames],
+                         ["failed", "failed"])
+        self.assertTrue(os.path.isfile(os.path.join(self.temp_dir, "a.txt")))
+        self.assertTrue(os.path.isfile(os.path.join(self.temp_dir, "b.txt")))
+
+    def test_existing_destination(self):
+        """Test that a file that appears after checking isn't replaced."""
+
+        renames = [Rename(1, self.temp_dir, "a.txt", "d")]
+        renamer = BatchRenamer(renames)
+        self.assertEqual(renamer.check(), [])
+
+        with open(os.path.join(self.temp_dir, "d.txt"), "w") as f:
+            f.write("new")
+        renamer.apply()
+
+        self.assertEqual(renames[0].status, "failed")
+        with open(os.path.join(self.temp_dir, "d.txt"), "r") as f:
+            self.assertEqual(f.read(), "new")
+
+    def test_conflict(self):
+        """Test that conflicts are found before anything is renamed."""
+
+        renames = [Rename(1, self.temp_dir, "a.txt", "c"),
+                   Rename(2, self.temp_dir, "b.txt", "e"),
+                   Rename(3, self.temp_dir, "missing.txt", "f")]
+        problems = BatchRenamer(renames).check()
+
+        self.assertEqual([rename.row for rename in problems], [1, 3])
+        self.assertEqual(renames[1].status, "pending")
+
+
+class MoveFileTest(unittest.TestCase):
+    """Test case for moving files to another filesystem."""
+
+    def setUp(self):
+        """Set up the test case."""
+
+        self.temp_dir = tempfile.mkdtemp()
+        self.src_path = os.path.join(self.temp_dir, "a.bin")
+        self.dst_path = os.path.join(self.temp_dir, "b.bin")
+        self.part_path = part_path(self.dst_path)
+
+        self.data = os.urandom(10000)
+        with open(self.src_path, "wb") as f:
+            f.write(self.data)
+
+        # Pretend the destination is on another filesystem, and copy
+        # in small chunks so there's more than one
+        self.saved = (os.rename, getattr(os, "link", None),
+                      rename_module._COPY_CHUNK_SIZE)
+        src_path = self.src_path
+
+        def cross_device(function):
+            def wrapper(src, dst):
+                if src == src_path:
+                    raise OSError(errno.EXDEV, "Invalid cross-device link")
+                return function(src, dst)
+            return wrapper
+
+        os.rename = cross_device(os.rename)
+        if self.saved[1]:
+            os.link = cross_device(os.link)
+        rename_module._COPY_CHUNK_SIZE = 4096
+
+        self.progress = []
+
+    def tearDown(self):
+        """Clean up the test case."""
+
+        os.rename, link, rename_module._COPY_CHUNK_SIZE = self.saved
+        if link:
+            os.link = link
+
+        shutil.rmtree(self.temp_dir)
+
+    def record_progress(self, stage, done, total):
+        """Record a call to the progress function."""
+
+        self.progress.append((stage, done, total))
+
+    def test_copy(self):
+        """Test copying and verifying a file."""
+
+        move_file(self.src_path, self.dst_path, self.record_progress)
+
+        self.assertFalse(os.path.exists(self.src_path))
+        self.assertFalse(os.path.exists(self.part_path))
+        with open(self.dst_path, "rb") as f:
+            self.assertEqual(f.read(), self.data)
+
+        copying = [done for stage, done, total in self.progress
+                   if stage == "copying"]
+        self.assertEqual(copying, [4096, 8192, 10000])
+        self.assertEqual(self.progress[-1], ("verifying", 20000, 20000))
+
+    def test_resume(self):
+        """Test resuming a copy that was interrupted."""
+
+        with open(self.part_path, "wb") as f:
+            f.write(self.data[:5000])
+        self.assertEqual(_resume_offset(self.src_path, self.part_path,
+                                        len(self.data)), 5000)
+
+        move_file(self.src_path, self.dst_path, self.record_progress,
+                  resume=True)
+
+        with open(self.dst_path, "rb") as f:
+            self.assertEqual(f.read(), self.data)
+        self.assertEqual(self.progress[0], ("copying", 9096, 10000))
+
+        # A partial copy that doesn't match is started over
+        with open(self.part_path, "wb") as f:
+            f.write(b"x" * 5000)
+        self.assertEqual(_resume_offset(self.dst_path, self.part_path,
+                                        len(self.data)), 0)
+
+    def test_existing_file(self):
+        """Test that a file at the temporary path is never touched."""
+
+        self.assertEqual(os.path.basename(self.part_path),
+                         ".b.bin.pdfrenamer-part")
+
+        with open(self.part_path, "wb") as f:
+            f.write(self.data[:5000])
+
+        self.assertRaises(RenamerError, move_file,
+                          self.src_path, self.dst_path)
+
+        self.assertFalse(os.path.exists(self.dst_path))
+        with open(self.part_path, "rb") as f:
+            self.assertEqual(f.read(), self.data[:5000])
+        with open(self.src_path, "rb") as f:
+            self.assertEqual(f.read(), self.data)
+
+    def test_keep_part(self):
+        """Test keeping an unfinished copy to resume later."""
+
+        def fail(stage, done, total):
+            if done > 4096:
+                raise OSError(errno.EIO, "Input/output error")
+
+        for keep_part in True, False:
+            self.assertRaises(RenamerError, move_file, self.src_path,
+                              self.dst_path, fail, keep_part=keep_part)
+            self.assertEqual(os.path.exists(self.part_path), keep_part)
+
+            if keep_part:
+                os.remove(self.part_path)
+
+    def test_mismatch(self):
+        """Test that a copy that doesn't match leaves the original alone."""
+
+        file_hash = rename_module._file_hash
+
+        def bad_hash(path, *args, **kw):
+            digest = file_hash(path, *args, **kw)
+            return digest + b"x" if path == self.part_path else digest
+
+        rename_module._file_hash = bad_hash
+        try:
+            self.assertRaises(RenamerError, move_file,
+                              self.src_path, self.dst_path)
+        finally:
+            rename_module._file_hash = file_hash
+
+        self.assertFalse(os.path.exists(self.dst_path))
+        self.assertFalse(os.path.exists(self.part_path))
+        with open(self.src_path, "rb") as f:
+            self.assertEqual(f.read(), self.data)
+
+
+class RenameJournalTest(unittest.TestCase):
+    """Test case for recovering interrupted renames."""
+
+    def setUp(self):
+        """Set up the test case."""
+
+        self.temp_dir = tempfile.mkdtemp()
+        self.journal_path = os.path.join(self.temp_dir, "renames.journal")
+
+        for name in "a.txt", "b.txt":
+            shutil.copy(TEST_PY_PATH, os.path.join(self.temp_dir, name))
+
+    def tearDown(self):
+        """Clean up the test case."""
+
+        shutil.rmtree(self.temp_dir)
+
+    def test_committed_renames_are_not_recovered(self):
+        """Test that finished renames need no recovery."""
+
+        worker = RenameWorker(RenameJournal(self.journal_path))
+        worker.submit(os.path.join(self.temp_dir, "a.txt"),
+                      os.path.join(self.temp_dir, "c.txt"))
+        worker.stop()
+        worker.journal.close()
+
+        self.assertEqual(RenameJournal(self.journal_path).recover(), [])
+
+    def test_incomplete_copy_is_kept(self):
+        """Test keeping the copy from a move that was interrupted."""
+
+        src_path = os.path.join(self.temp_dir, "a.txt")
+        dst_path = os.path.join(self.temp_dir, "c.txt")
+        request = RenameRequest(src_path, dst_path)
+        part_path = request.part_path
+        shutil.copy(TEST_PY_PATH, part_path)
+
+        # Simulate dying after the copy started but before it finished
+        journal = RenameJournal(self.journal_path)
+        journal.begin(request)
+        journal.close()
+
+        journal = RenameJournal(self.journal_path)
+        messages = journal.recover()
+        journal.close()
+
+        self.assertEqual(len(messages), 1)
+        self.assertTrue(os.path.exists(src_path))
+        self.assertTrue(os.path.exists(part_path))
+        self.assertFalse(os.path.exists(dst_path))
+        self.assertTrue(journal.has_copy(part_path))
+
+        # The copy is still ours in the session after that
+        journal = RenameJournal(self.journal_path)
+        self.assertEqual(journal.recover(), [])
+        self.assertTrue(journal.has_copy(part_path))
+
+        # ...until it's resumed
+        journal.begin(request)
+        journal.commit(request)
+        journal.close()
+        self.assertFalse(journal.has_copy(part_path))
+
+        journal = RenameJournal(self.journal_path)
+        self.assertEqual(journal.recover(), [])
+        self.assertFalse(journal.has_copy(part_path))
+
+    def test_old_copy_is_removed(self):
+        """Test removing an unfinished copy that's never resumed."""
+
+        src_path = os.path.join(self.temp_dir, "a.txt")
+        request = RenameRequest(src_path,
+                                os.path.join(self.temp_dir, "c.txt"))
+        shutil.copy(TEST_PY_PATH, request.part_path)
+
+        # Simulate a move that failed partway through copying
+        journal = RenameJournal(self.journal_path)
+        journal.begin(request)
+        journal.abort(request)
+        journal.close()
+        self.assertTrue(journal.has_copy(request.part_path))
+
+        journal = RenameJournal(self.journal_path)
+        self.assertEqual(journal.recover(), [])
+        journal.close()
+        self.assertTrue(journal.has_copy(request.part_path))
+
+        # Let it age past the limit
+        then = time.time() - 8 * 24 * 60 * 60
+        os.utime(request.part_path, (then, then))
+
+        journal = RenameJournal(self.journal_path)
+        self.assertEqual(len(journal.recover()), 1)
+        journal.close()
+        self.assertFalse(os.path.exists(request.part_path))
+        self.assertFalse(journal.has_copy(request.part_path))
+        self.assertTrue(os.path.exists(src_path))
+
+    def test_new_file_at_old_path_is_kept(self):
+        """Test that recovery never removes the renamed file."""
+
+        src_path = os.path.join(self.temp_dir, "a.txt")
+        dst_path = os.path.join(self.temp_dir, "b.txt")
+
+        # The rename finished but its commit never reached the disk,
+        # then a new file appeared with the old name
+        journal = RenameJournal(self.journal_path)
+        journal.begin(RenameRequest(src_path, dst_path))
+        journal.close()
+
+        messages = RenameJournal(self.journal_path).recover()
+
+        self.assertEqual(len(messages), 1)
+        self.assertTrue(os.path.exists(src_path))
+        self.assertTrue(os.path.exists(dst_path))
+
+    def test_journal_errors_fail_renames(self):
+        """Test that the worker keeps going if the journal can't be written."""
+
+        class FailingJournal(RenameJournal):
+            fail = True
+
+            def sync(self):
+                if self.fail:
+                    raise IOError("No space left on device")
+                RenameJournal.sync(self)
+
+        journal = FailingJournal(self.journal_path)
+        worker = RenameWorker(journal)
+
+        a_path = os.path.join(self.temp_dir, "a.txt")
+        c_path = os.path.join(self.temp_dir, "c.txt")
+        request = worker.submit(a_path, c_path)
+        self.assertIs(worker.results.get(timeout=10), request)
+        self.assertIsInstance(request.error, RenamerError)
+        self.assertTrue(os.path.exists(a_path))
+        self.assertFalse(os.path.exists(c_path))
+
+        # The worker thread is still there for the next rename
+        journal.fail = False
+        request = worker.submit(a_path, c_path)
+        self.assertIs(worker.results.get(timeout=10), request)
+        self.assertIsNone(request.error)
+        self.assertTrue(os.path.exists(c_path))
+
+        worker.stop()
+        journal.close()
+
+
+class TextIndexTest(unittest.TestCase):
+    """Test case for suggesting names from document text."""
+
+    def setUp(self):
+        """Set up the test case."""
+
+        self.temp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.temp_dir, "scan0001.pdf")
+        shutil.copy(TEST_PY_PATH, self.path)
+
+    def tearDown(self):
+        """Clean up the test case."""
+
+        shutil.rmtree(self.temp_dir)
+
+    def test_index_survives_rename(self):
+        """Test that saved text is found after renaming the file."""
+
+        index = TextIndex(os.path.join(self.temp_dir, "text"))
+        index.put(self.path, "Invoice No: 12345")
+        index.save()
+
+        new_path = os.path.join(self.temp_dir, "renamed.pdf")
+        os.rename(self.path, new_path)
+
+        index = TextIndex(os.path.join(self.temp_dir, "text"))
+        self.assertEqual(index.get(new_path), "Invoice No: 12345")
+
+    def test_suggest_name(self):
+        """Test suggesting names using the default templates."""
+
+        templates = [parse_template(template)
+                     for template in DEFAULT_TEMPLATES]
+
+        self.assertEqual(suggest_name("ACME Corp.\nInvoice #: A-1042\n",
+                                      templates),
+                         "Invoice A-1042")
+        self.assertEqual(suggest_name("Statement date 2024-03-31",
+                                      templates),
+                         "2024-03-31")
+        self.assertIsNone(suggest_name("Nothing to see here", templates))
+
+    @unittest.skipIf(sys.platform.startswith("win"), "needs #! scripts")
+    def test_extract_text(self):
+        """Test that Ghostscript runs safely and is killed if it hangs."""
+
+        executable = write_script(
+            os.path.join(self.temp_dir, "gs"),
+            "import sys, time\n"
+            "if 'hang' in sys.argv[-1]:\n"
+            "    time.sleep(30)\n"
+            "sys.stdout.write(' '.join(sys.argv[1:]))\n")
+
+        args = extract_text(self.path, executable).split()
+        self.assertIn("-dSAFER", args)
+        self.assertNotIn("-dNOSAFER", args)
+
+        hang_path = os.path.join(self.temp_dir, "hang.pdf")
+        shutil.copy(self.path, hang_path)
+
+        started = time.time()
+        self.assertRaises(OSError, extract_text, hang_path, executable, 0.5)
+        self.assertLess(time.time() - started, 10)
+
+    @unittest.skipIf(sys.platform.startswith("win"), "needs #! scripts")
+    def test_extractor_looks_once(self):
+        """Test that each file is only extracted once while navigating."""
+
+        log_path = os.path.join(self.temp_dir, "extracted.log")
+        executable = write_script(
+            os.path.join(self.temp_dir, "gs"),
+            "import sys\n"
+            "with open({0!r}, 'a') as log:\n"
+            "    log.write(sys.argv[-1] + '\\n')\n"
+            "sys.stdout.write('Invoice 12345')\n".format(log_path))
+
+        files = [self.path]
+        for i in range(1, 4):
+            path = os.path.join(self.temp_dir, "scan000{0}.pdf".format(i + 1))
+            shutil.copy(self.path, path)
+            files.append(path)
+
+        def extracted():
+            deadline = time.time() + 10
+            while extractor.busy and time.time() < deadline:
+                time.sleep(0.01)
+            self.assertFalse(extractor.busy)
+            with open(log_path) as log:
+                return sorted(log.read().split())
+
+        index = TextIndex(os.path.join(self.temp_dir, "text"))
+        extractor = TextExtractor(index, executable=executable)
+        try:
+            extractor.follow(files, 0)
+            self.assertEqual(extracted(), sorted(files))
+
+            # Navigating doesn't look at the files again, even if their
+            # text is no longer indexed, but a file that changed is
+            # extracted again
+            index._folders.clear()
+            extractor.follow(files, 2)
+            self.assertEqual(extracted(), sorted(files))
+
+            extractor.forget(files[1])
+            extractor.follow(files, 3)
+            self.assertEqual(extracted(), sorted(files + [files[1]]))
+
+        finally:
+            extractor.stop()
+
+
+class SearchIndexTest(unittest.TestCase):
+    """Test case for searching the text of open files."""
+
+    def setUp(self):
+        """Set up the test case."""
+
+        self.temp_dir = tempfile.mkdtemp()
+        self.index_dir = os.path.join(self.temp_dir, "search")
+
+        self.paths = []
+        texts = ["ACME Corporation invoice for March 2024",
+                 "Statement from Example Bank, March 2024",
+                 "ACME Corporation price list"]
+        self.index = SearchIndex(self.index_dir)
+        for i, text in enumerate(texts):
+            path = os.path.join(self.temp_dir, "scan{0}.pdf".format(i))
+            with open(path, "w") as f:
+                f.write(text)
+            self.index.add(path, text, file_identity(path))
+            self.paths.append(path)
+
+    def tearDown(self):
+        """Clean up the test case."""
+
+        shutil.rmtree(self.temp_dir)
+
+    def test_prefix_and_phrase(self):
+        """Test prefix and phrase queries."""
+
+        first, second, third = self.paths
+
+        self.assertEqual(self.index.search("acme mar"), set([first]))
+        self.assertEqual(self.index.search("corp"), set([first, third]))
+        self.assertEqual(self.index.search('"march 2024"'),
+                         set([first, second]))
+        self.assertEqual(self.index.search('"2024 march"'), set())
+
+    def test_saved_index_follows_rename(self):
+        """Test that a saved index finds a renamed file."""
+
+        first = self.paths[0]
+        self.index.save()
+
+        new_path = os.path.join(self.temp_dir, "renamed.pdf")
+        os.rename(first, new_path)
+
+        index = SearchIndex(self.index_dir)
+        identity = file_identity(new_path)
+        self.assertTrue(index.has(new_path, identity))
+
+        index.add(new_path, "", identity)
+        self.assertEqual(index.search("invoice"), set([new_path]))
+
+
+class DuplicateFinderTest(unittest.TestCase):
+    """Test case for finding duplicate files."""
+
+    def setUp(self):
+        """Set up the test case."""
+
+        self.temp_dir = tempfile.mkdtemp()
+
+        with open(TEST_PY_PATH, "rb") as f:
+            data = f.read()
+
+        # Files with the same size and ends, but different middles
+        middle = len(data) // 2
+        different = data[:middle] + b"#" + data[middle + 1:]
+
+        self.paths = []
+        for name, contents in [("a.py", data),
+                               ("b.py", different),
+                               ("c.py", data),
+                               ("d.py", data[:100])]:
+            path = os.path.join(self.temp_dir, name)
+            with open(path, "wb") as f:
+                f.write(contents)
+            self.paths.append(path)
+
+    def tearDown(self):
+        """Clean up the test case."""
+
+        shutil.rmtree(self.temp_dir)
+
+    def find(self, cache=None):
+        """Return the groups of duplicates found in the test files."""
+
+        finder = DuplicateFinder(self.paths, cache)
+
+        # Compare full hashes even though the files are small
+        finder.block_size = 16
+
+        finder.start()
+        groups = finder.queue.get()
+        self.assertIsNone(finder.queue.get())
+        return groups
+
+    def test_duplicates(self):
+        """Test that only identical files are grouped."""
+
+        a, b, c, d = self.paths
+        self.assertEqual(self.find(), [[a, c]])
+
+    def test_cached_hashes(self):
+        """Test that saved hashes are used after renaming a file."""
+
+        a, b, c, d = self.paths
+        cache_path = os.path.join(self.temp_dir, "hashes.json")
+
+        cache = HashCache(cache_path)
+        self.find(cache)
+        cache.save()
+
+        new_path = os.path.join(self.temp_dir, "e.py")
+        os.rename(a, new_path)
+        self.paths[0] = new_path
+
+        cache = HashCache(cache_path)
+        self.assertIsNotNone(cache.get(file_identity(new_path), "full"))
+        self.assertEqual(self.find(cache), [[new_path, c]])
+
+
+class FileCatalogTest(unittest.TestCase):
+    """Test case for the catalog of open files."""
+
+    def setUp(self):
+        """Set up the test case."""
+
+        self.temp_dir = tempfile.mkdtemp()
+
+        self.paths = [os.path.join(self.temp_dir, "{0:02d}.txt".format(i))
+                      for i in range(FileCatalog.listing_threshold + 2)]
+        for path in self.paths:
+            shutil.copy(TEST_PY_PATH, path)
+
+    def tearDown(self):
+        """Clean up the test case."""
+
+        shutil.rmtree(self.temp_dir)
+
+    def test_existing_files(self):
+        """Test that missing paths and folders are left out."""
+
+        missing = os.path.join(self.temp_dir, "missing.txt")
+        paths = self.paths[::-1] + [missing, self.temp_dir]
+
+        # Enough paths to list the folder, and few enough to check each
+        self.assertEqual(existing_files(paths), self.paths[::-1])
+        self.assertEqual(existing_files(paths[:2] + [missing]), paths[:2])
+
+    def test_merge_and_rename(self):
+        """Test that paths stay sorted and conflicts are found."""
+
+        catalog = FileCatalog()
+        self.assertEqual(catalog.merge(self.paths[1::2]), len(self.paths) // 2)
+        self.assertEqual(catalog.merge(self.paths[-2::-2]), len(self.paths) // 2)
+        self.assertEqual(catalog.merge(self.paths[:3]), 0)
+        self.assertEqual(list(catalog), self.paths)
+
+        first = self.paths[0]
+        renamed = os.path.join(self.temp_dir, "renamed.txt")
+        self.assertTrue(catalog.conflicts(first))
+        self.assertFalse(catalog.conflicts(renamed))
+
+        catalog[0] = renamed
+        self.assertIn(renamed, catalog)
+        self.assertNotIn(first, catalog)
+        self.assertFalse(catalog.conflicts(first))
+        self.assertEqual(catalog.index(renamed), 0)
+        self.assertRaises(ValueError, catalog.__setitem__, 1, renamed)
+
+        catalog.remove([renamed, self.paths[2]])
+        self.assertEqual(list(catalog), self.paths[1:2] + self.paths[3:])
+        self.assertEqual(catalog.index(self.paths[3]), 1)
+
+    def test_rename_conflict_and_merge(self):
+        """Test renames that conflict, then merging into unsorted paths."""
+
+        catalog = FileCatalog(self.paths[:4])
+
+        # A failed rename leaves the catalog as it was
+        self.assertRaises(ValueError, catalog.__setitem__, 0, self.paths[1])
+        self.assertIn(self.paths[0], catalog)
+        self.assertTrue(catalog.conflicts(self.paths[0]))
+        self.assertEqual(catalog.index(self.paths[0]), 0)
+
+        # Renaming the first file to sort last leaves the catalog
+        # unsorted, but merged paths still go before the first path
+        # that sorts after them
+        renamed = os.path.join(self.temp_dir, "zz.txt")
+        catalog[0] = renamed
+        self.assertEqual(catalog.merge(self.paths[4:6] + self.paths[:1]), 3)
+        self.assertEqual(list(catalog),
+                         [self.paths[0]] + self.paths[4:6] + [renamed]
+                         + self.paths[1:4])
+
+    def test_identity(self):
+        """Test that cached file identities are checked again."""
+
+        catalog = FileCatalog(self.paths[:1])
+        identity = catalog.identity(0)
+        self.assertEqual(identity, file_identity(self.paths[0]))
+
+        with open(self.paths[0], "ab") as f:
+            f.write(b"#")
+
+        self.assertEqual(catalog.identity(0), identity)
+        self.assertNotEqual(catalog.identity(0, 0), identity)
+
+
+class TracerTest(unittest.TestCase):
+    """Test case for recording timing traces."""
+
+    def setUp(self):
+        """Set up the test case."""
+
+        self.temp_dir = tempfile.mkdtemp()
+        self.trace_path = os.path.join(self.temp_dir, "trace.jsonl")
+
+    def tearDown(self):
+        """Clean up the test case."""
+
+        shutil.rmtree(self.temp_dir)
+
+    def read_trace(self):
+        """Return the records in the trace file."""
+
+        with open(self.trace_path, "r") as trace_file:
+            return [json.loads(line) for line in trace_file]
+
+    def test_document_trace(self):
+        """Test the records written while displaying a document."""
+
+        tracer = Tracer(self.trace_path, enabled=True)
+
+        trace = DocumentTrace(tracer, "/docs/Invoice.PDF")
+        trace.started()
+        trace.page_finished()
+        trace.page_finished()
+        trace.finished(page_count=2)
+
+        # Nothing is recorded once the document is done
+        trace.page_finished()
+        trace.canceled()
+        tracer.close()
+
+        records = self.read_trace()
+        self.assertEqual([record["name"] for record in records],
+                         ["open", "page", "first_page", "page", "document"])
+        self.assertEqual(records[-1]["pages"], 2)
+        self.assertTrue(all(record["format"] == "pdf" for record in records))
+        self.assertIsNotNone(trace.first_page)
+
+    def test_rotation(self):
+        """Test that old trace files are rotated out."""
+
+        tracer = Tracer(self.trace_path, enabled=True)
+        tracer.max_bytes = 1024
+        tracer.backup_count = 2
+
+        for i in range(100):
+            tracer.record("test", time.time(), index=i)
+        tracer.close()
+
+        self.assertEqual(sorted(os.listdir(self.temp_dir)),
+                         ["trace.jsonl", "trace.jsonl.1", "trace.jsonl.2"])
+        self.assertEqual(self.read_trace()[-1]["index"], 99)
+
+    def test_disabled(self):
+        """Test that nothing is written while tracing is disabled."""
+
+        tracer = Tracer(self.trace_path)
+        tracer.record("test", time.time())
+        tracer.close()
+
+        self.assertFalse(os.path.exists(self.trace_path))
+
+
+class StartupTest(unittest.TestCase):
+    """Test case for starting the application quickly."""
+
+    @unittest.skipIf(sys.version_info < (3, 7),
+                     "needs module-level __getattr__()")
+    def test_deferred_imports(self):
+        """Test that the user interface is only imported when needed."""
+
+        script = ("import sys, pdfrenamer\n"
+                  "print('pdfrenamer.ui' in sys.modules)\n"
+                  "print('tkinter' in sys.modules)\n"
+                  "pdfrenamer.PDFRenamer\n"
+                  "print('pdfrenamer.ui' in sys.modules)\n")
+        package_dir = os.path.dirname(os.path.dirname(TEST_PY_PATH))
+        output = subprocess.check_output([sys.executable, "-c", script],
+                                         cwd=package_dir)
+
+        self.assertEqual(output.decode("ascii").split(),
+                         ["False", "False", "True"])
+
+    def test_startup_profile(self):
+        """Test reporting how long each phase of startup took."""
+
+        profile = _StartupProfile(time.time())
+        profile.mark("imports")
+        profile.mark("main window")
+
+        out = StringIO()
+        profile.report(out)
+
+        phases = [line.rsplit(None, 2)[0]
+                  for line in out.getvalue().splitlines()]
+        self.assertEqual(phases, ["imports", "main window", "total"])
+
+
+class BenchmarkTest(unittest.TestCase):
+    """Test case for the benchmark suite."""
+
+    def setUp(self):
+        """Set up the test case."""
+
+        self.temp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        """Clean up the test case."""
+
+        shutil.rmtree(self.temp_dir)
+
+    def test_corpus(self):
+        """Test that the generated corpus has the requested documents."""
+
+        paths = generate_corpus(self.temp_dir, 20, pages=3,
+                                image_size=(64, 64), gif_size=(32, 32))
+
+        self.assertEqual(sum(len(p) for p in paths.values()), 20)
+        self.assertEqual(len(os.listdir(self.temp_dir)), 20)
+
+        with open(paths["pdf"][0], "rb") as f:
+            self.assertIn(b"/Count 3", f.read())
+
+        image = PIL.Image.open(paths["gif"][0])
+        self.assertEqual(getattr(image, "n_frames", 1), 3)
+
+    def test_scan_and_rename(self):
+        """Test that the scan and rename benchmarks report results."""
+
+        paths = generate_corpus(self.temp_dir, 10, mix=[("pdf", 1)])
+
+        result = bench_scan(self.temp_dir, 10, repeat=1)
+        self.assertEqual(result["found"], 10)
+
+        result = bench_rename(paths["pdf"], 10, limit=5)
+        self.assertEqual((result["renames"], result["errors"]), (5, 0))
+        self.assertEqual(len([name for name in os.listdir(self.temp_dir)
+                              if name.startswith("renamed-")]), 5)
+
+
+class SessionReplayTest(unittest.TestCase):
+    """Test case for recording sessions to replay."""
+
+    class FakeRenamer(object):
+        """Stand-in for PDFRenamer with the methods that are recorded."""
+
+        class Name(object):
+            """Stand-in for the StringVar holding the new name."""
+
+            def __init__(self, value):
+                self.value = value
+
+            def get(self):
+                return self.value
+
+        def __init__(self):
+            self.calls = []
+            self._new_name = self.Name("Invoice")
+
+        def _preview(self, index):
+            self.calls.append(("_preview", index))
+
+        def go_next(self, event=None):
+            self.calls.append(("go_next",))
+            self._preview(1)
+
+        def rename(self, event=None):
+            self.calls.append(("rename",))
+
+        def reload(self, event=None):
+            self.calls.append(("reload",))
+
+        def open(self, *paths):
+            self.calls.append(("open",) + paths)
+
+        close_file = go_previous = open_dir = redo_rename = reload
+        rename_and_go_next = undo_rename = reload
+
+    def setUp(self):
+        """Set up the test case."""
+
+        self.temp_dir = tempfile.mkdtemp()
+        self.session_path = os.path.join(self.temp_dir, "session.jsonl")
+
+    def tearDown(self):
+        """Clean up the test case."""
+
+        shutil.rmtree(self.temp_dir)
+
+    def test_recording(self):
+        """Test recording actions and reading them back."""
+
+        renamer = recording(self.FakeRenamer, self.session_path)()
+
+        renamer.open("a.pdf", "b.pdf")
+        renamer.go_next()
+        renamer.rename()
+        renamer.reload(object())
+        renamer.reload()
+
+        # The recorded methods still do what they did
+        self.assertEqual(renamer.calls[1:3], [("go_next",), ("_preview", 1)])
+
+        actions = [(action, args)
+                   for t, action, args in read_session(self.session_path)]
+        self.assertEqual(actions,
+                         [("open", [os.path.abspath("a.pdf"),
+                                    os.path.abspath("b.pdf")]),
+                          ("go_next", []),
+                          ("set_name", ["Invoice"]),
+                          ("rename", []),
+                          ("reload", [True]),
+                          ("reload", [])])
+
+    def test_percentile(self):
+        """Test nearest-rank percentiles."""
+
+        values = list(range(1, 101))
+        self.assertEqual(percentile(values, 50), 50)
+        self.assertEqual(percentile(values, 99), 99)
+        self.assertEqual(percentile(values, 100), 100)
+        self.assertEqual(percentile([7], 95), 7)
+        self.assertIsNone(percentile([], 50))
+
+    def test_copy_recorded(self):
+        """Test copying only the files and folders a session opened."""
+
+        files_dir = os.path.join(self.temp_dir, "files")
+        folder = os.path.join(files_dir, "scans")
+        other = os.path.join(files_dir, "other")
+        os.makedirs(os.path.join(folder, "sub"))
+        os.makedirs(other)
+        for path in [os.path.join(folder, "a.pdf"),
+                     os.path.join(folder, "sub", "b.pdf"),
+                     os.path.join(other, "c.pdf"),
+                     os.path.join(other, "d.pdf")]:
+            with open(path, "w") as f:
+                f.write(path)
+
+        files = [os.path.join(other, "c.pdf"), os.path.join(folder, "a.pdf")]
+        dirs = [folder]
+
+        # A folder opened with open_dir is used as it is, not its parent
+        self.assertEqual(_common_dir([], [folder]), folder)
+        self.assertEqual(_common_dir(files, dirs), files_dir)
+
+        copy_dir = os.path.join(self.temp_dir, "copy")
+        _copy_recorded(files, dirs, files_dir, copy_dir)
+
+        copied = sorted(os.path.relpath(os.path.join(d, name), copy_dir)
+                        for d, subdirs, names in os.walk(copy_dir)
+                        for name in names)
+        self.assertEqual(copied, [os.path.join("other", "c.pdf"),
+                                  os.path.join("scans", "a.pdf"),
+                                  os.path.join("scans", "sub", "b.pdf")])
+
+
+class DirectoryScannerTest(unittest.TestCase):
+    """Test case for scanning folders in the background."""
+
+    def setUp(self):
+        """Set up the test case."""
+
+        self.temp_dir = tempfile.mkdtemp()
+        os.mkdir(os.path.join(self.temp_dir, "subfolder.pdf"))
+
+        self.paths = []
+        for i in range(25):
+            path = os.path.join(self.temp_dir, "scan{0:04}.pdf".format(i))
+            open(path, "w").close()
+            self.paths.append(path)
+
+        for i in range(5):
+            open(os.path.join(self.temp_dir, "notes{0}.txt".format(i)),
+                 "w").close()
+
+    def tearDown(self):
+        """Clean up the test case."""
+
+        shutil.rmtree(self.temp_dir)
+
+    def results(self, scanner):
+        """Return everything the scanner put on its queue."""
+
+        results = []
+        while True:
+            result = scanner.queue.get(timeout=10)
+            if result is None:
+                return results
+            results.append(result)
+
+    def test_batches(self):
+        """Test passing found files along in batches."""
+
+        scanner = DirectoryScanner(self.temp_dir,
+                                   lambda name: name.endswith(".pdf"))
+        scanner.batch_size = 10
+        scanner.batch_interval = 60
+        results = self.results(scanner.start())
+
+        # The first file is passed along right away
+        batches = [paths for paths, scanned in results]
+        self.assertEqual(len(batches[0]), 1)
+
+        for paths in batches:
+            self.assertLessEqual(len(paths), 10)
+            self.assertEqual(paths, sorted(paths))
+
+        self.assertEqual(sorted(sum(batches, [])), self.paths)
+        self.assertEqual(results[-1][1], 31)
+
+    def test_errors_and_canceling(self):
+        """Test scanning a missing folder, and canceling a scan."""
+
+        scanner = DirectoryScanner(os.path.join(self.temp_dir, "missing"),
+                                   lambda name: True)
+        results = self.results(scanner.start())
+        self.assertEqual(len(results), 1)
+        self.assertIsInstance(results[0], OSError)
+
+        scanner = DirectoryScanner(self.temp_dir, lambda name: True)
+        scanner.cancel()
+        self.assertEqual(self.results(scanner.start()), [])
+
+
+class DirectoryWatcherTest(unittest.TestCase):
+    """Test case for watching folders for changes."""
+
+    def setUp(self):
+        """Set up the test case."""
+
+        self.temp_dir = tempfile.mkdtemp()
+
+        for name in "a.txt", "b.txt":
+            shutil.copy(TEST_PY_PATH, os.path.join(self.temp_dir, name))
+
+    def tearDown(self):
+        """Clean up the test case."""
+
+        shutil.rmtree(self.temp_dir)
+
+    def test_changes(self):
+        """Test that renamed, deleted, and new files are reported."""
+
+        a, b, c, d = [os.path.join(self.temp_dir, name)
+                      for name in ("a.txt", "b.txt", "c.txt", "d.txt")]
+
+        watcher = DirectoryWatcher([self.temp_dir])
+        watcher.poll_interval = 0.1
+        watcher.start()
+
+        try:
+            # Give the watcher time to look at the folder
+            time.sleep(0.5)
+
+            os.rename(a, c)
+            os.remove(b)
+            shutil.copy(TEST_PY_PATH, d)
+
+            changes = []
+            deadline = time.time() + 5
+            while len(changes) < 3 and time.time() < deadline:
+                try:
+                    changes.append(watcher.queue.get(timeout=0.1))
+                except (queue.Empty):
+                    pass
+
+        finally:
+            watcher.cancel()
+
+        self.assertEqual(sorted(changes),
+                         [("added", d), ("moved", a, c), ("removed", b)])
@@ -0,0 +1,479 @@
+"""Text extraction for suggesting file names.
+
+The text on each document's first page is extracted in the background
+using Ghostscript's txtwrite device, and kept in a TextIndex on disk
+so reopening a folder doesn't extract anything again. Name templates
+are regular expressions that pick a new name out of that text.
+"""
+
+import hashlib
+import json
+import os
+import re
+import subprocess
+import sys
+import threading
+
+try:
+    # Python 3
+    import queue
+except (ImportError):
+    # Python 2
+    import Queue as queue
+
+from tkdocviewer.backends import GhostscriptBackend
+
+from .cache import file_identity
+
+
+__all__ = ["DEFAULT_TEMPLATES", "TextExtractor", "TextIndex",
+           "extract_text", "parse_template", "suggest_name"]
+
+
+# Name templates used if none are configured, as "pattern => format"
+# The format can refer to the pattern's named groups.
+DEFAULT_TEMPLATES = [
+    r"(?i)\binvoice\s*(?:no\.?|number|#)?\s*:?\s*(?P<number>[A-Z0-9][\w/-]{2,})"
+    r" => Invoice {number}",
+    r"\b(?P<year>(?:19|20)\d\d)-(?P<month>[01]\d)-(?P<day>[0-3]\d)\b"
+    r" => {year}-{month}-{day}",
+]
+
+# Characters that can't be used in file names on Windows
+_INVALID_CHARS = re.compile(r'[\\/:*?"<>|\x00-\x1f]+')
+
+# File types Ghostscript can extract text from
+_TEXT_EXTENSIONS = ".pdf", ".ps"
+
+# Seconds to wait for Ghostscript before giving up on a document
+_EXTRACT_TIMEOUT = 30
+
+# Used to save index files atomically
+_replace = getattr(os, "replace", os.rename)
+
+
+def extract_text(path, executable=None, timeout=_EXTRACT_TIMEOUT):
+    """Return the text on the first page of a document.
+
+    Returns an empty string for file types that don't contain text.
+    Raises an exception if Ghostscript fails, or if it doesn't finish
+    within timeout seconds, in which case it's killed.
+    """
+
+    base, ext = os.path.splitext(path)
+    if ext.lower() not in _TEXT_EXTENSIONS:
+        return ""
+
+    if executable is None:
+        executable = GhostscriptBackend.executable()
+
+    gs_args = [executable,
+               "-q",
+               "-dBATCH",
+               "-dNOPAUSE",
+               "-dSAFER",
+               "-dFirstPage=1",
+               "-dLastPage=1",
+               "-sDEVICE=txtwrite",
+               "-sOutputFile=-",
+               path]
+
+    subprocess_kw = {}
+    if sys.platform.startswith("win"):
+        # Hide the console window when running under pythonw.exe
+        si = subprocess.STARTUPINFO()
+        si.dwFlags |= subprocess.STARTF_USESHOWWINDOW
+        si.wShowWindow = subprocess.SW_HIDE
+        subprocess_kw["startupinfo"] = si
+
+    process = subprocess.Popen(gs_args,
+                               stdin=subprocess.PIPE,
+                               stdout=subprocess.PIPE,
+                               stderr=subprocess.PIPE,
+                               **subprocess_kw)
+
+    # Kill Ghostscript if it takes too long, such as on a damaged file
+    # that sends it into a loop. This works on Python 2, which doesn't
+    # support communicate(timeout=...).
+    expired = threading.Event()
+
+    def kill():
+        expired.set()
+        try:
+            process.kill()
+        except (OSError):
+            # It already exited
+            pass
+
+    timer = threading.Timer(timeout, kill)
+    timer.daemon = True
+    timer.start()
+
+    try:
+        output, errors = process.communicate()
+    finally:
+        timer.cancel()
+
+    if expired.is_set():
+        raise OSError("Ghostscript took more than {0} seconds to extract "
+                      "the text from {1}.".format(timeout, path))
+
+    if process.returncode:
+        raise subprocess.CalledProcessError(process.returncode, gs_args,
+                                            output)
+
+    return output.decode("utf-8", "replace")
+
+
+def parse_template(template):
+    """Return a (regex, format) pair for a "pattern => format" template.
+
+    Raises ValueError if the template is invalid.
+    """
+
+    pattern, sep, name_format = template.rpartition("=>")
+    if not sep:
+        raise ValueError("Name templates must be in the form "
+                         "'pattern => format': {0}".format(template))
+
+    try:
+        return re.compile(pattern.strip()), name_format.strip()
+    except (re.error) as err:
+        raise ValueError("Invalid pattern in name template: {0}: {1}"
+                         .format(template, err))
+
+
+def suggest_name(text, templates):
+    """Return a file name suggested by the first matching template.
+
+    The templates argument is a list of (regex, format) pairs. Returns
+    None if none of the templates match.
+    """
+
+    for regex, name_format in templates:
+        match = regex.search(text)
+        if not match:
+            continue
+
+        try:
+            name = name_format.format(*match.groups(), **match.groupdict())
+        except (IndexError, KeyError):
+            continue
+
+        # Make sure the name is usable as a file name
+        name = " ".join(_INVALID_CHARS.sub(" ", name).split())
+        if name:
+            return name
+
+    return None
+
+
+class TextIndex(object):
+    """Persistent index of the text in each document.
+
+    Entries are kept in a separate file for each folder, which is only
+    loaded once a file in that folder is looked up. Files are identified
+    by their device and inode numbers, so renaming a file doesn't lose
+    its text, and an entry is ignored once the file's size or
+    modification time changes.
+
+    This is safe to use from multiple threads.
+    """
+
+    def __init__(self, index_dir):
+        """Return a new TextIndex."""
+
+        self.index_dir = index_dir
+
+        # Entries for each folder that has been loaded, by folder path
+        # Each entry maps "dev:ino" to [size, mtime, text].
+        self._folders = {}
+
+        # Folders whose entries have changed since they were saved
+        self._dirty = set()
+
+        self._lock = threading.Lock()
+
+    # ------------------------------------------------------------------------
+
+    def entries(self, folder):
+        """Return a list of (key, text) pairs for a folder's documents.
+
+        The key identifies a file by its device and inode numbers.
+        """
+
+        with self._lock:
+            return [(key, entry[2])
+                    for key, entry in self._load(folder).items()]
+
+    def get(self, path, identity=None):
+        """Return the text in the specified file, or None if not indexed.
+
+        If identity is specified, it should be the file's current
+        file_identity(), which saves looking it up again.
+        """
+
+        if identity is None:
+            try:
+                identity = file_identity(path)
+            except (OSError):
+                return None
+
+        key, size, mtime = self._split(identity)
+
+        with self._lock:
+            entry = self._load(os.path.dirname(path)).get(key)
+
+        if entry and entry[0] == size and entry[1] == mtime:
+            return entry[2]
+
+        return None
+
+    def put(self, path, text, identity=None):
+        """Store the text in the specified file.
+
+        If identity is specified, it should be the file_identity() from
+        before the text was extracted, so text from a file that changed
+        in the meantime isn't stored.
+        """
+
+        if identity is None:
+            try:
+                identity = file_identity(path)
+            except (OSError):
+                return
+
+        key, size, mtime = self._split(identity)
+        folder = os.path.dirname(path)
+
+        with self._lock:
+            self._load(folder)[key] = [size, mtime, text]
+            self._dirty.add(folder)
+
+    def save(self):
+        """Save changed entries to disk."""
+
+        with self._lock:
+            dirty = list(self._dirty)
+            self._dirty.clear()
+
+            data = dict((folder, {"folder": folder,
+                                  "files": dict(self._folders[folder])})
+                        for folder in dirty)
+
+        if not data:
+            return
+
+        if not os.path.isdir(self.index_dir):
+            os.makedirs(self.index_dir)
+
+        for folder, contents in data.items():
+            index_path = self._index_path(folder)
+            temp_path = index_path + ".tmp"
+
+            with open(temp_path, "w") as index_file:
+                json.dump(contents, index_file)
+            _replace(temp_path, index_path)
+
+    # ------------------------------------------------------------------------
+
+    def _index_path(self, folder):
+        """Return the path to the index file for a folder."""
+
+        key = os.path.normcase(os.path.abspath(folder))
+        digest = hashlib.sha1(key.encode("utf-8", "replace")).hexdigest()
+        return os.path.join(self.index_dir, digest + ".json")
+
+    def _load(self, folder):
+        """Return the entries for a folder, loading them if needed.
+
+        The caller must hold the lock.
+        """
+
+        entries = self._folders.get(folder)
+
+        if entries is None:
+            try:
+                with open(self._index_path(folder), "r") as index_file:
+                    entries = json.load(index_file)["files"]
+            except (Exception):
+                # Not indexed yet, or the index is damaged
+                entries = {}
+
+            self._folders[folder] = entries
+
+        return entries
+
+    @staticmethod
+    def _split(identity):
+        """Split a file identity into a key, size, and modification time."""
+
+        dev, ino, size, mtime = identity
+        return "{0}:{1}".format(dev, ino), size, mtime
+
+
+class TextExtractor(object):
+    """Extract text from documents using background threads.
+
+    Call follow() with the list of open files and the current position
+    in it. Files are extracted starting from that position, so the
+    ones the user is about to view come first, and every file in the
+    list is eventually extracted. The list is not copied, so changes to
+    it are picked up as extraction continues.
+
+    Each path is only looked at once, however often follow() is called,
+    until it's passed to forget(). Call that when a file changes, or
+    with no path when the files are opened again.
+
+    The path of each file whose text is added to the index is put on
+    the results queue. The user interface thread should poll this queue
+    rather than waiting on it.
+
+    If a SearchIndex is specified, each file's text is also added to
+    it, whether it was just extracted or already in the index.
+    """
+
+    def __init__(self, index, workers=2, executable=None, search=None):
+        """Return a new TextExtractor."""
+
+        self.index = index
+        self.executable = executable
+        self.search = search
+
+        # Paths whose text has been extracted
+        self.results = queue.Queue()
+
+        # The list of files to extract, where to start, and how many
+        # files have been walked past since then
+        self._files = []
+        self._start = 0
+        self._offset = 0
+
+        # Files being extracted right now, and files already looked at
+        self._busy = set()
+        self._finished = set()
+
+        # Used to wake up the worker threads
+        self._condition = threading.Condition()
+
+        self._workers = max(1, workers)
+        self._threads = []
+        self._stopped = False
+
+    # ------------------------------------------------------------------------
+
+    @property
+    def busy(self):
+        """Whether any files are waiting to be or being extracted."""
+
+        with self._condition:
+            return (not self._stopped
+                    and (self._offset < len(self._files) or bool(self._busy)))
+
+    # ------------------------------------------------------------------------
+
+    def follow(self, files, start=0):
+        """Extract the text from a list of files, starting at an index."""
+
+        with self._condition:
+            self._files = files
+            self._start = start
+            self._offset = 0
+
+            if not self._threads and not self._stopped:
+                for i in range(self._workers):
+                    thread = threading.Thread(target=self._run)
+                    thread.daemon = True
+                    thread.start()
+                    self._threads.append(thread)
+
+            self._condition.notify_all()
+
+    def forget(self, path=None):
+        """Look at a file again, even if it was already looked at.
+
+        If no path is specified, every file is looked at again.
+        """
+
+        with self._condition:
+            if path is None:
+                self._finished.clear()
+            else:
+                self._finished.discard(path)
+
+            self._offset = 0
+            self._condition.notify_all()
+
+    def stop(self):
+        """Stop extracting text."""
+
+        with self._condition:
+            self._stopped = True
+            self._condition.notify_all()
+
+    # ------------------------------------------------------------------------
+
+    def _next_path(self):
+        """Return the next file to extract, waiting if necessary.
+
+        Returns None once the extractor is stopped.
+        """
+
+        with self._condition:
+            while not self._stopped:
+                files = self._files
+                count = len(files)
+
+                if self._offset < count:
+                    try:
+                        path = files[(self._start + self._offset) % count]
+                    except (IndexError):
+                        # The list got shorter since we checked its
+                        # length, so check again
+                        continue
+
+                    self._offset += 1
+
+                    if path not in self._busy and path not in self._finished:
+                        self._busy.add(path)
+                        return path
+
+                else:
+                    self._condition.wait()
+
+            return None
+
+    def _run(self):
+        """Extract text until stopped."""
+
+        while True:
+            path = self._next_path()
+            if path is None:
+                break
+
+            try:
+                identity = file_identity(path)
+                search = self.search
+                if search and search.has(path, identity):
+                    # This only records the file's current path, since
+                    # its text is already indexed
+                    search.add(path, "", identity)
+                    continue
+
+                text = self.index.get(path, identity)
+                if text is None:
+                    text = extract_text(path, self.executable)
+                    self.index.put(path, text, identity)
+                    self.results.put(path)
+
+                if search:
+                    search.add(path, text, identity)
+
+            except (Exception):
+                # This file just won't get a suggestion
+                pass
+
+            finally:
+                with self._condition:
+                    self._busy.discard(path)
+                    self._finished.add(path)
@@ -0,0 +1,230 @@
+"""Timing traces for finding out what keeps the user waiting.
+
+Each record is written as a JSON object on its own line, with these
+fields along with any others the caller specifies:
+
+ name   What was timed, such as "first_page" or "rename".
+ ts     When it started, in seconds since the epoch.
+ ms     How long it took, in milliseconds.
+
+Records about a document also include its path and format, so traces
+can be grouped to see which kinds of documents are slow.
+"""
+
+import json
+import logging
+import logging.handlers
+import os
+import threading
+import time
+
+
+__all__ = ["DocumentTrace", "Tracer"]
+
+
+class Tracer(object):
+    """Write timing records to a JSON Lines file.
+
+    The file is rotated once it reaches max_bytes, keeping backup_count
+    old files alongside it, so tracing can be left on indefinitely.
+    Nothing is written while enabled is False.
+
+    This is safe to use from multiple threads.
+    """
+
+    # Size at which the trace file is rotated
+    max_bytes = 4 * 1024 * 1024
+
+    # Number of rotated trace files to keep
+    backup_count = 3
+
+    def __init__(self, path, enabled=False):
+        """Return a new Tracer."""
+
+        self.path = path
+        self.enabled = enabled
+
+        # Created when the first record is written
+        self._handler = None
+
+        self._lock = threading.Lock()
+
+    # ------------------------------------------------------------------------
+
+    def close(self):
+        """Close the trace file."""
+
+        with self._lock:
+            if self._handler:
+                self._handler.close()
+                self._handler = None
+
+    def record(self, name, started, finished=None, **fields):
+        """Record something that started and finished at the given times.
+
+        Times are as returned by time.time(); finished defaults to now.
+        Any other fields are included in the record as they are.
+        """
+
+        if not self.enabled:
+            return
+
+        if finished is None:
+            finished = time.time()
+
+        fields["name"] = name
+        fields["ts"] = round(started, 3)
+        fields["ms"] = round(1000 * (finished - started), 1)
+
+        line = json.dumps(fields, sort_keys=True)
+
+        with self._lock:
+            try:
+                if not self._handler:
+                    trace_dir = os.path.dirname(self.path)
+                    if not os.path.isdir(trace_dir):
+                        os.makedirs(trace_dir)
+
+                    self._handler = logging.handlers.RotatingFileHandler(
+                        self.path,
+                        maxBytes=self.max_bytes,
+                        backupCount=self.backup_count)
+
+                self._handler.handle(logging.makeLogRecord({"msg": line}))
+
+            except (EnvironmentError):
+                # Tracing is only a diagnostic aid, so don't let it
+                # get in the way of the user's work
+                pass
+
+
+class DocumentTrace(object):
+    """Timings for displaying a single document.
+
+    Create one when the document is selected, then call the methods
+    below as the viewer's events arrive. Each one writes a record to
+    the tracer:
+
+     started()          "open"          Selecting it until rendering began
+     page_finished()    "first_page"    Selecting it until the first page
+                        "page"          Rendering each page
+     finished()         "document"      Selecting it until it was done
+     failed()           "error"         Selecting it until it failed
+     canceled()         "canceled"      Selecting it until another was
+
+    The first_page and pages_per_second attributes can be displayed as
+    they become available.
+    """
+
+    def __init__(self, tracer, path):
+        """Return a new DocumentTrace."""
+
+        self.tracer = tracer
+        self.path = path
+
+        base, ext = os.path.splitext(path)
+        self.format = ext.lower().lstrip(".")
+
+        # When the document was selected and when rendering started
+        self.opened = time.time()
+        self.rendering_started = None
+
+        # Number of pages rendered, and when the last one finished
+        self.pages = 0
+        self._last_page = None
+
+        # Seconds from selecting the document until its first page was
+        # rendered, or None if it hasn't been yet
+        self.first_page = None
+
+        # Whether a final record has been written
+        self.done = False
+
+    # ------------------------------------------------------------------------
+
+    @property
+    def pages_per_second(self):
+        """Pages rendered per second so far, or None if not known yet."""
+
+        if self.rendering_started is None or self._last_page is None:
+            return None
+
+        elapsed = self._last_page - self.rendering_started
+        if elapsed <= 0:
+            return None
+
+        return self.pages / elapsed
+
+    # ------------------------------------------------------------------------
+
+    def canceled(self):
+        """Record that another document was selected before this was done."""
+
+        if self.rendering_started is not None:
+            self._finish("canceled", pages=self.pages)
+
+    def failed(self, error=None):
+        """Record that the document could not be rendered."""
+
+        self._finish("error", error=str(error) if error else None)
+
+    def finished(self, page_count=None):
+        """Record that the document has been completely rendered."""
+
+        pages_per_second = self.pages_per_second
+        if pages_per_second is not None:
+            pages_per_second = round(pages_per_second, 2)
+
+        self._finish("document",
+                     pages=self.pages,
+                     page_count=page_count,
+                     pages_per_second=pages_per_second)
+
+    def page_finished(self):
+        """Record that a page has been rendered."""
+
+        if self.done:
+            return
+
+        now = time.time()
+
+        if self.rendering_started is None:
+            # The viewer didn't report starting, as when a page comes
+            # straight from the cache
+            self.rendering_started = self.opened
+
+        self.pages += 1
+        self._record("page",
+                     self._last_page or self.rendering_started,
+                     now,
+                     page=self.pages)
+
+        if self.first_page is None:
+            self.first_page = now - self.opened
+            self._record("first_page", self.opened, now)
+
+        self._last_page = now
+
+    def started(self):
+        """Record that the viewer has started rendering the document."""
+
+        if self.rendering_started is None and not self.done:
+            self.rendering_started = time.time()
+            self._record("open", self.opened, self.rendering_started)
+
+    # ------------------------------------------------------------------------
+
+    def _finish(self, name, **fields):
+        """Write the final record for this document."""
+
+        if not self.done:
+            self.done = True
+            self._record(name, self.opened, **fields)
+
+    def _record(self, name, started, finished=None, **fields):
+        """Write a record about this document."""
+
+        self.tracer.record(name, started, finished,
+                           path=self.path,
+                           format=self.format,
+                           **fields)
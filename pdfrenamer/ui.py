@@ -2,7 +2,7 @@
 
 import os
 import sys
-import shutil
+import time
 
 try:
     # Python 3
@@ -24,15 +24,29 @@ except (ImportError):
 try:
     # Python 3
     from configparser import RawConfigParser
+    import queue
 except (ImportError):
     # Python 2
     from ConfigParser import RawConfigParser
-
-import userpaths
-from tkdocviewer import DocViewer
+    import Queue as queue
 
 from . import config, icons, util
 from .about_dialog import AboutDialog
+from .cache import DiskCache
+from .catalog import FileCatalog, existing_files
+from .duplicates import DuplicateFinder, HashCache
+from .filelist import FileList
+from .gspool import GhostscriptPool
+from .journal import RenameJournal
+from .prefetch import Prefetcher
+from .rename import RenamerError, RenameWorker, new_path
+from .scan import DirectoryScanner
+from .search import SearchIndex
+from .text import (DEFAULT_TEMPLATES, TextExtractor, TextIndex,
+                   parse_template, suggest_name)
+from .tracing import DocumentTrace, Tracer
+from .viewer import Viewer
+from .watch import DirectoryWatcher
 
 
 __all__ = ["PDFRenamer"]
@@ -50,24 +64,137 @@ class PDFRenamer(Frame):
         top.title(config.NAME)
 
         # List of currently displayed files
-        self._files = []
+        self._files = FileCatalog()
 
         # Index of the currently selected file in self._files
         self._selected_index = 0
 
         # Absolute path of the currently selected file
-        # This is a StringVar so it can double as a variable for the
-        # radio buttons in the Go menu.
         self._selected_file = StringVar()
 
         # Basename of the current file, minus the extension
         self._new_name = StringVar()
 
+        # Whether to show the list of open files
+        self._show_file_list = BooleanVar()
+        self._show_file_list.set(1)
+
         # Last used directory for the Browse dialog
-        self._browse_dir = userpaths.get_my_documents()
+        # This and the next are None until they're first needed, since
+        # looking up the user's Documents folder can be slow.
+        self._browse_dir = None
 
         # Last used directory for the "Rename and Move" feature
-        self._rename_and_move_dir = userpaths.get_my_documents()
+        self._rename_and_move_dir = None
+
+        # Direction the user is moving through the list of files
+        # This is 1 for forward (Page Down) and -1 for backward (Page Up).
+        self._direction = 1
+
+        # Number of files to render ahead in the direction of movement
+        self._prefetch_depth = 2
+
+        # Milliseconds to wait for Page Up and Page Down to stop before
+        # displaying the selected file, or 0 to display every file
+        self._navigation_delay = 150
+
+        # Timer that ends keyboard navigation, and whether the selected
+        # file is waiting for it to be displayed
+        self._navigation_timer = None
+        self._display_pending = False
+
+        # Background scan started by open_dir(), if one is in progress
+        self._scanner = None
+
+        # Number of files found and directory entries examined by the scan
+        self._scan_found = 0
+        self._scan_count = 0
+
+        # Watches the folders of open files for changes made elsewhere
+        self._watcher = None
+
+        # Whether to open files added to the watched folder
+        # This is only done for a folder opened with open_dir().
+        self._watch_new_files = False
+
+        # Records each rename so an interrupted one can be recovered
+        self._journal = RenameJournal(os.path.join(
+            os.path.dirname(config.config_path), "renames.journal"))
+
+        # Renames files in the background so moves don't block the UI
+        self._rename_worker = RenameWorker(self._journal)
+
+        # Finished renames that can be undone or redone, as (src, dst)
+        self._undo_stack = []
+        self._redo_stack = []
+
+        # Renames that have been submitted but not finished, in order
+        self._pending_renames = []
+
+        # Undos and redos waiting for the renames before them to finish,
+        # as (method, requests) pairs in the order they were asked for
+        self._waiting_history = []
+
+        # Whether the loop processing finished renames is running
+        self._processing_renames = False
+
+        # Whether the status bar is showing the progress of a move
+        self._showing_move = False
+
+        # Background search for duplicate files, if one is in progress
+        self._duplicate_finder = None
+
+        # Open files with the same contents as an earlier one in the list
+        self._duplicates = set()
+
+        # Whether Page Up and Page Down skip over duplicates
+        self._skip_duplicates = BooleanVar()
+        self._skip_duplicates.set(0)
+
+        # Hashes used to find duplicates, kept between sessions
+        self._hash_cache = HashCache(os.path.join(
+            os.path.dirname(config.config_path), "hashes.json"))
+
+        # Whether to suggest new names based on each document's text
+        self._suggest_names = BooleanVar()
+        self._suggest_names.set(1)
+
+        # Templates used to suggest new names, as (regex, format) pairs
+        self._name_templates = [parse_template(template)
+                                for template in DEFAULT_TEMPLATES]
+
+        # Text extracted from each document, kept between sessions
+        self._text_index = TextIndex(os.path.join(
+            os.path.dirname(config.config_path), "text"))
+
+        # Inverted index of that text, for searching open files
+        self._search_index = SearchIndex(os.path.join(
+            os.path.dirname(config.config_path), "search"))
+
+        # Text of the search box
+        self._search_query = StringVar()
+
+        # Extracts text from upcoming files in the background
+        self._text_extractor = None
+
+        # Whether we are waiting for text to be extracted
+        self._processing_text = False
+
+        # Records how long documents take to display and files take to
+        # rename, for finding out what keeps the user waiting
+        self._tracer = Tracer(os.path.join(
+            os.path.dirname(config.config_path), "trace.jsonl"))
+
+        # Timings for the displayed document
+        self._document_trace = None
+
+        # Whether to record timings in the trace file
+        self._record_trace = BooleanVar()
+        self._record_trace.set(0)
+
+        # Whether to show timings for the displayed document
+        self._show_timings = BooleanVar()
+        self._show_timings.set(0)
 
         # ----------------------------------------------------------------
 
@@ -103,6 +230,16 @@ class PDFRenamer(Frame):
                        command=self.rename_and_go_next)
         b.pack(side="right", ipadx=6, fill="y")
 
+        # Search box for finding open files by their text
+        e = self.search_entry = Entry(f,
+                                      width=24,
+                                      textvariable=self._search_query)
+        e.pack(side="right", fill="y", padx=1)
+
+        # Key bindings for the search box
+        e.bind("<Return>", self.find_next)
+        e.bind("<Shift-Return>", self.find_previous)
+
         # Text entry for the new filename
         e = self.filename_entry = Entry(f,
                                         textvariable=self._new_name)
@@ -119,11 +256,14 @@ class PDFRenamer(Frame):
 
         # ----------------------------------------------------------------
 
+        # List of open files
+        fl = self.file_list = FileList(self, command=self._preview)
+
         # Document viewer widget
-        v = self.viewer = DocViewer(self,
-                                    borderwidth=0,
-                                    scrollbars="vertical",
-                                    use_ttk=True)
+        v = self.viewer = Viewer(self,
+                                 borderwidth=0,
+                                 scrollbars="vertical",
+                                 use_ttk=True)
 
         # This fits most of a letter-size page on a modern widescreen display
         v.fit_page(8.5, 11.0 * 3/5)
@@ -134,6 +274,26 @@ class PDFRenamer(Frame):
         # Pack the viewer widget
         v.pack(side="top", expand=1, fill="both")
 
+        # Keep rendered first pages between sessions
+        v.disk_cache = DiskCache(os.path.join(
+            os.path.dirname(config.config_path), "cache"))
+
+        # Render long documents using several cores at once
+        v.render_workers = min(4, util.cpu_count())
+
+        # Keeps Ghostscript running between documents, with enough
+        # processes for each worker to have one
+        v.gs_pool = GhostscriptPool(size=v.render_workers,
+                                    executable=v.gs_executable())
+
+        # Renders upcoming files in the background
+        self._prefetcher = Prefetcher(v.create_job)
+
+        # Extracts text from files ahead of the current one
+        self._text_extractor = TextExtractor(self._text_index,
+                                             executable=v.gs_executable(),
+                                             search=self._search_index)
+
         # Bind viewer events
         v.bind("<<DocumentStarted>>", self._handle_document_started)
         v.bind("<<PageCount>>", self._handle_page_count)
@@ -160,6 +320,13 @@ class PDFRenamer(Frame):
         st = self._status_text = Label(sf)
         st.grid(row=0, column=1, sticky="we")
 
+        # Timings for the displayed document
+        # Displayed in the bottom right corner if enabled
+        self._timing_label = Label(self,
+                                   relief="solid",
+                                   borderwidth=1,
+                                   padding=(4, 1))
+
         # ----------------------------------------------------------------
 
         # Populate the menu bar
@@ -175,6 +342,15 @@ class PDFRenamer(Frame):
         # Load configuration options
         self._load_config()
 
+        # Get Ghostscript ready for the first document
+        self.viewer.gs_pool.start()
+
+        # Show the file list if it's enabled
+        self.toggle_file_list()
+
+        # Clean up after renames interrupted in the last session
+        self._recover_renames()
+
     # ------------------------------------------------------------------------
 
     def about_dialog(self, event=None):
@@ -189,14 +365,14 @@ class PDFRenamer(Frame):
         debug_info.append("")
 
         # Ghostscript version
-        gs_version = DocViewer.gs_version()
+        gs_version = Viewer.gs_version()
         if gs_version:
             debug_info.append("Ghostscript version: {0}"
                               .format(gs_version))
             debug_info.append("Ghostscript executable: {0}"
-                              .format(DocViewer.gs_executable()))
+                              .format(Viewer.gs_executable()))
             debug_info.append("Ghostscript search path: {0}"
-                              .format(", ".join(DocViewer.gs_search_path())))
+                              .format(", ".join(Viewer.gs_search_path())))
         else:
             debug_info.append("Ghostscript not installed")
         debug_info.append("")
@@ -228,7 +404,7 @@ class PDFRenamer(Frame):
         if self._files:
             initialdir = os.path.dirname(self._selected_file.get())
         else:
-            initialdir = self._browse_dir
+            initialdir = self._browse_dir or self._documents_dir()
 
         new_files = askopenfilenames(parent=self,
                                      title="Select Files to Rename",
@@ -251,7 +427,7 @@ class PDFRenamer(Frame):
         if self._files:
             initialdir = os.path.dirname(self._selected_file.get())
         else:
-            initialdir = self._browse_dir
+            initialdir = self._browse_dir or self._documents_dir()
 
         new_dir = askdirectory(parent=self,
                                title="Select Folder",
@@ -272,10 +448,11 @@ class PDFRenamer(Frame):
         self.viewer.erase()
 
         i = self._selected_index
+        self._duplicates.discard(self._files[i])
         del self._files[i]
 
         if self._files:
-            self._update_go_menu()
+            self._update_file_list()
 
             # Display the next file on the list
             self._preview(i if i < len(self._files) - 1 else 0)
@@ -284,6 +461,22 @@ class PDFRenamer(Frame):
             # We're out of files; close the program
             self.close_window()
 
+    def close_duplicates(self, event=None):
+        """Close every file that duplicates an earlier one in the list."""
+
+        duplicates = self._duplicates
+        if not duplicates:
+            self.bell()
+            return
+
+        self.viewer.cancel_rendering()
+        self.viewer.erase()
+
+        self._remove_files(set(duplicates))
+        self._update_file_list()
+        self.file_list.set_marked(duplicates)
+        self._preview(self._selected_index)
+
     def close_window(self, event=None):
         """Close the application window."""
 
@@ -295,8 +488,98 @@ class PDFRenamer(Frame):
                       err,
                       parent=self)
 
+        # Stop rendering files we will never display
+        self._stop_navigating()
+        self._stop_scan()
+        self._stop_finding_duplicates()
+        self._stop_watching()
+        self._prefetcher.clear()
+
+        # Don't leave any files half-moved
+        self.wait_for_renames()
+        self._rename_worker.stop()
+        self._journal.close()
+
+        # Save file hashes so we don't have to compute them next time
+        self.viewer.disk_cache.save()
+        try:
+            self._hash_cache.save()
+        except (Exception):
+            # The worst case here is we have to hash files again
+            pass
+
+        self.viewer.gs_pool.close()
+
+        self._tracer.close()
+
+        # Save extracted text so reopening these folders is instant
+        self._text_extractor.stop()
+        try:
+            self._text_index.save()
+            self._search_index.save()
+        except (Exception):
+            # The worst case here is we extract the text again
+            pass
+
         self.winfo_toplevel().destroy()
 
+    def find_next(self, event=None, direction=1):
+        """Display the next file matching the search query.
+
+        Words in the query match any word starting with them, and
+        quoted phrases match those exact words in order. Only files
+        whose text has been extracted can be found.
+        """
+
+        query = self._search_query.get()
+        if not query.strip() or not self._files:
+            return
+
+        matches = self._search_index.search(query)
+
+        p = self._files
+        i = self._selected_index
+
+        for step in range(1, len(p)):
+            j = (i + direction * step) % len(p)
+            if p[j] in matches:
+                self._direction = direction
+                self._preview(j)
+
+                # Stay in the search box to find the next match
+                if event and event.widget == self.search_entry:
+                    self.focus_search_entry()
+                return "break"
+
+        if p[i] not in matches:
+            self.bell()
+
+        return "break"
+
+    def find_previous(self, event=None):
+        """Display the previous file matching the search query."""
+
+        return self.find_next(event, direction=-1)
+
+    def find_duplicates(self, event=None):
+        """Look for duplicate files among those open in the background.
+
+        Files that have the same contents as an earlier one in the list
+        are marked in the file list once the search is done.
+        """
+
+        self._stop_finding_duplicates()
+
+        self._duplicates = set()
+        self.file_list.set_marked(self._duplicates)
+
+        if self._files:
+            self._duplicate_finder = DuplicateFinder(self._files,
+                                                     self._hash_cache).start()
+
+            # Start this in a loop to collect the results
+            self._process_duplicates()
+
     def focus_filename_entry(self, event=None):
         """Set the focus on the filename entry widget and select all text."""
 
@@ -304,41 +587,63 @@ class PDFRenamer(Frame):
         self.filename_entry.icursor("end")
         self.filename_entry.selection_range(0, "end")
 
+    def focus_search_entry(self, event=None):
+        """Set the focus on the search box and select all text."""
+
+        self.search_entry.focus_set()
+        self.search_entry.icursor("end")
+        self.search_entry.selection_range(0, "end")
+
     def go_next(self, event=None):
         """Display the next file to process."""
 
-        p = self._files
-        i = self._selected_index
-
-        self._preview(i + 1 if i < len(p) - 1 else 0)
+        self._direction = 1
+        self._navigate(self._next_index(1), event)
 
     def go_previous(self, event=None):
         """Display the previous file to process."""
 
-        p = self._files
-        i = self._selected_index
+        self._direction = -1
+        self._navigate(self._next_index(-1), event)
+
+    def interrupt(self, event=None):
+        """Stop scanning for files and rendering the current one.
+
+        Files that were already found by open_dir() remain open.
+        """
 
-        self._preview(i - 1 if i > 0 else len(p) - 1)
+        if self._scanner:
+            self._scanner.cancel()
+
+        self.viewer.cancel_rendering()
 
     def open(self, *paths):
         """Open each of the specified files."""
 
         if paths:
+            self._stop_scan()
+            self._stop_finding_duplicates()
             self.viewer.cancel_rendering()
             self.viewer.erase()
 
             # Close all open files
-            del self._files[:]
+            self._files.clear()
+            self._text_extractor.forget()
             self._selected_index = 0
 
-            for path in paths:
-                if os.path.isfile(path):
-                    # Save the absolute path to this file
-                    self._files.append(os.path.abspath(path))
+            # Save the absolute path to each file that exists
+            self._files.extend(existing_files(paths))
 
-            self._update_go_menu()
+            self._update_file_list()
             self._preview(0)
 
+            # Keep the list up to date if files are moved or deleted
+            self._watch(set(os.path.dirname(path) for path in self._files),
+                        new_files=False)
+
+            # Look for duplicates among the files we just opened
+            self.find_duplicates()
+
         else:
             showwarning("No Files",
                         "Could not find any of the specified files.",
@@ -349,38 +654,48 @@ class PDFRenamer(Frame):
                 self.close_window()
 
     def open_dir(self, path):
-        """Open all files in the specified directory."""
+        """Open all files in the specified directory.
+
+        The folder is scanned in the background. The first file found
+        is displayed right away, and the rest are added to the list as
+        they are found. Press Esc to stop scanning.
+        """
 
         # Normalize the pathname
         # Having this here cleans weirdness from both Tk dialogs and sys.argv
         path = os.path.normpath(path)
 
-        # Identify files in this folder
-        items = map(lambda item: os.path.join(path, item),
-                    sorted(os.listdir(path)))
+        # Stop any scan that is already in progress
+        self._stop_scan()
+        self._stop_finding_duplicates()
 
-        # Filter out items we can't display
-        items = filter(self.viewer.can_display, items)
+        # The scanner can't call self.viewer.can_display() because it
+        # runs in a separate thread, so we check the extension ourselves
+        known_extensions = frozenset(self.viewer.known_extensions)
+        force_text_display = self.viewer.force_text_display.get()
 
-        # On Python 3, map and filter are distinct types
-        items = list(items)
+        def can_display(name):
+            base, ext = os.path.splitext(name)
+            return force_text_display or ext.lower() in known_extensions
 
-        if items:
-            self._files = items
-            self._selected_index = 0
-            self._preview(0)
-            self._update_go_menu()
+        self._scanner = DirectoryScanner(path, can_display).start()
+        self._scan_found = 0
+        self._scan_count = 0
 
-        else:
-            showwarning("No Files",
-                        "Could not process any files in the folder:\n"
-                        "{0}"
-                        .format(path),
-                        parent=self)
+        # Watch for changes while scanning so we don't miss any; files
+        # added during the scan are only opened once
+        self._watch([path], new_files=True)
 
-            if not self._files:
-                # Close the application if no files were previously open
-                self.close_window()
+        # Start this in a loop to add files to the list as they are found
+        self._process_scan()
+
+    def toggle_file_list(self, event=None):
+        """Show or hide the list of open files."""
+
+        if self._show_file_list.get():
+            self.file_list.pack(side="left", fill="y", before=self.viewer)
+        else:
+            self.file_list.pack_forget()
 
     def open_in_system_viewer(self, event=None):
         """Open the current document in the system's default viewer."""
@@ -391,18 +706,70 @@ class PDFRenamer(Frame):
         except (Exception) as err:
             showwarning("Error", err, parent=self)
 
+    def redo_rename(self, event=None):
+        """Redo the most recently undone rename.
+
+        If any renames are still running, this happens once they're done.
+        """
+
+        self._after_renames(self._redo_rename)
+
+    def _redo_rename(self):
+        """Redo the most recently undone rename right away."""
+
+        if not self._redo_stack:
+            self.bell()
+            return
+
+        src_path, dst_path = self._redo_stack.pop()
+        if self._path_taken(dst_path):
+            self._redo_stack.append((src_path, dst_path))
+            showerror("Error",
+                      "Cannot redo the rename because this file exists:\n"
+                      "{0}".format(dst_path),
+                      parent=self)
+            return
+
+        self._submit_rename(src_path, dst_path, "redo")
+
     def reload(self, event=None):
-        """Reload the displayed document from disk."""
+        """Reload the displayed document from disk.
+
+        The document is only rendered again if it has changed since it
+        was displayed, the rendering options have changed, or it wasn't
+        rendered completely the first time.
+        """
+
+        if not self._files:
+            return
+
+        job = self.viewer.displayed_job
+        if (job
+                and job.path == self._selected_file.get()
+                and job.identity
+                and not job.canceled
+                and not job.error
+                and job.options == self.viewer.render_options()):
+            # The watcher keeps the cached identity up to date, but check
+            # the file itself if the user asked for this
+            max_age = 0 if event else None
+            try:
+                identity = self._files.identity(self._selected_index, max_age)
+                if identity == job.identity:
+                    return
+            except (OSError):
+                # Let the viewer report the missing file
+                pass
 
         # Note: Binding directly to self.viewer.reload() won't work if
         # we renamed the document before reloading, so we have to do this.
-        if self._files:
-            self._preview(self._selected_index)
+        self._preview(self._selected_index)
 
     def rename(self, event=None):
         """Rename the current file.
 
-        Returns True if the file was successfully renamed, False otherwise.
+        The file is renamed in the background. Returns True if renaming
+        was started successfully, False otherwise.
         """
 
         # Sanity check: Make sure the viewer is done rendering before
@@ -425,9 +792,11 @@ class PDFRenamer(Frame):
     def rename_and_go_next(self, event=None):
         """Rename the current file and move on to the next one."""
 
-        # Only display the next file if renaming this one was successful
+        # Only display the next file if renaming this one was successful.
+        # Don't pass the event along, so the next file is displayed right
+        # away even if the user is renaming files in quick succession.
         if self.rename(event):
-            self.go_next(event)
+            self.go_next()
 
     def rename_and_move(self, event=None):
         """Rename this file and move it to another folder."""
@@ -445,7 +814,8 @@ class PDFRenamer(Frame):
         # Prompt for a destination filename
         dst_path = asksaveasfilename(parent=self,
                                      title="Rename and Move",
-                                     initialdir=self._rename_and_move_dir,
+                                     initialdir=(self._rename_and_move_dir
+                                                 or self._documents_dir()),
                                      initialfile=self._new_name.get() + ext,
                                      defaultextension=ext)
 
@@ -485,6 +855,43 @@ class PDFRenamer(Frame):
         # Set the focus on the filename entry box and select all text
         self.focus_filename_entry()
 
+    def undo_rename(self, event=None):
+        """Undo the most recent rename.
+
+        If any renames are still running, this happens once they're done.
+        """
+
+        self._after_renames(self._undo_rename)
+
+    def _undo_rename(self):
+        """Undo the most recent rename right away."""
+
+        if not self._undo_stack:
+            self.bell()
+            return
+
+        src_path, dst_path = self._undo_stack.pop()
+        if self._path_taken(src_path):
+            self._undo_stack.append((src_path, dst_path))
+            showerror("Error",
+                      "Cannot undo the rename because this file exists:\n"
+                      "{0}".format(src_path),
+                      parent=self)
+            return
+
+        self._submit_rename(dst_path, src_path, "undo")
+
+    def wait_for_renames(self):
+        """Wait for all renames started in the background to finish.
+
+        This blocks the user interface, so it's only for closing the
+        window. Undos and redos waiting on those renames are done too.
+        """
+
+        while self._pending_renames:
+            self._finish_rename(self._rename_worker.results.get())
+            self._run_waiting_history()
+
     def title(self, string=None):
         """Set the title of this window."""
 
@@ -503,7 +910,11 @@ class PDFRenamer(Frame):
         top = self.winfo_toplevel()
 
         # Cancel PDF rendering when Esc is pressed
-        top.bind("<Escape>", self.viewer.cancel_rendering)
+        top.bind("<Escape>", self.interrupt)
+
+        # Find the next or previous matching document with F3
+        top.bind("<F3>", self.find_next)
+        top.bind("<Shift-F3>", self.find_previous)
 
         # Reload the document when F5 is pressed
         top.bind("<F5>", self.reload)
@@ -513,12 +924,18 @@ class PDFRenamer(Frame):
         top.bind("<Next>", self.go_next)                    # page down
 
         # Control-letter key bindings, in alphabetical order
+        top.bind("<Control-f>", self.focus_search_entry)
         top.bind("<Control-l>", self.focus_filename_entry)
         top.bind("<Control-m>", self.rename_and_move)
         top.bind("<Control-o>", self.browse)
         top.bind("<Control-q>", self.close_window)
         top.bind("<Control-r>", self.open_in_system_viewer)
         top.bind("<Control-w>", self.close_file)
+        top.bind("<Control-y>", self.redo_rename)
+
+        # Control-Z in the entry box resets the new name, so undoing a
+        # rename also takes Shift
+        top.bind("<Control-Z>", self.undo_rename)
 
     def _create_menus(self):
         """Populate the menu bar."""
@@ -550,12 +967,27 @@ class PDFRenamer(Frame):
                            underline=0,
                            accelerator="Ctrl+W",
                            command=self.close_file)
+        m_file.add_command(label="Close Duplicates",
+                           underline=6,
+                           command=self.close_duplicates)
         m_file.add_command(label="Exit",
                            underline=1,
                            accelerator="Ctrl+Q",
                            command=self.close_window)
         m.add_cascade(label="File", underline=0, menu=m_file)
 
+        # Edit menu
+        m_edit = self.m_edit = Menu(m, tearoff=0)
+        m_edit.add_command(label="Undo Rename",
+                           underline=0,
+                           accelerator="Ctrl+Shift+Z",
+                           command=self.undo_rename)
+        m_edit.add_command(label="Redo Rename",
+                           underline=0,
+                           accelerator="Ctrl+Y",
+                           command=self.redo_rename)
+        m.add_cascade(label="Edit", underline=0, menu=m_edit)
+
         # Go menu
         m_go = self.m_go = Menu(m, tearoff=0)
         m_go.add_command(label="Previous",
@@ -567,7 +999,26 @@ class PDFRenamer(Frame):
                          accelerator="Page Down",
                          command=self.go_next)
         m_go.add_separator()
-        # The rest of the menu will be filled with the names of open files
+        m_go.add_command(label="Find...",
+                         underline=0,
+                         accelerator="Ctrl+F",
+                         command=self.focus_search_entry)
+        m_go.add_command(label="Find Next",
+                         underline=5,
+                         accelerator="F3",
+                         command=self.find_next)
+        m_go.add_command(label="Find Previous",
+                         underline=5,
+                         accelerator="Shift+F3",
+                         command=self.find_previous)
+        m_go.add_separator()
+        m_go.add_checkbutton(label="Skip Duplicates",
+                             underline=0,
+                             variable=self._skip_duplicates)
+        m_go.add_checkbutton(label="Show File List",
+                             underline=10,
+                             variable=self._show_file_list,
+                             command=self.toggle_file_list)
         m.add_cascade(label="Go", underline=0, menu=m_go)
 
         # Options menu
@@ -576,6 +1027,24 @@ class PDFRenamer(Frame):
                                   underline=11,
                                   variable=self.viewer.enable_downscaling,
                                   command=self.reload)
+        m_options.add_checkbutton(label="Render Visible Pages Only",
+                                  underline=7,
+                                  variable=self.viewer.lazy_rendering,
+                                  command=self.reload)
+        m_options.add_separator()
+        m_options.add_checkbutton(label="Suggest Names from Document Text",
+                                  underline=0,
+                                  variable=self._suggest_names,
+                                  command=self._suggest_name)
+        m_options.add_separator()
+        m_options.add_checkbutton(label="Record Timing Trace",
+                                  underline=7,
+                                  variable=self._record_trace,
+                                  command=self._update_tracer)
+        m_options.add_checkbutton(label="Show Timings",
+                                  underline=5,
+                                  variable=self._show_timings,
+                                  command=self._update_timings)
         m.add_cascade(label="Options", underline=0, menu=m_options)
 
         # Help menu
@@ -585,10 +1054,97 @@ class PDFRenamer(Frame):
                            command=self.about_dialog)
         m.add_cascade(label="Help", underline=0, menu=m_help)
 
+    @staticmethod
+    def _documents_dir():
+        """Return the path to the user's Documents folder."""
+
+        # This is only imported here since it isn't needed at startup
+        import userpaths
+        return userpaths.get_my_documents()
+
+    def _displayed_trace(self):
+        """Return the DocumentTrace for the displayed document.
+
+        A new one is started if the document is being displayed again,
+        such as after a reload.
+        """
+
+        trace = self._document_trace
+        path = self.viewer.display_path
+
+        if not trace or trace.done or trace.path != path:
+            trace = self._document_trace = DocumentTrace(self._tracer, path)
+
+        return trace
+
+    def _add_scanned_files(self, paths):
+        """Add files found by the directory scan or watcher to the list."""
+
+        if not self._scan_found:
+            # These are the first files found, so they replace whatever
+            # was open before
+            self._files.clear()
+            self._text_extractor.forget()
+            self._scan_found = self._files.merge(paths)
+            self._selected_index = 0
+            self._update_file_list()
+            self._preview(0)
+
+        else:
+            files = self._files
+            selected_file = files[self._selected_index]
+
+            # Files we already have are skipped, such as one the user
+            # renamed before the scan got to its new name
+            self._scan_found += files.merge(paths)
+
+            # Keep the same file selected
+            self._selected_index = files.index(selected_file)
+            self._update_file_list()
+            self._update_title()
+
+    def _finish_scan(self, error=None):
+        """Clean up after the directory scan is done."""
+
+        scanner = self._scanner
+        self._scanner = None
+
+        self._update_title()
+
+        if not self.viewer.rendering.get() and not self._showing_move:
+            # Hide the status bar and its widgets
+            self._hide_status_bar()
+            self._status_text.configure(text="")
+            self._progress_bar.grid_forget()
+
+        if error:
+            showwarning("Error",
+                        "Could not finish reading the folder:\n"
+                        "{0}\n"
+                        "\n"
+                        "{1}"
+                        .format(scanner.path, error),
+                        parent=self)
+
+        elif not self._scan_found and not scanner.canceler.is_set():
+            showwarning("No Files",
+                        "Could not process any files in the folder:\n"
+                        "{0}"
+                        .format(scanner.path),
+                        parent=self)
+
+        if not self._files:
+            # Close the application if no files were previously open
+            self.close_window()
+
+        elif not error:
+            # Look for duplicates now that we have the complete list
+            self.find_duplicates()
+
     def _handle_configure(self, event):
         """Handle window configuration events."""
 
-        if self.viewer.rendering.get():
+        if self.viewer.rendering.get() or self._scanner or self._showing_move:
             # Move the status bar if the window geometry changed
             self._hide_status_bar()
             self._show_status_bar()
@@ -596,6 +1152,9 @@ class PDFRenamer(Frame):
     def _handle_document_finished(self, event):
         """Handle DocViewer's DocumentFinished event."""
 
+        self._displayed_trace().finished(self.viewer.page_count)
+        self._update_timings()
+
         # Hide the status bar
         self._hide_status_bar()
 
@@ -605,13 +1164,19 @@ class PDFRenamer(Frame):
         # Hide the progress bar
         self._progress_bar.grid_forget()
 
+        # Go back to showing the progress of any background tasks
+        self._show_background_status()
+
     def _handle_document_started(self, event):
         """Handle DocViewer's DocumentStarted event."""
 
+        self._displayed_trace().started()
+
         # Tell the user we have started rendering
         self._status_text.configure(text="Loading the document...")
 
         # Display the progress bar
+        self._progress_bar.configure(mode="determinate", value=0)
         self._progress_bar.grid(row=0, column=0, padx=(0, 2))
 
         # Display the status bar
@@ -649,18 +1214,28 @@ class PDFRenamer(Frame):
             units = "pages"
 
         message = (
-            "Rendered {0} of {1} {2} (press Esc to interrupt)."
-            .format(rpc, pc, unit if pc == 1 else units)
+            "Rendered {0} of {1} {2} using {3} MB (press Esc to interrupt)."
+            .format(rpc, pc, unit if pc == 1 else units,
+                    self.viewer.page_memory // 2**20)
         )
 
         self._progress_bar.step()
         self._status_text.configure(text=message)
 
+        self._displayed_trace().page_finished()
+        self._update_timings()
+
     def _handle_rendering_error(self, event):
         """Handle DocViewer's RenderingError event."""
 
+        job = self.viewer.displayed_job
+        self._displayed_trace().failed(job.error if job else None)
+
         self._hide_status_bar()
 
+        # Go back to showing the progress of any background tasks
+        self._show_background_status()
+
     def _hide_status_bar(self):
         """Hide the status bar."""
 
@@ -679,9 +1254,81 @@ class PDFRenamer(Frame):
             enable_downscaling = cfg.getboolean("ui", "enable_downscaling")
             self.viewer.enable_downscaling.set(enable_downscaling)
 
+        if cfg.has_option("ui", "ghostscript_pool_size"):
+            pool_size = cfg.getint("ui", "ghostscript_pool_size")
+            self.viewer.gs_pool.size = max(0, pool_size)
+
+        if cfg.has_option("ui", "lazy_rendering"):
+            lazy_rendering = cfg.getboolean("ui", "lazy_rendering")
+            self.viewer.lazy_rendering.set(lazy_rendering)
+
+        if cfg.has_option("ui", "navigation_delay"):
+            navigation_delay = cfg.getint("ui", "navigation_delay")
+            self._navigation_delay = max(0, navigation_delay)
+
+        if cfg.has_option("ui", "skip_duplicates"):
+            skip_duplicates = cfg.getboolean("ui", "skip_duplicates")
+            self._skip_duplicates.set(skip_duplicates)
+
+        if cfg.has_option("ui", "suggest_names"):
+            suggest_names = cfg.getboolean("ui", "suggest_names")
+            self._suggest_names.set(suggest_names)
+
+        if cfg.has_option("ui", "record_trace"):
+            record_trace = cfg.getboolean("ui", "record_trace")
+            self._record_trace.set(record_trace)
+            self._update_tracer()
+
+        if cfg.has_option("ui", "show_timings"):
+            show_timings = cfg.getboolean("ui", "show_timings")
+            self._show_timings.set(show_timings)
+
+        if cfg.has_option("ui", "show_file_list"):
+            show_file_list = cfg.getboolean("ui", "show_file_list")
+            self._show_file_list.set(show_file_list)
+
+        if cfg.has_option("ui", "cache_memory_limit"):
+            # This is specified in megabytes
+            memory_limit = cfg.getint("ui", "cache_memory_limit")
+            self.viewer.cache.memory_limit = max(0, memory_limit) * 2**20
+
+        if cfg.has_option("ui", "disk_cache_size_limit"):
+            # This is specified in megabytes
+            size_limit = cfg.getint("ui", "disk_cache_size_limit")
+            self.viewer.disk_cache.size_limit = max(0, size_limit) * 2**20
+
+        if cfg.has_option("ui", "page_memory_limit"):
+            # This is specified in megabytes
+            memory_limit = cfg.getint("ui", "page_memory_limit")
+            self.viewer.page_memory_limit = max(0, memory_limit) * 2**20
+
+        if cfg.has_option("ui", "prefetch_depth"):
+            self._prefetch_depth = max(0, cfg.getint("ui", "prefetch_depth"))
+
+        if cfg.has_option("ui", "render_workers"):
+            self.viewer.render_workers = cfg.getint("ui", "render_workers")
+
+        # The pool was created before the configuration was loaded, so
+        # make sure each render worker still has a Ghostscript process,
+        # unless the pool is disabled
+        gs_pool = self.viewer.gs_pool
+        if gs_pool.size:
+            gs_pool.size = max(gs_pool.size, self.viewer.render_workers)
+
         if cfg.has_option("ui", "rename_and_move_dir"):
             self._rename_and_move_dir = cfg.get("ui", "rename_and_move_dir")
 
+        if cfg.has_section("name_templates"):
+            # Each option is a "pattern => format" template; the option
+            # names only determine the order they're tried in
+            templates = []
+            for name, template in sorted(cfg.items("name_templates")):
+                try:
+                    templates.append(parse_template(template))
+                except (ValueError) as err:
+                    showwarning("Invalid Name Template", err, parent=self)
+            self._name_templates = templates
+
     def _preview(self, index=0):
         """Preview the selected file."""
 
@@ -693,81 +1340,578 @@ class PDFRenamer(Frame):
                       parent=self)
             return
 
-        self._selected_index = index
+        # This takes the place of any file waiting to be displayed
+        self._stop_navigating()
+
+        self._select(index)
+        self._display_selected()
+
+    def _display_selected(self):
+        """Display the selected file and start work that depends on it."""
+
+        self._display_pending = False
+
+        if not self._files:
+            return
+
+        index = self._selected_index
         selected_file = self._files[index]
-        self._selected_file.set(selected_file)
 
-        # Open the next Browse dialog in the directory containing this file
-        self._browse_dir = os.path.dirname(selected_file)
+        # Display the file, using the prerendered pages if we have them
+        options = self.viewer.render_options()
+        job = self._prefetcher.take(selected_file, **options)
+        if job:
+            self.viewer.display_job(job)
+        else:
+            self.viewer.display_file(selected_file)
 
-        # Sanity check: Make sure the file still exists. If it doesn't,
-        # remove it silently from the list and display the next one.
-        if not os.path.isfile(selected_file):
-            return self.close_file()
+        # Render the next files in the background
+        self._prefetch()
 
-        # Display the file
-        self.viewer.display_file(selected_file)
+        # Extract text from this file and the ones after it
+        self._text_extractor.follow(self._files, index)
 
-        # Update the title bar to show where we are in the list
-        self.title("{0} of {1}".format(index + 1, len(self._files)))
+        # Suggest a better name if the document's text has one
+        self._suggest_name()
 
-        # Reset the new name of the displayed file
-        self.reset_new_name()
+    def _finish_navigating(self):
+        """Display the selected file once keyboard navigation stops."""
+
+        self._navigation_timer = None
+
+        if self._display_pending:
+            self._display_selected()
+
+    def _finish_rename(self, request):
+        """Update the list of files after a background rename."""
+
+        self._pending_renames.remove(request)
+
+        self._tracer.record("rename", request.submitted, request.finished,
+                            action=request.action,
+                            src_path=request.src_path,
+                            dst_path=request.dst_path,
+                            moved=(os.path.dirname(request.src_path)
+                                   != os.path.dirname(request.dst_path)),
+                            wait_ms=round(1000 * (request.started
+                                                  - request.submitted), 1),
+                            error=str(request.error) if request.error else None)
+
+        # The undo and redo stacks hold the original (src, dst) pair,
+        # which is reversed for an undo
+        if request.action == "undo":
+            pair = request.dst_path, request.src_path
+        else:
+            pair = request.src_path, request.dst_path
+
+        if request.error:
+            # Leave the failed action where the user can try it again
+            if request.action == "undo":
+                self._undo_stack.append(pair)
+            elif request.action == "redo":
+                self._redo_stack.append(pair)
+
+            showerror("Error",
+                      request.error,
+                      parent=self)
+            return
+
+        if request.action == "undo":
+            self._redo_stack.append(pair)
+
+        else:
+            self._undo_stack.append(pair)
+            if request.action == "rename":
+                # A new rename replaces whatever was undone
+                del self._redo_stack[:]
+
+        # Keep finding this file by its text
+        self._search_index.rename(request.src_path, request.dst_path)
+
+        # Keep marking this file if it's a duplicate
+        if request.src_path in self._duplicates:
+            self._duplicates.discard(request.src_path)
+            self._duplicates.add(request.dst_path)
+
+        # Find the file in the list, which may have changed since the
+        # rename was started
+        files = self._files
+        i = self._selected_index
+        if not (i < len(files) and files[i] == request.src_path):
+            try:
+                i = files.index(request.src_path)
+            except (ValueError):
+                # The file was closed in the meantime
+                return
+
+        # Update the list of available files
+        files[i] = request.dst_path
+        if i == self._selected_index:
+            self._selected_file.set(request.dst_path)
+
+        # Update this file's entry in the file list
+        self.file_list.refresh(i)
+
+        if request.action != "rename":
+            # Show the file that was undone or redone
+            if i == self._selected_index:
+                self.reset_new_name()
+            else:
+                self._preview(i)
+
+    def _after_renames(self, method):
+        """Call an undo or redo method once pending renames are done.
+
+        The undo and redo stacks aren't updated until a rename finishes,
+        so undoing while renames are running has to wait for them.
+        """
+
+        if self._pending_renames or self._waiting_history:
+            self._waiting_history.append((method,
+                                          list(self._pending_renames)))
+        else:
+            method()
+
+    def _run_waiting_history(self):
+        """Undo or redo renames whose earlier renames are now done."""
+
+        waiting = self._waiting_history
+        pending = self._pending_renames
+
+        while waiting and not any(request in pending
+                                  for request in waiting[0][1]):
+            method, requests = waiting.pop(0)
+            method()
+
+    def _navigate(self, index, event=None):
+        """Move to another file at the user's request.
+
+        The first file is displayed right away, but while the user keeps
+        pressing Page Up or Page Down (as when holding one down), files
+        are only selected. The last one is displayed once the keys have
+        been left alone for self._navigation_delay milliseconds, so we
+        don't start rendering files the user is just passing through.
+
+        Calls that aren't from an event, like from rename_and_go_next(),
+        always display the file right away.
+        """
+
+        if (event is None
+                or not self._navigation_delay
+                or not self._navigation_timer):
+            self._preview(index)
+
+        else:
+            self.after_cancel(self._navigation_timer)
+
+            self._select(index)
+            self._display_pending = True
+
+            # Stop rendering the file we just skipped, and prefetched
+            # files we won't reach before the user stops
+            self.viewer.cancel_rendering()
+            self._prefetcher.keep(self._prefetch_paths())
+
+        self._navigation_timer = self.after(self._navigation_delay,
+                                            self._finish_navigating)
+
+    def _next_index(self, direction):
+        """Return the index of the next file to display in a direction.
+
+        Duplicates are skipped if that option is enabled, unless every
+        other file is a duplicate.
+        """
+
+        p = self._files
+        i = self._selected_index
+
+        if self._skip_duplicates.get():
+            for step in range(1, len(p)):
+                j = (i + direction * step) % len(p)
+                if p[j] not in self._duplicates:
+                    return j
+
+        return (i + direction) % len(p)
+
+    def _prefetch(self):
+        """Render the files around the current one in the background."""
+
+        self._prefetcher.prefetch(self._prefetch_paths())
+
+    def _prefetch_paths(self):
+        """Return the files to prefetch, most likely to be viewed first."""
+
+        p = self._files
+        i = self._selected_index
+        d = self._direction
+
+        # Don't hold files open while they're being moved
+        renaming = set(request.src_path for request in self._pending_renames)
+
+        # Files ahead in the direction of movement come first, followed
+        # by the one behind in case the user changes their mind
+        offsets = [d * n for n in range(1, self._prefetch_depth + 1)]
+        if self._prefetch_depth:
+            offsets.append(-d)
+
+        paths = []
+        for offset in offsets:
+            path = p[(i + offset) % len(p)]
+            if path != p[i] and path not in paths and path not in renaming:
+                paths.append(path)
+
+        return paths
+
+    def _process_scan(self):
+        """Retrieve files found by the directory scan."""
+
+        scanner = self._scanner
+
+        # Sanity check: Make sure we currently have a scan!
+        if not scanner:
+            return
+
+        timeout = 50    # msec
+
+        found = []
+        done = False
+        error = None
+
+        try:
+            # Collect everything found since we last checked
+            while True:
+                item = scanner.queue.get_nowait()
+
+                if item is None:
+                    # A None value indicates the scan is done
+                    done = True
+                    break
+
+                elif isinstance(item, Exception):
+                    error = item
+
+                else:
+                    paths, self._scan_count = item
+                    found += paths
+
+        except (queue.Empty):
+            # Still waiting on the next batch
+            pass
+
+        if found:
+            # Each batch is sorted, so this only has to merge them
+            self._add_scanned_files(sorted(found))
+
+        if done:
+            self._finish_scan(error)
+
+        else:
+            self._show_scan_status()
+
+            # Keep the loop going until the scan is done
+            self.after(timeout, self._process_scan)
+
+    def _process_watch(self):
+        """Apply changes made to the watched folders outside the program."""
+
+        watcher = self._watcher
+
+        # Sanity check: Make sure we're currently watching!
+        if not watcher:
+            return
+
+        timeout = 250   # msec
+
+        # Renames started by this program are handled by _finish_rename()
+        renaming = set()
+        for request in self._pending_renames:
+            renaming.add(request.src_path)
+            renaming.add(request.dst_path)
+
+        added = set()
+        removed = set()
+        selected_changed = False
+
+        try:
+            while True:
+                item = watcher.queue.get_nowait()
+
+                if isinstance(item, Exception):
+                    # Keep going without watching; the worst case is
+                    # the list of files gets out of date
+                    self._watcher = None
+                    break
+
+                change, path = item[0], item[-1]
+                if path in renaming or item[1] in renaming:
+                    continue
+
+                if change == "added":
+                    added.add(path)
+                    removed.discard(path)
+
+                elif change == "removed":
+                    removed.add(path)
+                    added.discard(path)
+
+                elif change == "moved":
+                    src_path = item[1]
+                    if src_path in added:
+                        added.discard(src_path)
+                        added.add(path)
+                    elif not self._rename_open_file(src_path, path):
+                        added.add(path)
+                    removed.discard(path)
+
+                elif change == "changed":
+                    self._files.invalidate(path)
+                    self._text_extractor.forget(path)
+                    if path == self._selected_file.get():
+                        selected_changed = True
+
+        except (queue.Empty):
+            # Still waiting on the next change
+            pass
+
+        if added and self._watch_new_files:
+            files = self._files
+            paths = sorted(path for path in added
+                           if path not in files
+                           and self.viewer.can_display(path))
+            if paths:
+                self._add_scanned_files(paths)
+
+        if removed:
+            selected_removed = self._remove_files(removed)
+
+            if not self._files:
+                # We're out of files; close the program
+                return self.close_window()
+
+            self._update_file_list()
+
+            if selected_removed:
+                self.viewer.cancel_rendering()
+                self.viewer.erase()
+                self._preview(self._selected_index)
+            else:
+                self._update_title()
+
+        elif selected_changed:
+            # Only renders the file again if its contents changed
+            self.reload()
+
+        if self._watcher:
+            # Keep the loop going until we stop watching
+            self.after(timeout, self._process_watch)
+
+    def _process_duplicates(self):
+        """Retrieve the results of the search for duplicates."""
+
+        finder = self._duplicate_finder
+
+        # Sanity check: Make sure we currently have a search!
+        if not finder:
+            return
+
+        timeout = 100   # msec
+
+        try:
+            while True:
+                item = finder.queue.get_nowait()
+
+                if item is None:
+                    # A None value indicates the search is done
+                    self._duplicate_finder = None
+                    break
+
+                elif isinstance(item, Exception):
+                    # Not worth interrupting the user over
+                    pass
+
+                else:
+                    # The first file in each group is the original;
+                    # skip any that were closed since the search started
+                    files = self._files
+                    for group in item:
+                        self._duplicates.update(path for path in group[1:]
+                                                if path in files)
+                    self.file_list.set_marked(self._duplicates)
+                    self._update_title()
+
+        except (queue.Empty):
+            # Keep the loop going until the search is done
+            self.after(timeout, self._process_duplicates)
+
+    def _process_text(self):
+        """Suggest a name once the displayed file's text is extracted."""
+
+        timeout = 100   # msec
+
+        extractor = self._text_extractor
+        selected_file = self._selected_file.get()
+        extracted = False
+
+        try:
+            while True:
+                if extractor.results.get_nowait() == selected_file:
+                    extracted = True
+
+        except (queue.Empty):
+            # Still waiting on the next file
+            pass
+
+        if extracted or not extractor.busy:
+            # Either the text is ready, or it couldn't be extracted
+            self._processing_text = False
+            self._suggest_name()
+
+        else:
+            # Keep the loop going until the text is ready
+            self.after(timeout, self._process_text)
 
     def _process_rename(self, dst_dir=None):
         """Rename and optionally move the displayed file.
 
         If dst_dir is specified, the renamed file will be moved to that
         location. Otherwise, it will be renamed in-place.
+
+        The file is renamed in the background; the list of files is
+        updated once it's done. Raises RenamerError if the new name is
+        invalid or already taken.
         """
 
-        # Identify the new name the user has entered
-        dst_base = self._new_name.get()
-        if not dst_base:
-            raise RenamerError("Please enter a new name for this file.")
+        started = time.time()
 
         # Identify the displayed file
         src_path = self._selected_file.get()
 
-        # Separate the dirname and basename
-        src_dir, src_base = os.path.split(src_path)
+        pending = self._pending_renames
+        for request in pending:
+            if request.src_path == src_path:
+                # This file is already being renamed, so rename it again
+                # once that's done
+                src_path = request.dst_path
+
+        # Identify the new path based on the name the user has entered
+        dst_path = new_path(src_path, self._new_name.get(), dst_dir,
+                            self._path_taken)
 
-        # Separate the basename and extension
-        src_base, ext = os.path.splitext(src_base)
+        self._submit_rename(src_path, dst_path)
 
-        # Identify the destination directory
-        if not dst_dir:
-            dst_dir = src_dir
+        self._tracer.record("rename_request", started,
+                            src_path=src_path,
+                            dst_path=dst_path)
 
-        # Reconstruct the filename using the new basename
-        dst_path = os.path.join(dst_dir, dst_base + ext)
+    def _process_renames(self):
+        """Retrieve finished renames from the background worker."""
 
-        # Sanity check: Make sure there's no existing file with this name
-        if src_path != dst_path and os.path.exists(dst_path):
-            raise RenamerError("File already exists:\n"
-                               "{0}"
-                               .format(dst_path))
+        timeout = 50    # msec
 
         try:
-            # Rename the file
-            shutil.move(src_path, dst_path)
+            while True:
+                self._finish_rename(self._rename_worker.results.get_nowait())
+                self._run_waiting_history()
 
-            # Update the list of available files
-            self._files[self._selected_index] = dst_path
-            self._selected_file.set(dst_path)
+        except (queue.Empty):
+            # Still waiting on the next rename
+            pass
+
+        # Show the progress of a file being copied to another filesystem
+        for request in self._pending_renames:
+            if request.progress:
+                self._show_move_status(request)
+                break
+
+        else:
+            if self._showing_move:
+                self._showing_move = False
+                self._hide_status_bar()
+                self._show_background_status()
+
+        if self._pending_renames:
+            # Keep the loop going until all renames are done
+            self.after(timeout, self._process_renames)
+        else:
+            self._processing_renames = False
+
+    def _path_taken(self, path):
+        """Return whether a file exists or is about to be renamed to path.
 
-            # Update the Go menu
-            self._update_go_menu()
+        Conflicts with open files are found without touching the disk.
+        """
+
+        return (self._files.conflicts(path)
+                or any(request.dst_path == path
+                       for request in self._pending_renames)
+                or os.path.exists(path))
+
+    def _recover_renames(self):
+        """Finish or roll back renames interrupted in the last session."""
+
+        try:
+            messages = self._journal.recover()
 
         except (Exception) as err:
-            # IOError, OSError, and maybe shutil.Error are the most likely
-            # exceptions, but we may as well catch them all so this will fail
-            # gracefully if someone ever finds a weird corner case.
-            raise RenamerError("Could not rename:\n"
-                               "{0}\n"
-                               "\n"
-                               "{1}"
-                               .format(src_path, err))
+            showwarning("Could Not Open Rename Journal",
+                        "Renames will not be recoverable if the program "
+                        "closes unexpectedly.\n\n{0}".format(err),
+                        parent=self)
+            return
+
+        if messages:
+            showwarning("Recovered Interrupted Renames",
+                        "Some renames were interrupted the last time "
+                        "{0} closed.\n\n{1}"
+                        .format(config.NAME, "\n".join(messages)),
+                        parent=self)
+
+    def _remove_files(self, paths):
+        """Remove a set of paths from the list of open files.
+
+        The selected index is updated to point to the same file, or the
+        next remaining one if it was removed. Call _update_file_list()
+        afterward. Returns whether the selected file was removed.
+        """
+
+        files = self._files
+
+        i = self._selected_index
+        selected_removed = i < len(files) and files[i] in paths
+        while i < len(files) and files[i] in paths:
+            i += 1
+        kept_before = sum(1 for path in files[:i] if path not in paths)
+
+        files.remove(paths)
+        self._duplicates.difference_update(paths)
+
+        self._selected_index = kept_before if kept_before < len(files) else 0
+        return selected_removed
+
+    def _rename_open_file(self, src_path, dst_path):
+        """Update the list of files after one was renamed elsewhere.
+
+        Returns False if the file wasn't open.
+        """
+
+        try:
+            i = self._files.index(src_path)
+        except (ValueError):
+            return False
+
+        self._files[i] = dst_path
+        self._search_index.rename(src_path, dst_path)
+
+        if src_path in self._duplicates:
+            self._duplicates.discard(src_path)
+            self._duplicates.add(dst_path)
+
+        if i == self._selected_index:
+            # Keep the name the user may be typing
+            self._selected_file.set(dst_path)
+
+        self.file_list.refresh(i)
+        return True
 
     def _save_config(self):
         """Save configuration options."""
@@ -778,10 +1922,30 @@ class PDFRenamer(Frame):
         if not cfg.has_section("ui"):
             cfg.add_section("ui")
 
-        cfg.set("ui", "browse_dir", self._browse_dir)
+        if self._browse_dir:
+            cfg.set("ui", "browse_dir", self._browse_dir)
+        cfg.set("ui", "cache_memory_limit",
+                str(self.viewer.cache.memory_limit // 2**20))
+        cfg.set("ui", "disk_cache_size_limit",
+                str(self.viewer.disk_cache.size_limit // 2**20))
         cfg.set("ui", "enable_downscaling",
                 str(self.viewer.enable_downscaling.get()))
-        cfg.set("ui", "rename_and_move_dir", self._rename_and_move_dir)
+        cfg.set("ui", "ghostscript_pool_size",
+                str(self.viewer.gs_pool.size))
+        cfg.set("ui", "lazy_rendering",
+                str(self.viewer.lazy_rendering.get()))
+        cfg.set("ui", "navigation_delay", str(self._navigation_delay))
+        cfg.set("ui", "page_memory_limit",
+                str(self.viewer.page_memory_limit // 2**20))
+        cfg.set("ui", "prefetch_depth", str(self._prefetch_depth))
+        if self._rename_and_move_dir:
+            cfg.set("ui", "rename_and_move_dir", self._rename_and_move_dir)
+        cfg.set("ui", "render_workers", str(self.viewer.render_workers))
+        cfg.set("ui", "record_trace", str(self._record_trace.get()))
+        cfg.set("ui", "show_file_list", str(self._show_file_list.get()))
+        cfg.set("ui", "show_timings", str(self._show_timings.get()))
+        cfg.set("ui", "skip_duplicates", str(self._skip_duplicates.get()))
+        cfg.set("ui", "suggest_names", str(self._suggest_names.get()))
 
         try:
             # Make a folder for the configuration file if needed
@@ -797,6 +1961,110 @@ class PDFRenamer(Frame):
             # The worst case here is we can't save the configuration file
             pass
 
+    def _submit_rename(self, src_path, dst_path, action="rename"):
+        """Rename a file in the background.
+
+        The list of files is updated once it's done.
+        """
+
+        pending = self._pending_renames
+        pending.append(self._rename_worker.submit(src_path, dst_path, action))
+
+        if not self._processing_renames:
+            # Start this in a loop to process renames as they finish,
+            # unless it's already running, such as when an undo that
+            # was waiting on a rename is done by the loop
+            self._processing_renames = True
+            self._process_renames()
+
+    def _select(self, index):
+        """Select a file without displaying it yet."""
+
+        self._selected_index = index
+        selected_file = self._files[index]
+        self._selected_file.set(selected_file)
+        self.file_list.select(index)
+
+        # Open the next Browse dialog in the directory containing this file
+        self._browse_dir = os.path.dirname(selected_file)
+
+        # Note there's no need to check the file still exists, since the
+        # watcher removes deleted files from the list
+
+        # Start timing from when the user asked to see the file
+        if self._document_trace:
+            self._document_trace.canceled()
+        self._document_trace = DocumentTrace(self._tracer, selected_file)
+        self._update_timings()
+
+        # Update the title bar to show where we are in the list
+        self._update_title()
+
+        # Reset the new name of the displayed file
+        self.reset_new_name()
+
+    def _show_background_status(self):
+        """Show the progress of any background tasks in the status bar."""
+
+        for request in self._pending_renames:
+            if request.progress:
+                self._show_move_status(request)
+                return
+
+        if self._scanner:
+            self._show_scan_status()
+
+    def _show_move_status(self, request):
+        """Show the progress of a file being moved in the status bar."""
+
+        # Rendering progress takes priority
+        if self.viewer.rendering.get():
+            return
+
+        stage, done, total = request.progress
+        name = os.path.basename(request.src_path)
+
+        if stage == "verifying":
+            message = "Checking the copy of {0}...".format(name)
+        else:
+            message = (
+                "Moving {0} ({1} of {2} MB)..."
+                .format(name, done // 2**20, total // 2**20)
+            )
+
+        self._status_text.configure(text=message)
+
+        self._progress_bar.configure(mode="determinate",
+                                     value=done,
+                                     maximum=max(1, total))
+        self._progress_bar.grid(row=0, column=0, padx=(0, 2))
+
+        self._showing_move = True
+        self._show_status_bar()
+
+    def _show_scan_status(self):
+        """Show the progress of the directory scan in the status bar."""
+
+        # Rendering and move progress take priority
+        if self.viewer.rendering.get() or self._showing_move:
+            return
+
+        message = (
+            "Found {0} files among {1} items in the folder "
+            "(press Esc to stop looking)."
+            .format(self._scan_found, self._scan_count)
+        )
+
+        self._status_text.configure(text=message)
+
+        # There's no way to know how many items are left, so the progress
+        # bar just shows we're still working
+        self._progress_bar.configure(mode="indeterminate")
+        self._progress_bar.grid(row=0, column=0, padx=(0, 2))
+        self._progress_bar.step()
+
+        self._show_status_bar()
+
     def _show_status_bar(self):
         """Show the status bar."""
 
@@ -812,21 +2080,131 @@ class PDFRenamer(Frame):
         sf_y = win_height - sf_height - 4
         self._status_frame_outer.place(x=0, y=sf_y)
 
-    def _update_go_menu(self):
-        """Update the navigation menu."""
+    def _stop_finding_duplicates(self):
+        """Stop the search for duplicates and discard its results."""
+
+        if self._duplicate_finder:
+            self._duplicate_finder.cancel()
+            self._duplicate_finder = None
+
+    def _stop_watching(self):
+        """Stop watching for changes to the open files' folders."""
+
+        if self._watcher:
+            self._watcher.cancel()
+            self._watcher = None
+
+    def _stop_navigating(self):
+        """Forget about any file waiting to be displayed."""
+
+        if self._navigation_timer:
+            self.after_cancel(self._navigation_timer)
+            self._navigation_timer = None
+
+        self._display_pending = False
+
+    def _stop_scan(self):
+        """Stop the directory scan and discard its results."""
+
+        if self._scanner:
+            self._scanner.cancel()
+            self._scanner = None
+
+    def _suggest_name(self):
+        """Suggest a new name for the displayed file from its text.
+
+        The suggestion only replaces the original name, never something
+        the user has typed. If the file's text hasn't been extracted
+        yet, this waits for it in the background.
+        """
+
+        if not self._suggest_names.get():
+            return
+
+        selected_file = self._selected_file.get()
+        base, ext = os.path.splitext(os.path.basename(selected_file))
+        if self._new_name.get() != base:
+            return
+
+        text = self._text_index.get(selected_file)
+        if text is None:
+            if self._text_extractor.busy and not self._processing_text:
+                # Start this in a loop to wait for the text
+                self._processing_text = True
+                self._process_text()
+            return
+
+        name = suggest_name(text, self._name_templates)
+        if name:
+            self._new_name.set(name)
+
+            # Select the suggestion so typing replaces it
+            self.filename_entry.icursor("end")
+            self.filename_entry.selection_range(0, "end")
+
+    def _watch(self, paths, new_files):
+        """Watch the specified folders for changes to the open files.
+
+        If new_files is True, files added to the folders are opened.
+        """
+
+        self._stop_watching()
 
-        m_go = self.m_go
-        m_go.delete(3, "end")
+        self._watcher = DirectoryWatcher(paths).start()
+        self._watch_new_files = new_files
 
-        for i, path in enumerate(self._files):
-            # Command to display this file
-            go_command = lambda event=None, i=i: self._preview(i)
+        # Start this in a loop to apply changes as they happen
+        self._process_watch()
 
-            # Add this file to the menu
-            m_go.add_radiobutton(label=os.path.basename(path),
-                                 variable=self._selected_file,
-                                 value=path,
-                                 command=go_command)
+    def _update_file_list(self):
+        """Update the file list after self._files has changed."""
+
+        self.file_list.set_items(self._files)
+
+        if self._files:
+            self.file_list.select(self._selected_index)
+
+    def _update_timings(self):
+        """Show or hide timings for the displayed document."""
+
+        trace = self._document_trace
+        label = self._timing_label
+
+        if not (self._show_timings.get()
+                and trace
+                and trace.first_page is not None):
+            label.place_forget()
+            return
+
+        message = "First page in {0:.0f} ms".format(1000 * trace.first_page)
+
+        pages_per_second = trace.pages_per_second
+        if trace.pages > 1 and pages_per_second:
+            message += ", {0:.1f} pages/s".format(pages_per_second)
+
+        message += ", {0} MB".format(self.viewer.page_memory // 2**20)
+
+        label.configure(text=message)
+        label.place(relx=1.0, rely=1.0, x=-2, y=-2, anchor="se")
+
+    def _update_tracer(self):
+        """Start or stop recording timings in the trace file."""
+
+        self._tracer.enabled = bool(self._record_trace.get())
+        if not self._tracer.enabled:
+            self._tracer.close()
+
+    def _update_title(self):
+        """Update the title bar to show where we are in the list."""
+
+        if self._files:
+            title = "{0} of {1}".format(self._selected_index + 1,
+                                        len(self._files))
+
+            if self._duplicates:
+                title += " ({0} duplicates)".format(len(self._duplicates))
+
+            self.title(title)
 
 
 class Toolbutton(Button):
@@ -852,9 +2230,3 @@ class Toolbutton(Button):
 
     def _handle_leave(self, event):
         self.configure(style="ToolbarFlat.TButton")
-
-
-class RenamerError(Exception):
-    """Exception representing an error message during a rename operation."""
-
-    pass
@@ -4,6 +4,20 @@ import os
 import sys
 
 
+def cpu_count():
+    """Return the number of processors in the system."""
+
+    try:
+        # Python 3
+        return os.cpu_count() or 1
+
+    except (AttributeError):
+        # Python 2
+        # This is only imported here since it's slow to import.
+        import multiprocessing
+        return multiprocessing.cpu_count()
+
+
 def find_executable(basenames, search_dirs=None):
     """Find the specified executable.
 
@@ -53,10 +67,9 @@ try:
     startfile = os.startfile
 
 except (AttributeError):
-    import subprocess
-
-    # Find an appropriate opener for startfile()
-    _startfile_opener = find_executable(["open", "xdg-open"])
+    # Program used by startfile(), found the first time it's called
+    # Searching $PATH takes a while, so it isn't done at import time.
+    _startfile_opener = None
 
     def _startfile(path, operation=None):
         """Alternate implementation of os.startfile() for Unix-like systems.
@@ -65,6 +78,13 @@ except (AttributeError):
         with the Windows implementation in Python's os module.
         """
 
+        import subprocess
+
+        global _startfile_opener
+        if _startfile_opener is None:
+            # Find an appropriate opener, or remember there isn't one
+            _startfile_opener = find_executable(["open", "xdg-open"]) or ""
+
         if _startfile_opener:
             try:
                 subprocess.call([_startfile_opener, path])
@@ -0,0 +1,714 @@
+"""Document viewer widget."""
+
+from bisect import bisect_right
+
+try:
+    # Python 3
+    import tkinter as tk
+except (ImportError):
+    # Python 2
+    import Tkinter as tk
+
+from tkdocviewer import DocViewer
+
+from .cache import CompressedPage, PageCache, image_size
+from .render import PREVIEW_SCALE, RenderJob, can_render
+
+
+__all__ = ["Viewer"]
+
+
+class Viewer(DocViewer):
+    """Document viewer widget.
+
+    This extends tkDocViewer's widget so documents rendered by a
+    backend go through a RenderJob. A job can be created and rendered
+    before the document is displayed, then handed to display_job() to
+    put its pages on the canvas without waiting for Ghostscript.
+
+    The usual <<DocumentStarted>>, <<PageCount>>, <<PageFinished>>,
+    <<DocumentFinished>>, and <<RenderingError>> events are generated
+    the same way for prerendered and freshly rendered documents.
+
+    Rendered pages are kept in a PageCache, so redisplaying a document
+    with the same options does not render it again. First pages can also
+    be kept in a DiskCache by setting the disk_cache property, and PDF
+    files can be rendered by a GhostscriptPool by setting the gs_pool
+    property.
+
+    When lazy rendering is enabled, only the first page and the pages
+    in or near the visible part of the canvas are rendered. The rest
+    are shown as placeholders, and rendered as they are scrolled into
+    view. Rendering is considered finished once the visible pages are
+    displayed, so the document events only cover those pages.
+
+    While the first page of a PDF is rendering, a quick low-resolution
+    version of it is displayed in its place if one can be rendered
+    within preview_budget seconds.
+
+    Memory used by the pages of the displayed document is limited by
+    the page_memory_limit property. Once it's exceeded, the pages
+    farthest from view are compressed and replaced on the canvas by
+    placeholders, then restored when they're scrolled back into view.
+    This keeps memory use flat regardless of the document's length.
+    """
+
+    # Time allowed for rendering a preview of the first page, in seconds
+    # Set this to 0 to disable previews.
+    preview_budget = 0.5
+
+    def __init__(self, master=None, **kw):
+        """Return a new Viewer widget."""
+
+        # The job whose pages are currently being displayed
+        self._job = None
+        self._job_started = False
+        self._job_page_count = None
+
+        # The job whose pages are on the canvas, kept after it finishes
+        self._displayed_job = None
+
+        # The lazy job whose pages are on the canvas, if any
+        # This is kept after the job finishes rendering so more of its
+        # pages can be requested as the user scrolls.
+        self._lazy_job = None
+
+        # Top and height of the space for each page of a lazy job
+        self._slot_tops = []
+        self._slot_heights = []
+
+        # Pages of the lazy job that are on the canvas
+        self._shown_pages = set()
+
+        # Whether we're watching the lazy job for requested pages
+        self._lazy_polling = False
+
+        # Whether _update_viewport() is scheduled to run
+        self._viewport_pending = False
+
+        # The preview of the first page, while it's displayed
+        self._preview_image = None
+
+        # Maximum memory for the pages of the displayed job, in bytes
+        self._page_memory_limit = 128 * 1024 * 1024
+
+        # Canvas item, top, and height of each page of the displayed job
+        self._page_items = {}
+        self._page_tops = {}
+        self._page_heights = {}
+
+        # Images of the pages on the canvas, and the memory used by each
+        # page, including its image data in the job
+        self._page_images = {}
+        self._page_sizes = {}
+
+        # Total memory used by the pages of the displayed job
+        self._page_memory = 0
+
+        # Whether to render only the visible pages of a document
+        self._lazy_rendering = tk.BooleanVar()
+        if "lazy_rendering" in kw:
+            self._lazy_rendering.set(kw["lazy_rendering"])
+            del kw["lazy_rendering"]
+        else:
+            self._lazy_rendering.set(0)
+
+        # Rendered pages, shared with any jobs created for this widget
+        self._cache = PageCache()
+        self._disk_cache = None
+
+        # Ghostscript processes shared with any jobs
+        self._gs_pool = None
+
+        # Number of pages of a long document to render at once
+        self._render_workers = 1
+
+        DocViewer.__init__(self, master, **kw)
+
+        # Watch the view so we know which pages of a lazy job to render
+        self._canvas.configure(yscrollcommand=self._handle_yscroll)
+
+    # ------------------------------------------------------------------------
+
+    def cancel_rendering(self, event=None):
+        """Cancel the current rendering process."""
+
+        if self._job:
+            self._job.cancel()
+
+        if self._lazy_job:
+            self._lazy_job.cancel()
+
+        DocViewer.cancel_rendering(self, event)
+
+    def create_job(self, path):
+        """Return a RenderJob to render a file for this widget.
+
+        The job uses this widget's caches and current rendering options.
+        It is not started automatically.
+        """
+
+        return RenderJob(path, self._cache, self._disk_cache, self._gs_pool,
+                         workers=self._render_workers,
+                         **self.render_options())
+
+    def display_file(self, path, pages=None):
+        """Display the specified file."""
+
+        if pages is None and can_render(path):
+            self.display_job(self.create_job(path))
+
+        else:
+            DocViewer.display_file(self, path, pages)
+
+    def display_job(self, job):
+        """Display the pages rendered by the specified job.
+
+        The job does not have to be finished, or even started. Pages
+        are added to the canvas as they become available.
+        """
+
+        # Blank the canvas
+        self.erase()
+
+        # Make sure the job is actually rendering
+        if not job.started:
+            job.start()
+
+        if self.preview_budget:
+            # Show something while the first page renders
+            job.start_preview(self.preview_budget)
+
+        self._job = self._displayed_job = job
+        self._job_started = False
+        self._job_page_count = None
+        self._rendering.set(1)
+
+        if job.lazy:
+            self._lazy_job = job
+
+        # Save the file path
+        self._display_path = job.path
+        self._display_pages = None
+
+        self.scroll_to_top()
+
+        # Start this in a loop to display each page on the canvas
+        self._process_job()
+
+    def erase(self):
+        """Erase all displayed content."""
+
+        if self._lazy_job:
+            self._lazy_job.cancel()
+            self._lazy_job = None
+
+        self._displayed_job = None
+
+        del self._slot_tops[:]
+        del self._slot_heights[:]
+        self._shown_pages.clear()
+        self._preview_image = None
+
+        self._page_items.clear()
+        self._page_tops.clear()
+        self._page_heights.clear()
+        self._page_images.clear()
+        self._page_sizes.clear()
+        self._page_memory = 0
+
+        DocViewer.erase(self)
+
+    def render_options(self):
+        """Return the current rendering options as a dict.
+
+        These are the keyword arguments for a RenderJob whose pages
+        can be displayed in this widget.
+        """
+
+        return {"enable_downscaling": bool(self.enable_downscaling.get()),
+                "fit_size": (int(self["width"]), int(self["height"])),
+                "lazy": bool(self._lazy_rendering.get())}
+
+    # ------------------------------------------------------------------------
+
+    def _add_job_page(self, page, image_data):
+        """Add a page of the displayed job to the canvas."""
+
+        top = self._y_offset
+        self._add_page_to_canvas(image_data)
+
+        image = self._rendered_pages[-1]
+        self._page_items[page] = self._canvas.find_all()[-1]
+        self._page_tops[page] = top
+        self._page_heights[page] = image.height()
+        self._page_images[page] = image
+
+        self._set_page_size(page, image, image_data)
+
+    def _add_page_to_canvas(self, image_data):
+        """Add a rendered page to the canvas."""
+
+        if isinstance(image_data, CompressedPage):
+            image_data = image_data.decompress()
+
+        DocViewer._add_page_to_canvas(self, image_data)
+
+    def _create_slots(self, width, height):
+        """Reserve space on the canvas for the pages of a lazy job.
+
+        Until a page is rendered, we assume it's the same size as the
+        first page, which is true of most documents.
+        """
+
+        c = self._canvas
+        page_count = self._lazy_job.page_count
+
+        self._slot_tops = [0]
+        self._slot_heights = [height]
+
+        for page in range(2, page_count + 1):
+            top = self._y_offset
+            self._slot_tops.append(top)
+            self._slot_heights.append(height)
+
+            tag = "slot{0}".format(page)
+            c.create_rectangle(0, top, width - 1, top + height - 1,
+                               outline="gray70", tags=("placeholder", tag))
+            c.create_text(width // 2, top + height // 2,
+                          text="Page {0}".format(page), fill="gray50",
+                          tags=("placeholder", tag))
+
+            self._y_offset += height + 4
+
+        # Update the canvas's scroll region
+        c.configure(scrollregion=c.bbox("all"))
+
+
+    def _evict_page(self, page):
+        """Take a page's image off the canvas to save memory.
+
+        Its image data is compressed so it can be restored later, and a
+        placeholder is left in its place.
+        """
+
+        job = self._displayed_job
+        c = self._canvas
+
+        item = self._page_items[page]
+        image = self._page_images.pop(page)
+        top = self._page_tops[page]
+        x = c.coords(item)[0]
+
+        # Move the placeholder along with the page's slot, if it has one
+        tags = [tag for tag in c.gettags(item) if tag.startswith("slot")]
+        tags += ["evicted", "evicted{0}".format(page)]
+
+        c.create_rectangle(x, top, x + image.width() - 1,
+                           top + image.height() - 1,
+                           outline="gray70", tags=tuple(tags))
+        c.itemconfigure(item, image="")
+
+        # Let Tk free the image
+        self._rendered_pages.remove(image)
+        del image
+
+        image_data = job.pages[page]
+        if not isinstance(image_data, CompressedPage):
+            image_data = job.pages[page] = CompressedPage(image_data)
+
+        self._set_page_size(page, None, image_data)
+
+    def _finish_job(self, event_name):
+        """Stop displaying the current job."""
+
+        self._job = None
+        self._rendering.set(0)
+        self.event_generate(event_name)
+
+    def _handle_yscroll(self, first, last):
+        """Handle the canvas's view changing."""
+
+        self._y_scrollbar.set(first, last)
+
+        if ((self._lazy_job or self._page_items)
+                and not self._viewport_pending):
+            # Wait until things settle down to see what's visible
+            self._viewport_pending = True
+            self.after_idle(self._update_viewport)
+
+    def _limit_page_memory(self):
+        """Evict pages far from view until memory use is within the limit.
+
+        Pages within a screen's height of the visible part of the canvas
+        are kept regardless, so scrolling never shows a placeholder.
+        """
+
+        if self._page_memory <= self._page_memory_limit:
+            return
+
+        c = self._canvas
+        margin = c.winfo_height()
+        top = c.canvasy(0) - margin
+        bottom = c.canvasy(c.winfo_height()) + margin
+
+        # Farthest from view first
+        distances = dict((page, self._page_distance(page, top, bottom))
+                         for page in self._page_images)
+        pages = sorted(self._page_images, key=distances.get, reverse=True)
+
+        for page in pages:
+            if (self._page_memory <= self._page_memory_limit
+                    or not distances[page]):
+                break
+            self._evict_page(page)
+
+    def _page_distance(self, page, top, bottom):
+        """Return how far a page is from the part of the canvas between
+        top and bottom, or 0 if it overlaps that part."""
+
+        page_top = self._page_tops[page]
+        page_bottom = page_top + self._page_heights[page]
+
+        return max(0, page_top - bottom, top - page_bottom)
+
+    def _place_page(self, page, image_data):
+        """Put a rendered page of a lazy job in its space on the canvas."""
+
+        c = self._canvas
+
+        if page == 1:
+            self._add_job_page(page, image_data)
+            c.addtag_withtag("slot1", c.find_all()[-1])
+
+            x0, y0, x1, y1 = c.bbox("slot1")
+            self._create_slots(x1 - x0, y1 - y0)
+
+        else:
+            tag = "slot{0}".format(page)
+            top = self._slot_tops[page - 1]
+
+            # Replace the placeholder
+            c.delete(tag)
+            end = self._y_offset
+            self._y_offset = top
+            self._add_job_page(page, image_data)
+            c.addtag_withtag(tag, c.find_all()[-1])
+
+            # Make room if this page isn't the size we expected
+            height = self._y_offset - top - 4
+            delta = height - self._slot_heights[page - 1]
+            self._slot_heights[page - 1] = height
+
+            if delta:
+                for n in range(page + 1, len(self._slot_tops) + 1):
+                    c.move("slot{0}".format(n), 0, delta)
+                    self._slot_tops[n - 1] += delta
+                    if n in self._page_tops:
+                        self._page_tops[n] += delta
+
+            self._y_offset = end + delta
+            c.configure(scrollregion=c.bbox("all"))
+
+        self._shown_pages.add(page)
+
+    def _process_job(self):
+        """Display pages from the current job."""
+
+        job = self._job
+
+        # Sanity check: Make sure we currently have a job!
+        if not job:
+            return
+
+        timeout = 50    # msec
+
+        # Check this first so we don't miss a page added just before
+        # the job finished
+        finished = job.finished.is_set()
+
+        if not self._job_started:
+            # Indicate rendering has started on the document
+            self._job_started = True
+            self.event_generate("<<DocumentStarted>>")
+
+        if job.page_count != self._job_page_count:
+            # Update the number of pages in the document
+            self._page_count = self._job_page_count = job.page_count
+            self.event_generate("<<PageCount>>")
+
+        if (job.preview is not None
+                and self._preview_image is None
+                and not self._rendered_page_count
+                and 1 not in job.pages):
+            self._show_preview(job)
+
+        # Display every page that has been rendered so far; this is how
+        # a prerendered document appears all at once
+        self._show_pages(job, "<<PageFinished>>")
+
+        if job.canceled:
+            # Don't wait on the rendering thread to notice
+            self._finish_job("<<DocumentFinished>>")
+
+        elif finished:
+            if job.error:
+                # Stop rendering before display_text() erases the canvas
+                self._job = None
+                self._rendering.set(0)
+
+                # Display the error message on the canvas
+                self.display_text(job.error)
+
+                # Set the rendered page count to zero since no content
+                # has actually been rendered
+                self._rendered_page_count = 0
+
+                self.event_generate("<<RenderingError>>")
+
+            else:
+                self._finish_job("<<DocumentFinished>>")
+
+        else:
+            # Keep the user interface updated
+            self.master.update_idletasks()
+
+            # Keep the loop going until the job is done
+            self.master.after(timeout, self._process_job)
+
+    def _process_lazy_job(self):
+        """Display pages requested from the lazy job after scrolling."""
+
+        job = self._lazy_job
+
+        if not job or self._job:
+            # Either the lazy job is gone, or _process_job() is already
+            # displaying its pages
+            self._lazy_polling = False
+            return
+
+        timeout = 50    # msec
+
+        finished = job.finished.is_set()
+        self._show_pages(job)
+
+        if finished or job.canceled:
+            self._lazy_polling = False
+        else:
+            self.master.after(timeout, self._process_lazy_job)
+
+    def _restore_page(self, page):
+        """Put an evicted page's image back on the canvas."""
+
+        job = self._displayed_job
+        c = self._canvas
+
+        image_data = job.pages[page]
+        image = tk.PhotoImage(data=image_data.decompress())
+
+        c.itemconfigure(self._page_items[page], image=image)
+        c.delete("evicted{0}".format(page))
+
+        self._rendered_pages.append(image)
+        self._page_images[page] = image
+
+        self._set_page_size(page, image, image_data)
+
+    def _restore_visible_pages(self):
+        """Restore evicted pages that are in or near view."""
+
+        if len(self._page_images) == len(self._page_items):
+            # Nothing has been evicted
+            return
+
+        c = self._canvas
+        margin = c.winfo_height()
+        top = c.canvasy(0) - margin
+        bottom = c.canvasy(c.winfo_height()) + margin
+
+        for page in self._page_items:
+            if (page not in self._page_images
+                    and not self._page_distance(page, top, bottom)):
+                self._restore_page(page)
+
+        self._limit_page_memory()
+
+    def _set_page_size(self, page, image, image_data):
+        """Update the memory used by a page."""
+
+        size = image_size(image_data)
+        if image is not None:
+            # Tk keeps four bytes per pixel
+            size += 4 * image.width() * image.height()
+
+        self._page_memory += size - self._page_sizes.get(page, 0)
+        self._page_sizes[page] = size
+
+    def _show_preview(self, job):
+        """Display the preview of the job's first page."""
+
+        c = self._canvas
+
+        # Zoom the preview to the size of the real page
+        image = tk.PhotoImage(data=job.preview)
+        self._preview_image = image.zoom(PREVIEW_SCALE)
+
+        c.create_image(0, 0, anchor="nw",
+                       image=self._preview_image, tags="preview")
+        c.configure(scrollregion=c.bbox("all"))
+
+    def _show_pages(self, job, event_name=None):
+        """Display any newly rendered pages from the specified job.
+
+        If event_name is specified, that event is generated for each page.
+        """
+
+        if self._preview_image and 1 in job.pages:
+            # The real first page replaces the preview
+            self._canvas.delete("preview")
+            self._preview_image = None
+
+        if job.lazy:
+            # Pages can arrive in any order, but the first one is always
+            # rendered first
+            for page in sorted(job.pages):
+                if page not in self._shown_pages:
+                    self._place_page(page, job.pages[page])
+                    self._limit_page_memory()
+                    if event_name:
+                        self.event_generate(event_name)
+
+        else:
+            while self._rendered_page_count + 1 in job.pages:
+                page = self._rendered_page_count + 1
+                self._add_job_page(page, job.pages[page])
+                self._limit_page_memory()
+                if event_name:
+                    self.event_generate(event_name)
+
+    def _update_viewport(self):
+        """Request the pages of the lazy job that are in or near view."""
+
+        self._viewport_pending = False
+
+        self._restore_visible_pages()
+
+        job = self._lazy_job
+        if not job or not self._slot_tops:
+            return
+
+        c = self._canvas
+        page_count = len(self._slot_tops)
+
+        # Pages visible on the canvas, from the top down
+        first = max(1, bisect_right(self._slot_tops, c.canvasy(0)))
+        last = max(first, bisect_right(self._slot_tops,
+                                       c.canvasy(c.winfo_height())))
+        pages = list(range(first, last + 1))
+
+        # Followed by the pages just out of view
+        pages += [page for page in (last + 1, first - 1)
+                  if 1 <= page <= page_count]
+
+        wanted = [page for page in pages if page not in job.pages]
+        if wanted:
+            job.request(wanted)
+
+            if not self._job and not self._lazy_polling:
+                # Start this in a loop to display the pages as they arrive
+                self._lazy_polling = True
+                self._process_lazy_job()
+
+    # ------------------------------------------------------------------------
+
+    @property
+    def cache(self):
+        """The cache of rendered pages used by this widget."""
+
+        return self._cache
+
+    @property
+    def displayed_job(self):
+        """The job whose pages are displayed, or None.
+
+        Unlike the job being rendered, this is kept after the job is
+        finished, until the canvas is erased.
+        """
+
+        return self._displayed_job
+
+    @property
+    def disk_cache(self):
+        """The persistent cache of first pages used by this widget.
+
+        This is None by default, which disables the persistent cache.
+        """
+
+        return self._disk_cache
+
+    @disk_cache.setter
+    def disk_cache(self, value):
+        self._disk_cache = value
+
+    @property
+    def gs_pool(self):
+        """The pool of Ghostscript processes used by this widget.
+
+        This is None by default, which starts Ghostscript as needed for
+        each page.
+        """
+
+        return self._gs_pool
+
+    @gs_pool.setter
+    def gs_pool(self, value):
+        self._gs_pool = value
+
+    @property
+    def page_memory(self):
+        """The memory used by the pages of the displayed document, in bytes.
+
+        This includes the images on the canvas and the image data they
+        were created from, including that of evicted pages.
+        """
+
+        return self._page_memory
+
+    @property
+    def page_memory_limit(self):
+        """The memory allowed for the pages of the displayed document.
+
+        This is in bytes. Pages that are in or near view are kept on
+        the canvas even if they exceed it.
+        """
+
+        return self._page_memory_limit
+
+    @page_memory_limit.setter
+    def page_memory_limit(self, value):
+        self._page_memory_limit = max(0, value)
+        self._limit_page_memory()
+
+    @property
+    def render_workers(self):
+        """The number of pages of a long document to render at once.
+
+        Each page is rendered by its own Ghostscript process. Short
+        documents are always rendered one page at a time.
+        """
+
+        return self._render_workers
+
+    @render_workers.setter
+    def render_workers(self, value):
+        self._render_workers = max(1, value)
+
+    @property
+    def lazy_rendering(self):
+        """Whether to render only the pages in or near view.
+
+        This is a BooleanVar that your user interface can toggle at
+        runtime via a Checkbutton widget.
+        """
+
+        return self._lazy_rendering
@@ -0,0 +1,323 @@
+"""Support for watching folders for changes made outside the program."""
+
+import errno
+import os
+import select
+import struct
+import sys
+import threading
+import time
+
+try:
+    # Python 3
+    import queue
+except (ImportError):
+    # Python 2
+    import Queue as queue
+
+
+__all__ = ["DirectoryWatcher"]
+
+
+# inotify constants from <sys/inotify.h>
+_IN_CLOSE_WRITE = 0x00000008
+_IN_MOVED_FROM = 0x00000040
+_IN_MOVED_TO = 0x00000080
+_IN_DELETE = 0x00000200
+_IN_DELETE_SELF = 0x00000400
+_IN_MOVE_SELF = 0x00000800
+_IN_Q_OVERFLOW = 0x00004000
+_IN_IGNORED = 0x00008000
+_IN_ISDIR = 0x40000000
+_IN_NONBLOCK = os.O_NONBLOCK
+_IN_CLOEXEC = 0o2000000
+
+_WATCH_MASK = (_IN_CLOSE_WRITE | _IN_MOVED_FROM | _IN_MOVED_TO
+               | _IN_DELETE | _IN_DELETE_SELF | _IN_MOVE_SELF)
+
+# Header of each inotify event: wd, mask, cookie, and name length
+_EVENT_HEADER = struct.Struct("iIII")
+
+
+def _load_inotify():
+    """Return the C library if it supports inotify, or None."""
+
+    if not sys.platform.startswith("linux"):
+        return None
+
+    # This is only imported here since it's slow to import
+    import ctypes
+    import ctypes.util
+
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6",
+                           use_errno=True)
+        libc.inotify_init1
+        libc.inotify_add_watch
+        return libc
+
+    except (OSError, AttributeError):
+        return None
+
+
+def _file_info(path):
+    """Return (inode, size, mtime) for a file, or None if it's gone."""
+
+    try:
+        st = os.stat(path)
+    except (OSError):
+        return None
+
+    return st.st_ino, st.st_size, st.st_mtime
+
+
+def _snapshot(path):
+    """Return {name: (inode, size, mtime)} for the files in a directory."""
+
+    files = {}
+
+    if hasattr(os, "scandir"):
+        for entry in os.scandir(path):
+            try:
+                if entry.is_file():
+                    st = entry.stat()
+                    files[entry.name] = entry.inode(), st.st_size, st.st_mtime
+            except (OSError):
+                # The item was deleted while we were looking at it
+                pass
+
+    else:
+        # Python 2 has no scandir(), so we have to stat each item
+        for name in os.listdir(path):
+            try:
+                st = os.stat(os.path.join(path, name))
+            except (OSError):
+                continue
+            if os.path.isfile(os.path.join(path, name)):
+                files[name] = st.st_ino, st.st_size, st.st_mtime
+
+    return files
+
+
+class DirectoryWatcher(object):
+    """Watch directories for changes using a background thread.
+
+    On Linux, this uses inotify to find out about changes as soon as
+    they happen. Elsewhere, or if inotify is unavailable, it compares a
+    listing of each directory against the last one, every few seconds.
+
+    Changes are put on the queue as tuples:
+
+     ("added", path)        A new file was written or moved in.
+     ("changed", path)      A file was rewritten.
+     ("removed", path)      A file was deleted or moved away.
+     ("moved", src, dst)    A file was renamed within the directories.
+
+    Subdirectories are ignored. The user interface thread should poll
+    the queue rather than waiting on it.
+    """
+
+    # Minimum time between directory listings when polling, in seconds
+    # The actual interval grows with the time each listing takes, so
+    # polling a huge folder doesn't keep the disk busy.
+    poll_interval = 2.0
+
+    def __init__(self, paths):
+        """Return a new DirectoryWatcher."""
+
+        self.paths = [os.path.abspath(path) for path in paths]
+
+        # Used to pass changes back to the user interface thread
+        self.queue = queue.Queue()
+
+        # Set to stop watching
+        self.canceler = threading.Event()
+
+        # Whether changes are found using inotify rather than polling
+        self.using_inotify = False
+
+    # ------------------------------------------------------------------------
+
+    def cancel(self):
+        """Stop watching."""
+
+        self.canceler.set()
+
+    def start(self):
+        """Start watching in a new background thread."""
+
+        thread = threading.Thread(target=self._run)
+        thread.daemon = True
+        thread.start()
+
+        return self
+
+    # ------------------------------------------------------------------------
+
+    def _compare(self, path, old, new):
+        """Put the differences between two snapshots on the queue."""
+
+        removed = dict((old[name][0], name) for name in old
+                       if name not in new)
+
+        for name, info in new.items():
+            if name not in old:
+                # A file with a removed file's inode was renamed
+                src_name = removed.pop(info[0], None)
+                if src_name is None:
+                    self.queue.put(("added", os.path.join(path, name)))
+                else:
+                    self.queue.put(("moved",
+                                    os.path.join(path, src_name),
+                                    os.path.join(path, name)))
+                    if old[src_name] != info:
+                        # It was also rewritten since the last listing
+                        self.queue.put(("changed", os.path.join(path, name)))
+
+            elif old[name] != info:
+                self.queue.put(("changed", os.path.join(path, name)))
+
+        for name in removed.values():
+            self.queue.put(("removed", os.path.join(path, name)))
+
+    def _poll(self):
+        """Watch for changes by comparing directory listings."""
+
+        snapshots = {}
+        for path in self.paths:
+            snapshots[path] = _snapshot(path)
+
+        while not self.canceler.is_set():
+            started = time.time()
+
+            for path in self.paths:
+                try:
+                    snapshot = _snapshot(path)
+                except (OSError):
+                    # The directory is gone
+                    snapshot = {}
+
+                self._compare(path, snapshots[path], snapshot)
+                snapshots[path] = snapshot
+
+            interval = max(self.poll_interval, 10 * (time.time() - started))
+            self.canceler.wait(interval)
+
+    def _run(self):
+        """Watch the directories."""
+
+        try:
+            libc = _load_inotify()
+            if libc:
+                fd = libc.inotify_init1(_IN_NONBLOCK | _IN_CLOEXEC)
+                if fd >= 0:
+                    try:
+                        if self._watch(libc, fd):
+                            return
+                    finally:
+                        os.close(fd)
+
+            self._poll()
+
+        except (Exception) as err:
+            # Forward the error to the user interface thread
+            self.queue.put(err)
+
+    def _watch(self, libc, fd):
+        """Watch for changes using inotify.
+
+        Returns False without watching anything if inotify can't watch
+        every directory, such as when the system limit on watches has
+        been reached.
+        """
+
+        encoding = sys.getfilesystemencoding()
+
+        watches = {}
+        for path in self.paths:
+            wd = libc.inotify_add_watch(fd, path.encode(encoding), _WATCH_MASK)
+            if wd < 0:
+                return False
+            watches[wd] = path
+
+        self.using_inotify = True
+
+        # Files in each directory, used to rescan if events are lost
+        snapshots = dict((path, _snapshot(path)) for path in self.paths)
+
+        while watches and not self.canceler.is_set():
+            ready, _, _ = select.select([fd], [], [], 0.5)
+            if not ready:
+                continue
+
+            try:
+                data = os.read(fd, 64 * 1024)
+            except (OSError) as err:
+                if err.errno == errno.EAGAIN:
+                    continue
+                raise
+
+            # Renames are reported as a pair of events sharing a cookie
+            moved_from = {}
+
+            offset = 0
+            while offset < len(data):
+                wd, mask, cookie, length = _EVENT_HEADER.unpack_from(data,
+                                                                     offset)
+                offset += _EVENT_HEADER.size
+                name = data[offset:offset + length].split(b"\0", 1)[0]
+                offset += length
+
+                if mask & _IN_Q_OVERFLOW:
+                    # Events were lost, so compare against what we had
+                    for path in self.paths:
+                        snapshot = _snapshot(path)
+                        self._compare(path, snapshots[path], snapshot)
+                        snapshots[path] = snapshot
+                    continue
+
+                path = watches.get(wd)
+                if path is None or mask & _IN_ISDIR:
+                    continue
+
+                if mask & (_IN_DELETE_SELF | _IN_MOVE_SELF | _IN_IGNORED):
+                    # The directory itself is gone
+                    del watches[wd]
+                    continue
+
+                name = name.decode(encoding, "replace")
+                file_path = os.path.join(path, name)
+                snapshot = snapshots[path]
+
+                if mask & _IN_MOVED_FROM:
+                    moved_from[cookie] = file_path
+                    snapshot.pop(name, None)
+
+                elif mask & _IN_MOVED_TO:
+                    src_path = moved_from.pop(cookie, None)
+                    if src_path:
+                        self.queue.put(("moved", src_path, file_path))
+                    else:
+                        self.queue.put(("added", file_path))
+                    snapshot[name] = _file_info(file_path)
+
+                elif mask & _IN_DELETE:
+                    self.queue.put(("removed", file_path))
+                    snapshot.pop(name, None)
+
+                elif mask & _IN_CLOSE_WRITE:
+                    if name in snapshot:
+                        self.queue.put(("changed", file_path))
+                    else:
+                        self.queue.put(("added", file_path))
+                    snapshot[name] = _file_info(file_path)
+
+                if snapshot.get(name, True) is None:
+                    # The file was already gone again
+                    del snapshot[name]
+
+            # Anything moved away without a matching move here is gone
+            for src_path in moved_from.values():
+                self.queue.put(("removed", src_path))
+
+        return True